@@ -0,0 +1,289 @@
+"""Module for FlashCards App that checks answers typed by the user.
+
+A typed answer is compared with the answer of a card after both are
+normalised: case is folded, punctuation removed and whitespace collapsed. The
+normalised answer of each card is cached, so checking an answer only has to
+normalise what was typed.
+
+An answer is accepted if it is, in order of preference:
+    exact: the same as the card's answer.
+    fuzzy: within a few character edits of the card's answer. The number of
+        edits allowed grows with the length of the answer, up to MAX_EDITS,
+        and the edit distance stops being worked out as soon as it is over.
+    tokens: made up only of words from the card's answer, for answers where
+        one word of a sentence is enough. At least one of the words must be
+        distinctive, not a stop word or a word in most of the answers of the
+        card's topic.
+Words holding a digit, such as port numbers, are never fuzzy matched. Both
+fuzzy and token matches need the same numbers as the card's answer, and the
+edits allowed only count the other words, so "TCP Port 23" is wrong for
+"TCP Port 22".
+
+Classes:
+    Normalised
+    AnswerResult
+    AnswerChecker
+
+Functions:
+    tokenise
+    normalise
+    match_length
+    edit_distance
+"""
+
+import re
+import unicodedata
+
+from collections import namedtuple
+
+MATCH_EXACT = "exact"
+MATCH_FUZZY = "fuzzy"
+MATCH_TOKENS = "tokens"
+# The most character edits allowed for a fuzzy match
+MAX_EDITS = 5
+# Characters of the answer needed for each edit allowed
+CHARS_PER_EDIT = 4
+# Characters compared at once while following matching runs
+MATCH_CHUNK = 32
+# Words that can't make a token match on their own
+STOP_WORDS = frozenset(("a", "an", "and", "of", "or", "the", "to"))
+# Words in more than this share of a topic's answers are not distinctive
+COMMON_SHARE = 0.5
+# Answers of a topic counted to find its common words, spread over the topic
+COMMON_SAMPLE = 256
+# Topics with fewer answers than this have no common words
+COMMON_MIN_ANSWERS = 3
+# Suggested spaced repetition grade for each kind of match
+MATCH_GRADES = {MATCH_EXACT: 5, MATCH_FUZZY: 4, MATCH_TOKENS: 3, None: 1}
+
+TOKEN_PATTERN = re.compile(r"\w+")
+DIGIT_PATTERN = re.compile(r"\d")
+
+# An answer after normalisation: as text, as a set of its words, as text of
+# only its words without digits, and as a sorted tuple of its words with digits
+Normalised = namedtuple("Normalised", ["text", "tokens", "words", "numbers"])
+# The result of checking an answer. match is one of the MATCH constants or None
+# if the answer is wrong, and grade is the suggested spaced repetition grade.
+AnswerResult = namedtuple("AnswerResult", ["correct", "match", "distance", "grade"])
+
+
+def tokenise(text):
+    """Split text into case folded words with punctuation removed.
+
+    Args:
+        text: The string to split.
+
+    Returns:
+        A list of the words in text, in order.
+    """
+
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def normalise(answer):
+    """Normalise an answer so it can be compared with another.
+
+    Args:
+        answer: The answer string.
+
+    Returns:
+        A Normalised answer.
+    """
+
+    tokens = tokenise(answer)
+    words = []
+    numbers = []
+    for token in tokens:
+        (numbers if DIGIT_PATTERN.search(token) else words).append(token)
+
+    return Normalised(
+        " ".join(tokens), frozenset(tokens), " ".join(words), tuple(sorted(numbers))
+    )
+
+
+def match_length(first, second, i, j):
+    """Get the number of characters that match from first[i] and second[j] on.
+
+    Long matching runs are compared a chunk at a time.
+    """
+
+    length = 0
+    chunk = MATCH_CHUNK
+    while (
+        i + length + chunk <= len(first)
+        and j + length + chunk <= len(second)
+        and first[i + length : i + length + chunk]
+        == second[j + length : j + length + chunk]
+    ):
+        length += chunk
+    while (
+        i + length < len(first)
+        and j + length < len(second)
+        and first[i + length] == second[j + length]
+    ):
+        length += 1
+
+    return length
+
+
+def edit_distance(first, second, limit):
+    """Get the Levenshtein distance between two strings if it is within limit.
+
+    Uses the Landau-Vishkin algorithm. For each number of edits up to limit,
+    every diagonal of the distance table that can be reached with that many
+    edits is followed for as long as the strings match. The work depends on
+    limit squared rather than the length of the strings, and stops as soon as
+    limit edits are not enough.
+
+    Args:
+        first: The first string.
+        second: The second string.
+        limit: The largest distance of interest.
+
+    Returns:
+        The distance, or None if it is greater than limit.
+    """
+
+    if abs(len(first) - len(second)) > limit:
+        return None
+
+    target = len(second) - len(first)
+    # Maps each diagonal, second index - first index, to the furthest index
+    # into first reached on it with the previous number of edits
+    previous = {}
+    for edits in range(limit + 1):
+        current = {}
+        for diagonal in range(-edits, edits + 1):
+            if edits == 0:
+                i = 0
+            else:
+                i = max(
+                    # Substitute a character
+                    previous.get(diagonal, -2) + 1,
+                    # Insert a character into first
+                    previous.get(diagonal - 1, -2),
+                    # Delete a character from first
+                    previous.get(diagonal + 1, -2) + 1,
+                )
+                i = min(i, len(first), len(second) - diagonal)
+            if i < 0 or i + diagonal < 0:
+                continue
+
+            i += match_length(first, second, i, i + diagonal)
+            current[diagonal] = i
+            if diagonal == target and i >= len(first):
+                return edits
+        previous = current
+
+    return None
+
+
+class AnswerChecker:
+    """Checks typed answers against the answers of a deck's cards.
+
+    Attributes:
+        answer_column
+    """
+
+    def __init__(self, answer_column, card_range=None):
+        """Initialise a checker with an empty cache.
+
+        Args:
+            answer_column: The answer_column of a JSONTopicHandler.
+            card_range: Returns the (start, stop) range of the cards of a
+                card's topic, such as JSONTopicHandler.card_range. Defaults to
+                treating every card as one topic.
+        """
+
+        self.answer_column = answer_column
+        self.card_range = card_range
+        # Maps each card that has been checked to its Normalised answer
+        self.cache = {}
+        # Maps the card range of each topic token matched to its common words
+        self.common = {}
+
+    def expected(self, card):
+        """Get the normalised answer of a card, normalising it the first time."""
+
+        normalised = self.cache.get(card)
+        if normalised is None:
+            normalised = self.cache[card] = normalise(self.answer_column[card])
+
+        return normalised
+
+    def common_tokens(self, card):
+        """Get the words without digits that are in most answers of a card's topic.
+
+        Worked out the first time a card of the topic is token matched, from
+        at most COMMON_SAMPLE answers spread over the topic, so it takes the
+        same time however big the topic or deck is. The answers are from the
+        topic being reviewed, which streamed and SQLite decks already hold.
+        """
+
+        if self.card_range is None:
+            start, stop = 0, len(self.answer_column)
+        else:
+            start, stop = self.card_range(card)
+
+        common = self.common.get((start, stop))
+        if common is None:
+            sample = range(start, stop, max(1, -(-(stop - start) // COMMON_SAMPLE)))
+            counts = {}
+            if len(sample) >= COMMON_MIN_ANSWERS:
+                for sampled in sample:
+                    for token in set(tokenise(self.answer_column[sampled])):
+                        counts[token] = counts.get(token, 0) + 1
+            limit = COMMON_SHARE * len(sample)
+            common = self.common[start, stop] = frozenset(
+                token
+                for token, count in counts.items()
+                if count > limit and not DIGIT_PATTERN.search(token)
+            )
+
+        return common
+
+    def check(self, card, answer):
+        """Check a typed answer against the answer of a card.
+
+        Args:
+            card: An index into answer_column.
+            answer: The answer typed by the user.
+
+        Returns:
+            An AnswerResult.
+        """
+
+        expected = self.expected(card)
+        typed = normalise(answer)
+
+        if typed.text == expected.text:
+            return AnswerResult(True, MATCH_EXACT, 0, MATCH_GRADES[MATCH_EXACT])
+
+        # Numbers must be exactly right, only the other words may have typos
+        if typed.numbers != expected.numbers:
+            return AnswerResult(False, None, None, MATCH_GRADES[None])
+
+        limit = min(MAX_EDITS, len(expected.words) // CHARS_PER_EDIT)
+        distance = edit_distance(typed.words, expected.words, limit)
+        if distance is not None:
+            return AnswerResult(True, MATCH_FUZZY, distance, MATCH_GRADES[MATCH_FUZZY])
+
+        if typed.tokens <= expected.tokens and (
+            typed.tokens - STOP_WORDS - self.common_tokens(card)
+        ):
+            return AnswerResult(True, MATCH_TOKENS, None, MATCH_GRADES[MATCH_TOKENS])
+
+        return AnswerResult(False, None, None, MATCH_GRADES[None])
+
+    def check_many(self, cards, answers):
+        """Check many typed answers at once, such as for an offline review.
+
+        Args:
+            cards: The card of each answer.
+            answers: The typed answers.
+
+        Returns:
+            A list with the AnswerResult of each answer.
+        """
+
+        return [self.check(card, answer) for card, answer in zip(cards, answers)]
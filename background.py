@@ -0,0 +1,142 @@
+"""Module for FlashCards App that runs slow work off the Tk main thread.
+
+Reading a large deck or collecting the prompts of many topics can take long
+enough to freeze the window. BackgroundTask runs that work on a worker thread
+and polls it from the Tk main thread with after(), so every callback that
+touches a widget runs on the main thread.
+
+Work running in a task reports how far it has got with report_progress, which
+is also where a cancelled task stops. report_progress does nothing when it is
+called outside of a task, so the same code can run on the main thread.
+
+Classes:
+    TaskCancelled(Exception)
+    BackgroundTask
+
+Functions:
+    report_progress
+"""
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Milliseconds between each check on a running task
+POLL_MS = 50
+
+# Two workers so a new task can start while a cancelled one finishes up
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="flashcards")
+# Holds the task being run by each worker thread
+current = threading.local()
+
+
+class TaskCancelled(Exception):
+    """A background task was cancelled before its work finished."""
+
+
+def report_progress(done, total, stage=""):
+    """Record how much of the current background task's work is done.
+
+    Args:
+        done: The amount of work completed.
+        total: The total amount of work, in the same units as done.
+        stage: A short description of the work being done.
+
+    Raises:
+        TaskCancelled: The task running on this thread has been cancelled.
+    """
+
+    task = getattr(current, "task", None)
+    if task is None:
+        return
+    if task.cancelled.is_set():
+        raise TaskCancelled()
+
+    task.progress = (done / total if total else 1.0, stage)
+
+
+class BackgroundTask:
+    """A function run on a worker thread and watched from the Tk main thread.
+
+    The callbacks are only ever called from the main thread, by polling the
+    task with the after() method of widget.
+
+    Attributes:
+        progress
+        cancelled
+        future
+    """
+
+    def __init__(
+        self, widget, work, on_done, on_error=None, on_progress=None, on_cancel=None
+    ):
+        """Start running work on a worker thread.
+
+        Args:
+            widget: The Tk widget used to schedule polling of the task.
+            work: The function to run, it is called with no arguments.
+            on_done: Called with the value returned by work.
+            on_error: Called with the exception raised by work. By default the
+                exception is raised again on the main thread.
+            on_progress: Called with the fraction of work done and the stage
+                description each time the task is polled.
+            on_cancel: Called once a cancelled task has stopped.
+        """
+
+        self.widget = widget
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+
+        self.progress = (0.0, "")
+        self.cancelled = threading.Event()
+        self.abandoned = False
+        self.future = executor.submit(self.run, work)
+        self.widget.after(POLL_MS, self.poll)
+
+    def run(self, work):
+        """Run work on the worker thread with this task as the current task."""
+
+        current.task = self
+        try:
+            return work()
+        finally:
+            current.task = None
+
+    def cancel(self):
+        """Ask the task to stop at its next progress report."""
+
+        self.cancelled.set()
+
+    def abandon(self):
+        """Cancel the task without calling any of its callbacks.
+
+        Used when whatever was waiting for the task has moved on.
+        """
+
+        self.on_done = self.on_error = self.on_progress = self.on_cancel = None
+        self.abandoned = True
+        self.cancel()
+
+    def poll(self):
+        """Check on the task and call the callback matching its state."""
+
+        if self.abandoned:
+            return
+        if not self.future.done():
+            if self.on_progress is not None and not self.cancelled.is_set():
+                self.on_progress(*self.progress)
+            self.widget.after(POLL_MS, self.poll)
+            return
+
+        error = self.future.exception()
+        if self.cancelled.is_set() or isinstance(error, TaskCancelled):
+            if self.on_cancel is not None:
+                self.on_cancel()
+        elif error is not None:
+            if self.on_error is None:
+                raise error
+            self.on_error(error)
+        else:
+            self.on_done(self.future.result())
@@ -0,0 +1,1779 @@
+"""Benchmarks for the FlashCards deck handling code.
+
+Generates synthetic topic files of increasing size and times the operations
+that the GUI performs on them, printing the results to the console so the way
+each operation scales with deck size can be seen.
+
+Run the benchmarks by executing this script:
+    python benchmark.py
+
+The hot path suite times the main operations of handle_json on seeded
+synthetic decks from 1k to 1M prompts and 10 to 100k topics. It writes its
+results to benchmark_results.json and fails if any operation has regressed
+from the results stored with --save-baseline. Run only the suite with:
+    python benchmark.py --suite
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from array import array
+from pathlib import Path
+
+from answer_check import AnswerChecker
+from answer_check import tokenise
+from deck_probe import probe_deck
+from deck_session import DeckSession
+from handle_json import DECK_BACKENDS
+from handle_json import JSONHandler
+from handle_json import JSONTopicHandler
+from handle_json import JSON_PARSERS
+from handle_json import ORDER_MODES
+from handle_json import ORDER_RANDOM
+from handle_json import ORDER_SEQUENTIAL
+from handle_json import json_parser
+from handle_json import open_deck
+from handle_json import parse_json_file
+from instrumentation import metrics
+from review_log import ReviewLog
+from review_log import NO_GRADE
+from review_log import read_generation
+from scheduler import Scheduler
+from scheduler import card_key
+from search_index import SearchIndex
+from search_index import index_cache
+from search_index import load_index
+from stream_deck import topic_bytes
+
+# Seconds allowed for importing main_app and for showing the intro screen from
+# a cold start of the interpreter
+IMPORT_BUDGET = 0.15
+FIRST_FRAME_BUDGET = 1.0
+# Seconds of one 60Hz frame, the longest a key press should take to handle
+FRAME_SECONDS = 1 / 60
+# Seconds allowed for loading the review schedule of a million cards, done the
+# first time a spaced repetition session is started
+REVIEW_LOAD_BUDGET = 1.0
+
+# Deck sizes of the hot path suite, every pairing with a prompt for each topic
+SUITE_PROMPTS = (1_000, 10_000, 100_000, 1_000_000)
+SUITE_TOPICS = (10, 1_000, 100_000)
+# Words making up the prompts and answers of suite decks
+SUITE_WORDS = (
+    "port protocol address network cable wireless standard virtual machine "
+    "memory storage driver printer display security encryption server client "
+    "router switch packet frame layer the of a to and is which what"
+).split()
+# Prompts read with get_value for each suite deck
+SUITE_LOOKUPS = 100_000
+# Changed whenever the suite's cases or operations change, so old baselines
+# are not compared with
+SUITE_VERSION = 1
+SUITE_OUTPUT = "benchmark_results.json"
+SUITE_BASELINE = "benchmark_baseline.json"
+# Runs of each suite operation, the fastest is compared with the baseline
+SUITE_REPEAT = 7
+# An operation regresses when it is this many times slower than the baseline
+# and slower by more than REGRESSION_FLOOR seconds or SPREAD_FACTOR times the
+# spread of its runs, whichever is larger
+REGRESSION_TOLERANCE = 1.5
+REGRESSION_FLOOR = 0.01
+SPREAD_FACTOR = 3
+
+# Run in a new interpreter to show the intro screen then report it is ready
+FIRST_FRAME_SCRIPT = """
+import tkinter as tk
+import main_app
+try:
+    root = tk.Tk()
+except tk.TclError:
+    print("no display", flush=True)
+    raise SystemExit
+app = main_app.MainApp(root)
+root.update()
+print("ready", flush=True)
+root.destroy()
+"""
+
+
+def make_deck(num_topics, prompts_per_topic, seed=0):
+    """Create a synthetic deck in the FlashCards JSON format.
+
+    Args:
+        num_topics: The number of topics to create.
+        prompts_per_topic: The number of prompts to put in each topic.
+        seed: Seed for the random generator so decks can be reproduced.
+
+    Returns:
+        A list of topic dicts ready to be written to a JSON file.
+    """
+
+    rng = random.Random(seed)
+    deck = []
+    for t in range(num_topics):
+        prompts = []
+        for p in range(prompts_per_topic):
+            prompts.append(
+                {
+                    "prompt": "Topic " + str(t) + " prompt " + str(p),
+                    "answer": "Answer " + str(rng.randint(0, 1_000_000)),
+                }
+            )
+        deck.append({"topic_name": "Topic " + str(t), "prompts": prompts})
+
+    return deck
+
+
+def write_deck(deck, directory):
+    """Write a synthetic deck to a JSON file in directory and return its path."""
+
+    file_path = Path(directory, "deck.json")
+    with open(file_path, "w") as f:
+        json.dump(deck, f)
+
+    return file_path
+
+
+def timed(func, *args):
+    """Run func with args and return the number of seconds it took."""
+
+    # Console output from the handler is discarded so only the work is timed
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+
+def select_all(topic_file):
+    """Choose every topic of topic_file that is not already chosen."""
+
+    for topic in topic_file.topics:
+        if not topic_file.topic_is_selected(topic):
+            topic_file.set_topic(topic)
+
+
+def bench_topic_lookup(sizes=(1_000, 5_000, 20_000), prompts_per_topic=5):
+    """Time selecting every topic and collecting their prompts.
+
+    This is the work done by pressing "Select all" followed by "Run prompts" on
+    the topic select screen. Selecting topics one at a time is compared with
+    the bulk set_topics used by "Select all".
+    """
+
+    print("Topic lookup (select all + prompts_from_chosen_topics)")
+    for num_topics in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = write_deck(make_deck(num_topics, prompts_per_topic), tmp_dir)
+            topic_file = JSONTopicHandler(file_path)
+
+        select_time = timed(select_all, topic_file)
+        prompts_time = timed(topic_file.prompts_from_chosen_topics)
+        topic_file.clear_selection()
+        bulk_time = timed(topic_file.set_topics, topic_file.topics)
+        print(
+            "    {:>7} topics: select all {:8.4f}s (bulk {:8.4f}s), "
+            "prompts {:8.4f}s".format(num_topics, select_time, bulk_time, prompts_time)
+        )
+
+
+def bench_prompt_view(sizes=(100_000, 1_000_000), num_topics=1_000):
+    """Time and measure collecting the prompts of every topic into a session.
+
+    The prompts are collected as a view over the card range of each topic, so
+    the memory used depends on the number of topics rather than prompts.
+    """
+
+    print("Collecting prompts (prompts_from_chosen_topics)")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            topic_file = JSONTopicHandler(write_deck(deck, tmp_dir))
+
+        topic_file.set_topics(topic_file.topics)
+        seconds = timed(topic_file.prompts_from_chosen_topics)
+        memory = traced_memory(topic_file.prompts_from_chosen_topics)[1]
+        lookup_time = timed(
+            lambda: [topic_file.get_value(i, "prompt") for i in range(num_prompts)]
+        )
+        print(
+            "    {:>9} prompts: collect {:8.4f}s {:8.1f} KiB, "
+            "read every prompt {:8.4f}s".format(
+                num_prompts, seconds, memory / 1024, lookup_time
+            )
+        )
+
+
+def bench_toggle(sizes=(100_000, 1_000_000), num_topics=1_000):
+    """Compare toggling one topic during a session with collecting from scratch.
+
+    Toggling a topic keeps the shuffled prompts up to date so the cost of it
+    and of the next run depend on the size of that topic, while collecting
+    from scratch depends on the size of the whole selection.
+
+    Raises:
+        SystemExit: The prompts were collected from scratch after a toggle, or
+            a run did not shuffle them again.
+    """
+
+    print("Toggling a topic (set_topic), then running (refresh_prompts)")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            topic_file = JSONTopicHandler(write_deck(deck, tmp_dir))
+
+        topic_file.set_topics(topic_file.topics)
+        topic_file.refresh_prompts()
+
+        topic = topic_file.topics[0]
+        toggle_time = timed(lambda: [topic_file.set_topic(topic) for _ in range(10)])
+        shown = list(topic_file.prompt_order)
+        run_time = timed(topic_file.refresh_prompts)
+        if topic_file.order_mode != ORDER_RANDOM:
+            raise SystemExit("Toggling a topic did not keep the prompts up to date")
+        # The run's shuffle is finished as each prompt is shown
+        show_time = timed(list, topic_file.prompt_order)
+        order = list(topic_file.prompt_order)
+        if order == shown or sorted(order) != sorted(topic_file.all_prompts):
+            raise SystemExit("A run did not shuffle the chosen prompts again")
+        topic_file.order_mode = None
+        rebuild_time = timed(topic_file.refresh_prompts)
+        print(
+            "    {:>9} prompts: toggle {:8.4f}s, run {:8.4f}s, show every prompt "
+            "{:8.4f}s, collect from scratch {:8.4f}s".format(
+                num_prompts, toggle_time / 10, run_time, show_time, rebuild_time
+            )
+        )
+
+
+def bench_scheduler(num_records=1_000_000, num_prompts=100_000, num_topics=1_000):
+    """Time spaced repetition sessions against a schedule with millions of cards.
+
+    Half of the deck's cards have been graded before, and due dates are spread
+    so some of them are due again.
+    """
+
+    print(
+        "Spaced repetition ({} scheduled cards, {} prompts)".format(
+            num_records, num_prompts
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deck = make_deck(num_topics, num_prompts // num_topics)
+        topic_file = JSONTopicHandler(write_deck(deck, tmp_dir))
+
+    rng = random.Random(0)
+    scheduler = Scheduler()
+    # Earlier reviews are spread over the last ten days
+    start = time.time() - 10 * 24 * 60 * 60
+    grade_time = timed(
+        lambda: [
+            scheduler.grade(key, rng.randrange(6), now=rng.uniform(start, start + 1))
+            for key in range(num_records)
+        ]
+    )
+    for topic in topic_file.topics[: num_topics // 2]:
+        for card in range(*topic_file.topic_index[topic]):
+            key = card_key(topic, topic_file.prompt_column[card])
+            review_time = rng.uniform(start, time.time())
+            scheduler.grade(key, rng.randrange(6), now=review_time)
+
+    topic_file.set_topics(topic_file.topics)
+    session_time = timed(topic_file.schedule_prompts, scheduler)
+    session = topic_file.prompt_order
+
+    def review_every_prompt():
+        index = 0
+        while index < len(session):
+            session[index]
+            session.grade(index, 5)
+            index += 1
+
+    review_time = timed(review_every_prompt)
+    print(
+        "    grade {:8.4f}s per million, start session {:8.4f}s, "
+        "{} due prompts reviewed {:8.4f}s".format(
+            grade_time * 1_000_000 / num_records,
+            session_time,
+            len(session),
+            review_time,
+        )
+    )
+
+
+def bench_review_log(num_reviews=1_000_000):
+    """Time writing a review history and loading the schedule from it.
+
+    Every review is of a different card, the worst case for the size of the
+    schedule. The schedule is loaded once from a snapshot of every card with
+    an empty log, and once with the log as full as it gets before it is
+    compacted, which is the most that is replayed.
+
+    Raises:
+        SystemExit: Loading took longer than REVIEW_LOAD_BUDGET.
+    """
+
+    print("Review history ({} reviews of different cards)".format(num_reviews))
+    rng = random.Random(0)
+    keys = [rng.getrandbits(63) for _ in range(num_reviews)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        review_log = ReviewLog(tmp_dir)
+
+        def write_reviews(keys):
+            for key in keys:
+                review_log.record(key, 5, 0.0)
+            review_log.flush().result()
+
+        write_time = timed(write_reviews, keys)
+        review_log.compact().result()
+        snapshot_load_time = timed(review_log.load_scheduler)
+        write_reviews(keys[: review_log.compact_reviews - 1])
+        full_log_load_time = timed(review_log.load_scheduler)
+        review_log.close()
+
+    print(
+        "    write {:10.0f} reviews/s with compaction, load from snapshot "
+        "{:8.4f}s, with a full log {:8.4f}s".format(
+            num_reviews / write_time, snapshot_load_time, full_log_load_time
+        )
+    )
+    if max(snapshot_load_time, full_log_load_time) > REVIEW_LOAD_BUDGET:
+        raise SystemExit("Loading the review schedule is over budget")
+
+
+def check_review_snapshot(num_reviews=5_000, num_cards=500):
+    """Check the schedule loaded from a snapshot is the same as replaying.
+
+    Reviews are compacted a few times as they are recorded, and then a
+    snapshot of reviews from before the schedule was stored is read.
+
+    Raises:
+        SystemExit: A loaded schedule differs from replaying every review.
+    """
+
+    print("Review snapshot schedule")
+    rng = random.Random(0)
+    history = (
+        array("q", (rng.randrange(num_cards) for _ in range(num_reviews))),
+        array("d", (i * 3600.0 for i in range(num_reviews))),
+        array("b", (rng.choice((NO_GRADE, 0, 3, 5)) for _ in range(num_reviews))),
+    )
+    expected = Scheduler()
+    expected.replay(*history)
+
+    def schedule(scheduler):
+        return {
+            key: tuple(column[slot] for column in scheduler.columns()[1:])
+            for key, slot in scheduler.slots.items()
+        }
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        review_log = ReviewLog(tmp_dir, compact_reviews=num_reviews // 3)
+        for key, review_time, grade in zip(*history):
+            review_log.record(key, grade, review_time)
+        if schedule(review_log.load_scheduler()) != schedule(expected):
+            failures.append("compacted snapshot")
+        review_log.close()
+
+        review_log = ReviewLog(tmp_dir)
+        review_log.replace_file(review_log.snapshot_path, 1, history)
+        review_log.start_log(2)
+        if schedule(review_log.load_scheduler()) != schedule(expected):
+            failures.append("snapshot of reviews")
+        review_log.compact().result()
+        if schedule(review_log.load_scheduler()) != schedule(expected):
+            failures.append("snapshot of reviews compacted again")
+        review_log.close()
+
+    for failure in failures:
+        print("    wrong schedule from " + failure)
+    if failures:
+        raise SystemExit("The schedule loaded from a snapshot is wrong")
+    print("    {} cards match".format(len(expected)))
+
+
+def check_interrupted_compaction():
+    """Check reviews recorded after compaction stopped part way are kept.
+
+    Compaction writes the snapshot then starts a new log. Stopping between the
+    two leaves a log with the snapshot's generation, whose reviews are ignored
+    when the history is read, so the next run must start a new log.
+
+    Raises:
+        SystemExit: Reviews recorded after the interrupted compaction are lost.
+    """
+
+    print("Review history after an interrupted compaction")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        review_log = ReviewLog(tmp_dir)
+        for key in range(5):
+            review_log.record(key, 5, 0.0)
+        review_log.flush().result()
+
+        def stop_compaction():
+            # Only the first half of compact_files, the snapshot replacing
+            generation = read_generation(review_log.log_path)
+            review_log.replace_snapshot(generation, review_log.read_scheduler())
+
+        review_log.writer.submit(stop_compaction).result()
+        review_log.close()
+
+        review_log = ReviewLog(tmp_dir)
+        for key in range(100, 103):
+            review_log.record(key, 5, 0.0)
+        review_log.close()
+
+        review_log = ReviewLog(tmp_dir)
+        keys = list(review_log.load_scheduler().slots)
+        review_log.close()
+
+    print("    cards kept: {}".format(keys))
+    if keys != [0, 1, 2, 3, 4, 100, 101, 102]:
+        raise SystemExit("Reviews were lost after an interrupted compaction")
+
+
+def typo(rng, text, edits):
+    """Get text with edits random characters replaced."""
+
+    chars = list(text)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+
+    return "".join(chars)
+
+
+# Typed answers that must be rejected for answers of resources/topic.json
+WRONG_ANSWERS = (
+    ("TCP Port 23", "TCP Port 22"),
+    ("TCP/UDP Port 25", "TCP/UDP Port 23"),
+    ("443", "TCP/UDP Port 427"),
+    ("66 and 69", "UDP Ports 67 and 68"),
+    ("port", "TCP/UDP Port 25"),
+    ("6GHz", "5GHz"),
+)
+# Typed answers that must still be accepted
+RIGHT_ANSWERS = (
+    ("tcp prot 22", "TCP Port 22"),
+    ("22", "TCP Port 22"),
+    ("UDP ports 68 and 67", "UDP Ports 67 and 68"),
+    ("20 for data and 21 for control", "20 for the data port and 21 for control"),
+)
+
+
+def check_answer_regressions():
+    """Check wrong port numbers and common words are not accepted as answers.
+
+    Raises:
+        SystemExit: A wrong answer was accepted or a right one rejected.
+    """
+
+    print("Answer check regressions")
+    topic_file = JSONTopicHandler(Path(__file__).parent / "resources" / "topic.json")
+    checker = AnswerChecker(topic_file.answer_column)
+    answers = list(topic_file.answer_column)
+    failures = []
+    for cases, correct in ((WRONG_ANSWERS, False), (RIGHT_ANSWERS, True)):
+        for typed, answer in cases:
+            if checker.check(answers.index(answer), typed).correct != correct:
+                failures.append(typed + " for " + answer)
+
+    # A word in most answers is not enough on its own
+    checker = AnswerChecker(["red port", "blue port", "green port"])
+    if checker.check(0, "port").correct or not checker.check(0, "red").correct:
+        failures.append("port for red port")
+    # Common words are found within the card's topic, not the whole deck
+    answers = ["red port", "blue port", "green port", "cat", "dog", "port cat"]
+    checker = AnswerChecker(answers, lambda card: (0, 3) if card < 3 else (3, 6))
+    if checker.check(0, "port").correct or not checker.check(5, "port").correct:
+        failures.append("port within a topic")
+
+    for failure in failures:
+        print("    wrongly checked " + failure)
+    if failures:
+        raise SystemExit("Answers were checked wrongly")
+    print("    {} cases passed".format(len(WRONG_ANSWERS) + len(RIGHT_ANSWERS) + 3))
+
+
+def bench_answer_check(
+    num_answers=10_000, answer_words=(5, 50, 200), deck_prompts=1_000_000
+):
+    """Time checking typed answers of increasing length.
+
+    Each typed answer has a few typos so the edit distance has to be worked
+    out. The slowest single check is compared with one 60Hz frame.
+
+    Then the first token match in each topic of a deck of deck_prompts prompts
+    is timed, as it also finds the common words of the topic.
+
+    Raises:
+        SystemExit: A first token match took longer than a frame.
+    """
+
+    print("Answer checking ({} answers each)".format(num_answers))
+    rng = random.Random(0)
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot"]
+    for length in answer_words:
+        answers = [
+            " ".join(rng.choice(words) for _ in range(length)) for _ in range(100)
+        ]
+        checker = AnswerChecker(answers)
+        cards = [rng.randrange(len(answers)) for _ in range(num_answers)]
+        typed = [typo(rng, answers[card], rng.randrange(4)) for card in cards]
+
+        batch_time = timed(checker.check_many, cards, typed)
+        slowest = max(
+            timed(checker.check, card, text) for card, text in zip(cards, typed)
+        )
+        print(
+            "    {:>4} word answers: batch {:8.4f}s, slowest check {:6.2f}ms "
+            "(frame 16.67ms)".format(length, batch_time, slowest * 1000)
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        topic_file = JSONTopicHandler(
+            write_deck(generate_deck(deck_prompts, 10), tmp_dir)
+        )
+    checker = AnswerChecker(topic_file.answer_column, topic_file.card_range)
+    slowest = 0.0
+    for start, stop in topic_file.topic_index.values():
+        card = rng.randrange(start, stop)
+        # One word of the answer, so the check reaches the token match
+        typed = rng.choice(tokenise(topic_file.answer_column[card]))
+        slowest = max(slowest, timed(checker.check, card, typed))
+    print(
+        "    first token match in a topic of {} prompts {:6.2f}ms "
+        "(frame 16.67ms)".format(deck_prompts // 10, slowest * 1000)
+    )
+    if slowest > FRAME_SECONDS:
+        raise SystemExit("Finding a topic's common words takes over a frame")
+
+
+def bench_search(sizes=(100_000, 1_000_000), num_topics=1_000):
+    """Time building, loading and querying the search index of a deck.
+
+    The index is built and saved on the first load_index, then read back from
+    its file. Each query is timed along with finding the topics it matches,
+    which is the work done for each search typed on the topic select screen.
+    """
+
+    print("Search index (load_index + search + topics_of_cards)")
+    queries = [("answer 123456", False), ("prompt 7", False), ("12345", True)]
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = write_deck(
+                make_deck(num_topics, num_prompts // num_topics), tmp_dir
+            )
+            topic_file = JSONTopicHandler(file_path)
+
+            index_cache.clear()
+            build_time = timed(load_index, topic_file)
+            index_cache.clear()
+            load_time = timed(load_index, topic_file)
+            search_index = load_index(topic_file)
+
+        query_times = []
+        for query, prefix in queries:
+            start = time.perf_counter()
+            topic_file.topics_of_cards(search_index.search(query, prefix))
+            query_times.append(time.perf_counter() - start)
+        print(
+            "    {:>9} prompts: build {:8.4f}s, load {:8.4f}s, "
+            "slowest query {:6.2f}ms".format(
+                num_prompts, build_time, load_time, max(query_times) * 1000
+            )
+        )
+
+
+def check_search_update(num_topics=50, prompts_per_topic=20):
+    """Check an index file updated after the deck changed equals a fresh build.
+
+    The deck is indexed, then a topic is changed, one removed, one inserted
+    before the rest so every later card moves, and one added at the end.
+
+    Raises:
+        SystemExit: The updated index differs from one built from scratch.
+    """
+
+    print("Search index update")
+    deck = make_deck(num_topics, prompts_per_topic)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = write_deck(deck, tmp_dir)
+        index_cache.clear()
+        load_index(JSONTopicHandler(file_path))
+
+        deck[3]["prompts"][5]["answer"] = "Changed answer"
+        del deck[7]
+        deck.insert(0, make_deck(1, 30, seed=1)[0])
+        deck[0]["topic_name"] = "Inserted topic"
+        deck.append({"topic_name": "Added topic", "prompts": deck[10]["prompts"]})
+        stat = os.stat(file_path)
+        write_deck(deck, tmp_dir)
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        topic_file = JSONTopicHandler(file_path)
+        index_cache.clear()
+        updated = load_index(topic_file)
+        index_cache.clear()
+        stored = load_index(topic_file)
+        fresh = SearchIndex()
+        fresh.update(topic_file)
+
+    def contents(index):
+        return (index.tokens, index.offsets, index.postings, index.topics)
+
+    failures = []
+    if contents(updated) != contents(fresh):
+        failures.append("updated index")
+    if contents(stored) != contents(fresh):
+        failures.append("updated index file")
+
+    for failure in failures:
+        print("    differs from a fresh build: " + failure)
+    if failures:
+        raise SystemExit("The updated search index differs from a fresh build")
+    print("    {} tokens match".format(len(fresh.tokens)))
+
+
+def run_session(session, typed=None):
+    """Reveal every prompt of a session, checking typed answers if given."""
+
+    for prompt in session:
+        session.reveal()
+        if typed is not None:
+            session.check_answer(typed[prompt.index % len(typed)])
+
+
+def bench_session(sizes=(100_000, 1_000_000), num_topics=1_000):
+    """Time running through every prompt of a deck without a window.
+
+    Each prompt is shown, revealed and moved on from with a DeckSession, the
+    work done by the display prompts screen for each press of Enter.
+    """
+
+    print("Running through prompts (DeckSession)")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = write_deck(
+                make_deck(num_topics, num_prompts // num_topics), tmp_dir
+            )
+            topic_file = JSONTopicHandler(file_path)
+
+        topic_file.set_topics(topic_file.topics)
+        topic_file.refresh_prompts()
+        session = DeckSession(topic_file)
+        reveal_time = timed(run_session, session)
+        session.reset()
+        check_time = timed(run_session, session, ["answer 1", "answr 2"])
+        print(
+            "    {:>9} prompts: {:9.0f} prompts/s, {:9.0f} prompts/s "
+            "checking answers".format(
+                num_prompts, num_prompts / reveal_time, num_prompts / check_time
+            )
+        )
+
+
+def bench_shuffle(sizes=(10_000, 50_000, 200_000), num_topics=100):
+    """Time each randomise_prompts order mode on decks of increasing size."""
+
+    print("Prompt ordering (randomise_prompts)")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            topic_file = JSONTopicHandler(write_deck(deck, tmp_dir))
+
+        timed(select_all, topic_file)
+        topic_file.prompts_from_chosen_topics()
+
+        results = []
+        for mode in ORDER_MODES:
+            results.append(
+                "{} {:8.4f}s".format(mode, timed(topic_file.randomise_prompts, 1, mode))
+            )
+        print("    {:>7} prompts: {}".format(num_prompts, ", ".join(results)))
+
+
+def read_order(topic_file, reverse=False):
+    """Get the prompt and answer at each position of a deck's prompt_order."""
+
+    positions = range(topic_file.number_of_prompts())
+    if reverse:
+        positions = reversed(positions)
+    values = [
+        (topic_file.get_value(i, "prompt"), topic_file.get_value(i, "answer"))
+        for i in positions
+    ]
+
+    return values[::-1] if reverse else values
+
+
+def check_seeded_order(num_topics=20, prompts_per_topic=50, seed=7):
+    """Check the same seed gives the same prompt order in every order mode.
+
+    Each order is read from two handlers of the same deck, one from the first
+    prompt and one from the last, as a random order is only shuffled up to
+    the prompts read. A random order shuffled again must also be the same.
+
+    Raises:
+        SystemExit: The same seed gave two different orders.
+    """
+
+    print("Seeded prompt order")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = write_deck(make_deck(num_topics, prompts_per_topic), tmp_dir)
+        topic_files = [JSONTopicHandler(file_path) for _ in range(2)]
+
+    failures = []
+    for topic_file in topic_files:
+        topic_file.set_topics(topic_file.topics[::2])
+        topic_file.prompts_from_chosen_topics()
+    for mode in ORDER_MODES:
+        orders = []
+        for topic_file, reverse in zip(topic_files, (False, True)):
+            topic_file.randomise_prompts(seed, mode)
+            orders.append(read_order(topic_file, reverse))
+            if mode == ORDER_RANDOM:
+                topic_file.prompt_order.reshuffle()
+                orders.append(read_order(topic_file, reverse))
+        if orders[0] != orders[len(orders) // 2]:
+            failures.append(mode)
+        if mode == ORDER_RANDOM:
+            random_order = orders[0]
+            if orders[1] != orders[3]:
+                failures.append(mode + " shuffled again")
+
+    topic_files[0].randomise_prompts(seed + 1)
+    if read_order(topic_files[0]) == random_order:
+        failures.append("another seed")
+    cards = range(0, num_topics * prompts_per_topic, 3)
+    orders = [list(topic_file.match_prompts(cards, seed)) for topic_file in topic_files]
+    if orders[0] != orders[1]:
+        failures.append("search results")
+
+    for failure in failures:
+        print("    orders differ: " + failure)
+    if failures:
+        raise SystemExit("The same seed gave different prompt orders")
+    print("    {} order modes reproduced".format(len(ORDER_MODES)))
+
+
+def traced_memory(func, *args):
+    """Run func with args and return its result and the bytes it left allocated."""
+
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return result, allocated
+
+
+def load_dict_layout(file_path):
+    """Load a deck the way JSONTopicHandler used to store it.
+
+    The parsed list of topic dicts is kept along with a list holding every
+    prompt dict from every topic, as when all topics have been chosen.
+    """
+
+    with open(file_path) as f:
+        raw_string = json.load(f)
+
+    all_prompts = []
+    for topic in raw_string:
+        all_prompts.extend(topic["prompts"])
+
+    return raw_string, all_prompts
+
+
+def load_column_layout(file_path):
+    """Load a deck with JSONTopicHandler and choose every topic."""
+
+    topic_file = JSONTopicHandler(file_path)
+    timed(select_all, topic_file)
+    topic_file.prompts_from_chosen_topics()
+
+    return topic_file
+
+
+def bench_memory(sizes=(10_000, 100_000, 1_000_000), num_topics=1_000):
+    """Compare the memory held by the column layout against lists of dicts."""
+
+    print("Deck memory (all topics chosen)")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            file_path = write_deck(deck, tmp_dir)
+            del deck
+
+            dict_layout, dict_bytes = traced_memory(load_dict_layout, file_path)
+            del dict_layout
+            column_layout, column_bytes = traced_memory(load_column_layout, file_path)
+            del column_layout
+
+        print(
+            "    {:>7} prompts: dicts {:7.1f}MB, columns {:7.1f}MB ({:.0%})".format(
+                num_prompts,
+                dict_bytes / 1e6,
+                column_bytes / 1e6,
+                column_bytes / dict_bytes,
+            )
+        )
+
+
+def peak_memory(func, *args):
+    """Run func with args and return its result and the peak bytes allocated."""
+
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, peak
+
+
+def open_and_choose(file_path, backend, num_chosen):
+    """Open a deck and collect the prompts of its first num_chosen topics."""
+
+    topic_file = open_deck(file_path, backend)
+    topic_file.set_topics(topic_file.topics[:num_chosen])
+    topic_file.prompts_from_chosen_topics()
+
+    return topic_file
+
+
+def bench_streaming(sizes=(100_000, 1_000_000), num_topics=1_000, num_chosen=10):
+    """Compare the memory and time to open a JSON deck whole and streamed.
+
+    Peak memory is traced while opening the deck and collecting the prompts of
+    a few topics. A fully read deck peaks at several times the size of the
+    file, a streamed one at the size of its topic index and chosen topics.
+    """
+
+    print("JSON read whole / streamed ({} topics chosen)".format(num_chosen))
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            file_path = write_deck(deck, tmp_dir)
+            file_size = os.path.getsize(file_path)
+            del deck
+
+            results = []
+            for backend in ("json", "stream"):
+                start = time.perf_counter()
+                topic_file, peak = peak_memory(
+                    open_and_choose, file_path, backend, num_chosen
+                )
+                elapsed = time.perf_counter() - start
+                results.append(
+                    "{} {:7.4f}s peak {:7.1f}MB".format(backend, elapsed, peak / 1e6)
+                )
+                del topic_file
+
+        print(
+            "    {:>7} prompts, {:5.1f}MB: {}".format(
+                num_prompts, file_size / 1e6, ", ".join(results)
+            )
+        )
+
+
+def check_budget_session(topic_file, full_deck, mode, limit=None):
+    """Run through a budgeted deck, checking every prompt against the full deck.
+
+    Args:
+        topic_file: A BudgetedTopicHandler with its topics chosen.
+        full_deck: A JSONTopicHandler of the same file with every prompt loaded.
+        mode: The order to run through the prompts in.
+        limit: The most prompts to run through, or None for every prompt.
+
+    Returns:
+        The number of prompts run through.
+
+    Raises:
+        SystemExit: A prompt or answer differs from the full deck.
+    """
+
+    topic_file.refresh_prompts(mode)
+    shown = 0
+    for prompt in DeckSession(topic_file):
+        if (
+            prompt.prompt != full_deck.prompt_column[prompt.card]
+            or topic_file.answer_column[prompt.card]
+            != full_deck.answer_column[prompt.card]
+        ):
+            raise SystemExit("Budgeted deck read the wrong prompt")
+        shown += 1
+        if shown == limit:
+            break
+
+    return shown
+
+
+def bench_budget(num_prompts=200_000, num_topics=1_000, ratio=10):
+    """Run through a deck ratio times bigger than its memory budget.
+
+    The budget is set to the memory the fully read deck uses divided by
+    ratio. Every topic is chosen and the prompts are run through in file
+    order, then partly in random order, checking each one against the fully
+    read deck. Fails if the cached prompts ever go over the budget by more
+    than the biggest topic, which is always kept.
+
+    Raises:
+        SystemExit: A prompt is wrong or the budget was overrun.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deck = make_deck(num_topics, num_prompts // num_topics)
+        file_path = write_deck(deck, tmp_dir)
+        del deck
+
+        full_deck = open_deck(file_path, "json")
+        deck_bytes = full_deck.resident_bytes()
+        budget = deck_bytes // ratio
+        print(
+            "Budgeted deck ({} prompts, {:.1f}MB resident in full, budget {:.1f}MB)".format(
+                num_prompts, deck_bytes / 1e6, budget / 1e6
+            )
+        )
+
+        topic_file = open_deck(file_path, "budget")
+        topic_file.cache.max_bytes = budget
+        topic_file.set_topics(topic_file.topics)
+        biggest_topic = max(
+            topic_bytes(topic_file.reader.read_topic(topic))
+            for topic in topic_file.topics
+        )
+        for mode, limit in ((ORDER_SEQUENTIAL, None), (ORDER_RANDOM, 5_000)):
+            cache = topic_file.cache
+            hits, misses = cache.hits, cache.misses
+            start = time.perf_counter()
+            shown = check_budget_session(topic_file, full_deck, mode, limit)
+            elapsed = time.perf_counter() - start
+            lookups = cache.hits - hits + cache.misses - misses
+            print(
+                "    {:>10}: {:>7} prompts {:8.4f}s, hit rate {:6.1%}, "
+                "resident {:6.1f}MB, peak {:6.1f}MB".format(
+                    mode,
+                    shown,
+                    elapsed,
+                    (cache.hits - hits) / max(lookups, 1),
+                    cache.resident_bytes / 1e6,
+                    cache.peak_bytes / 1e6,
+                )
+            )
+
+    if topic_file.cache.peak_bytes > budget + biggest_topic:
+        raise SystemExit("Budgeted deck went over its memory budget")
+
+
+def first_prompt(file_path, backend):
+    """Open a deck, choose its first topic and get the first prompt to display."""
+
+    topic_file = open_deck(file_path, backend)
+    topic_file.set_topic(topic_file.topics[0])
+    topic_file.prompts_from_chosen_topics()
+    topic_file.randomise_prompts()
+
+    return topic_file.get_value(0, "prompt")
+
+
+def bench_backends(sizes=(10_000, 100_000, 1_000_000), num_topics=1_000):
+    """Compare the time to open a deck and show its first prompt per backend.
+
+    Compiled and SQLite decks are converted from the JSON topic file before
+    timing starts.
+    """
+
+    print("Deck open / time to first prompt")
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            file_path = write_deck(deck, tmp_dir)
+            del deck
+
+            results = []
+            for backend in DECK_BACKENDS:
+                open_deck(file_path, backend)
+                results.append(
+                    "{} {:7.4f}s / {:7.4f}s".format(
+                        backend,
+                        timed(open_deck, file_path, backend),
+                        timed(first_prompt, file_path, backend),
+                    )
+                )
+
+        print("    {:>7} prompts: {}".format(num_prompts, ", ".join(results)))
+
+
+def check_backends(num_topics=30, prompts_per_topic=40, seed=3):
+    """Check every deck backend reads back the same prompts as the JSON deck.
+
+    Some prompts and answers hold quotes, escapes, newlines and characters
+    outside ASCII, and one topic is empty. The prompts of every topic are read
+    in each order mode with the same seed, along with a set of matched cards.
+
+    Raises:
+        SystemExit: A backend read back different topics, prompts or answers.
+    """
+
+    print("Deck backends read back the JSON deck")
+    deck = make_deck(num_topics, prompts_per_topic)
+    deck[1]["prompts"][0] = {"prompt": 'Say "hi"\n\\ \u00e9t\u00e9', "answer": ""}
+    deck[2]["prompts"][-1] = {"prompt": "\u732b \U0001f408", "answer": "\t{}[],"}
+    deck.append({"topic_name": "Empty \u00e9", "prompts": []})
+    cards = range(0, num_topics * prompts_per_topic, 7)
+
+    def read_back(topic_file):
+        topic_file.set_topics(topic_file.topics)
+        topic_file.prompts_from_chosen_topics()
+        values = [list(topic_file.topics)]
+        for mode in ORDER_MODES:
+            topic_file.randomise_prompts(seed, mode)
+            values.append(read_order(topic_file))
+        topic_file.match_prompts(cards, seed)
+        values.append(read_order(topic_file))
+        return values
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = write_deck(deck, tmp_dir)
+        expected = read_back(JSONTopicHandler(file_path))
+        for backend in DECK_BACKENDS:
+            if read_back(open_deck(file_path, backend)) != expected:
+                failures.append(backend)
+
+    for failure in failures:
+        print("    read back differently: " + failure)
+    if failures:
+        raise SystemExit("A deck backend read back a different deck")
+    print("    {} backends match".format(len(DECK_BACKENDS)))
+
+
+def bench_json_parsers(sizes=(100_000, 1_000_000), num_topics=1_000, repeat=3):
+    """Compare the time to parse a JSON topic file with each installed parser.
+
+    Each parser is timed reading the file into a buffer and, if it can parse a
+    memoryview, parsing it straight from a memory map.
+    """
+
+    print("JSON parsers (best of {})".format(repeat))
+    for num_prompts in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            deck = make_deck(num_topics, num_prompts // num_topics)
+            file_path = write_deck(deck, tmp_dir)
+            file_size = os.path.getsize(file_path)
+            del deck
+
+            results = []
+            for parser in JSON_PARSERS:
+                try:
+                    parses_buffers = json_parser(parser)[2]
+                except ImportError:
+                    results.append(parser + " not installed")
+                    continue
+
+                for use_mmap in (False, True) if parses_buffers else (False,):
+                    results.append(
+                        "{} {} {:7.4f}s".format(
+                            parser,
+                            "mmap" if use_mmap else "read",
+                            best_time(
+                                repeat, parse_json_file, file_path, parser, use_mmap
+                            ),
+                        )
+                    )
+
+        print(
+            "    {:>7} prompts, {:5.1f}MB: {}".format(
+                num_prompts,
+                file_size / 1e6,
+                ", ".join(results),
+            )
+        )
+
+
+def bench_probe(num_files=50, num_prompts=20_000, num_topics=100):
+    """Compare probing a directory of decks against reading every deck in it.
+
+    This is the work done by the file selection screen to list the decks.
+    """
+
+    print("Listing {} decks of {} prompts".format(num_files, num_prompts))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = write_deck(
+            make_deck(num_topics, num_prompts // num_topics), tmp_dir
+        )
+        files = [file_path]
+        for i in range(1, num_files):
+            files.append(shutil.copy(file_path, Path(tmp_dir, str(i) + ".json")))
+
+        read_time = timed(lambda: [JSONTopicHandler(file) for file in files])
+        probe_time = timed(lambda: [probe_deck(file) for file in files])
+
+    print("    read every deck {:8.4f}s, probe {:8.4f}s".format(read_time, probe_time))
+
+
+def pick_every_topic(topic_file):
+    """Pick each topic the way TopicSelectFrame.pick_topics does."""
+
+    for topic in topic_file.topics:
+        topic_file.set_topic(topic)
+        topic_file.topic_string(1)
+
+
+def step_through_prompts(topic_file):
+    """Open a session and read every prompt and answer in order.
+
+    This is the handler work done by DisplayPrompts when it is shown and as the
+    user moves through the prompts.
+    """
+
+    topic_file.print_prompts()
+    for i in range(topic_file.number_of_prompts()):
+        topic_file.get_value(i, "prompt")
+        topic_file.get_value(i, "answer")
+
+
+def bench_logging(num_topics=2_000, prompts_per_topic=50):
+    """Compare selection and navigation with debug logging enabled and disabled.
+
+    With logging enabled every message is formatted and written to a stream, as
+    the console output used to be.
+    """
+
+    print(
+        "Debug logging cost ({} topics, {} prompts)".format(
+            num_topics, num_topics * prompts_per_topic
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deck = make_deck(num_topics, prompts_per_topic)
+        topic_file = JSONTopicHandler(write_deck(deck, tmp_dir))
+
+    root_logger = logging.getLogger()
+    level = root_logger.level
+    for enabled in (True, False):
+        with open(os.devnull, "w") as devnull:
+            handler = logging.StreamHandler(devnull)
+            root_logger.addHandler(handler)
+            root_logger.setLevel(logging.DEBUG if enabled else logging.WARNING)
+            try:
+                topic_file.clear_selection()
+                pick_time = timed(pick_every_topic, topic_file)
+                topic_file.prompts_from_chosen_topics()
+                step_time = timed(step_through_prompts, topic_file)
+            finally:
+                root_logger.removeHandler(handler)
+                root_logger.setLevel(level)
+
+        print(
+            "    logging {:>8}: pick topics {:8.4f}s, step through {:8.4f}s".format(
+                "enabled" if enabled else "disabled", pick_time, step_time
+            )
+        )
+
+
+def time_timers(count):
+    """Enter and leave count metrics timers and return the seconds taken."""
+
+    start = time.perf_counter()
+    for _ in range(count):
+        with metrics.timer("keypress.bench"):
+            pass
+    return time.perf_counter() - start
+
+
+def bench_instrumentation(num_timers=1_000_000, num_prompts=100_000, num_topics=1_000):
+    """Compare the cost of metrics timers and of a session with metrics off and on.
+
+    Timers are left in the hot paths of the app, so with metrics off they must
+    cost next to nothing.
+    """
+
+    print(
+        "Instrumentation cost ({} timers, session of {} prompts)".format(
+            num_timers, num_prompts
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deck = make_deck(num_topics, num_prompts // num_topics)
+        deck_path = write_deck(deck, tmp_dir)
+
+        enabled = metrics.enabled
+        try:
+            for metrics_on in (False, True):
+                metrics.enabled = metrics_on
+                metrics.reset()
+                timer_time = time_timers(num_timers)
+                open_time = timed(open_deck, deck_path)
+                topic_file = open_deck(deck_path)
+                topic_file.set_topics(topic_file.topics)
+                topic_file.prompts_from_chosen_topics()
+                session_time = timed(run_session, DeckSession(topic_file))
+                print(
+                    "    metrics {:>8}: {:6.0f}ns per timer, open deck {:8.4f}s, "
+                    "session {:8.4f}s".format(
+                        "enabled" if metrics_on else "disabled",
+                        timer_time / num_timers * 1e9,
+                        open_time,
+                        session_time,
+                    )
+                )
+        finally:
+            metrics.enabled = enabled
+            metrics.reset()
+
+
+def import_time(module):
+    """Import module in a new interpreter and return its cumulative import time.
+
+    Uses python -X importtime, which reports the time taken by each import in
+    microseconds.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1_000_000
+
+    raise ValueError("No import time reported for " + module)
+
+
+def time_to_first_frame():
+    """Start the app in a new interpreter and time how long the intro takes to show.
+
+    Returns:
+        The seconds from starting the interpreter until the intro screen has
+            been drawn, or None if there is no display.
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", FIRST_FRAME_SCRIPT],
+        cwd=Path(__file__).parent,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline().strip()
+    elapsed = time.perf_counter() - start
+    process.wait()
+
+    return elapsed if line == "ready" else None
+
+
+def bench_startup(runs=5):
+    """Check how long the app takes to start against the startup budgets.
+
+    The best of runs is used for each measurement so a busy machine does not
+    fail the budget.
+
+    Raises:
+        SystemExit: Startup took longer than IMPORT_BUDGET or FIRST_FRAME_BUDGET.
+    """
+
+    print("Startup time (best of {})".format(runs))
+    import_seconds = min(import_time("main_app") for _ in range(runs))
+    print(
+        "    import main_app {:8.4f}s (budget {}s)".format(
+            import_seconds, IMPORT_BUDGET
+        )
+    )
+
+    frame_seconds = min(
+        (time_to_first_frame() for _ in range(runs)), key=lambda t: t or 0
+    )
+    if frame_seconds is None:
+        print("    first frame skipped, no display")
+    else:
+        print(
+            "    first frame     {:8.4f}s (budget {}s)".format(
+                frame_seconds, FIRST_FRAME_BUDGET
+            )
+        )
+
+    if import_seconds > IMPORT_BUDGET or (frame_seconds or 0) > FIRST_FRAME_BUDGET:
+        raise SystemExit("Startup is over budget")
+
+
+def wait_for(root, condition, timeout=10.0):
+    """Run the Tk event loop until condition() is true.
+
+    Raises:
+        TimeoutError: condition() was still false after timeout seconds.
+    """
+
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            raise TimeoutError("GUI did not reach the expected state")
+        root.update()
+        time.sleep(0.001)
+
+
+def count_widgets(widget):
+    """Count widget and every widget below it."""
+
+    return 1 + sum(map(count_widgets, widget.winfo_children()))
+
+
+def round_trip(root, app, steps=5):
+    """Go from the intro screen through a session and back to the intro screen."""
+
+    app.update_current_screen("choose_file_frame", app.current_screen)
+    choose_frame = app.choose_file_frame
+    wait_for(root, lambda: choose_frame.chosen_file is not None)
+    choose_frame.next_frame_button.invoke()
+
+    topic_frame = app.topic_select_frame
+    topic_frame.select_all_button.invoke()
+    topic_frame.next_screen_button.invoke()
+    wait_for(root, lambda: app.current_screen == "display_prompts_frame")
+
+    for _ in range(steps):
+        app.display_prompts_frame.goto_next_prompt()
+    app.display_prompts_frame.return_to_start_button.invoke()
+    root.update()
+
+
+def soak_round_trips(round_trips=2_000, num_topics=200, prompts_per_topic=10):
+    """Check repeated sessions do not grow the number of widgets or memory.
+
+    Drives the GUI from the intro screen through a session and back again
+    round_trips times. The widget count must not change and the memory traced
+    after the first round trips must stay flat.
+
+    Raises:
+        SystemExit: Widgets or memory grew over the round trips.
+    """
+
+    # Imported here so the other benchmarks run where Tk is not installed
+    import tkinter as tk
+
+    import main_app
+
+    print("GUI soak test ({} round trips)".format(round_trips))
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("    skipped, no display")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        deck = make_deck(num_topics, prompts_per_topic)
+        resources_dir = Path(tmp_dir, main_app.MainApp.RESOURCES_DIR)
+        resources_dir.mkdir()
+        main_app.MainApp.CWD = Path(tmp_dir)
+        main_app.MainApp.default_file_path = write_deck(deck, resources_dir)
+
+        try:
+            app = main_app.MainApp(root)
+            # Warm up caches and lazily built widgets before measuring
+            round_trip(root, app)
+            widgets = count_widgets(root)
+
+            tracemalloc.start()
+            round_trip(root, app)
+            memory = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            for _ in range(round_trips):
+                round_trip(root, app)
+            elapsed = time.perf_counter() - start
+            memory_growth = tracemalloc.get_traced_memory()[0] - memory
+            tracemalloc.stop()
+
+            widget_growth = count_widgets(root) - widgets
+            app.review_log.close()
+        finally:
+            root.destroy()
+
+    print(
+        "    {:8.2f}ms per round trip, {} widgets (+{}), memory +{:.1f} KiB".format(
+            elapsed / round_trips * 1000, widgets, widget_growth, memory_growth / 1024
+        )
+    )
+    # Allow for allocator noise but not for growth with each round trip
+    if widget_growth != 0 or memory_growth > 64 * 1024:
+        raise SystemExit("Widgets or memory grew over repeated round trips")
+
+
+def generate_deck(num_prompts, num_topics, seed=0):
+    """Create a synthetic deck with prompts spread over topics.
+
+    The prompts are split as evenly as possible between the topics and their
+    text is made of random words, so decks of any size can be reproduced.
+
+    Args:
+        num_prompts: The total number of prompts.
+        num_topics: The number of topics, at most num_prompts.
+        seed: Seed for the random generator.
+
+    Returns:
+        A list of topic dicts ready to be written to a JSON file.
+    """
+
+    rng = random.Random(seed)
+    # Phrases are chosen from a pool rather than built for each prompt so
+    # generating a million prompts takes seconds
+    phrases = [
+        " ".join(rng.choice(SUITE_WORDS) for _ in range(rng.randint(1, 12)))
+        for _ in range(4096)
+    ]
+    per_topic, extra = divmod(num_prompts, num_topics)
+
+    deck = []
+    for t in range(num_topics):
+        prompts = [
+            {"prompt": rng.choice(phrases) + "?", "answer": rng.choice(phrases)}
+            for _ in range(per_topic + (t < extra))
+        ]
+        deck.append({"topic_name": "Topic " + str(t), "prompts": prompts})
+
+    return deck
+
+
+def suite_cases(max_prompts):
+    """Get the (prompts, topics) sizes of the suite with at most max_prompts.
+
+    Only sizes with at least one prompt for each topic are used.
+    """
+
+    return [
+        (num_prompts, num_topics)
+        for num_prompts in SUITE_PROMPTS
+        if num_prompts <= max_prompts
+        for num_topics in SUITE_TOPICS
+        if num_topics <= num_prompts
+    ]
+
+
+def run_times(repeat, func, *args):
+    """Get the seconds taken by each of repeat runs of func, fastest first.
+
+    The garbage collector is paused while timing, as timeit does, so a
+    collection of garbage left by earlier work is not timed.
+    """
+
+    gc.disable()
+    try:
+        return sorted(timed(func, *args) for _ in range(repeat))
+    finally:
+        gc.enable()
+
+
+def best_time(repeat, func, *args):
+    """Get the fastest of repeat runs of func, in seconds."""
+
+    return run_times(repeat, func, *args)[0]
+
+
+def look_up_values(topic_file, indices):
+    """Read the prompt and answer at each index of the prompt order."""
+
+    for i in indices:
+        topic_file.get_value(i, "prompt")
+        topic_file.get_value(i, "answer")
+
+
+def run_suite_case(num_prompts, num_topics, seed=0, repeat=SUITE_REPEAT):
+    """Time each hot path of handle_json on one synthetic deck.
+
+    Args:
+        num_prompts: The number of prompts in the deck.
+        num_topics: The number of topics in the deck.
+        seed: Seed for the deck and for the prompt order.
+        repeat: The runs of each operation.
+
+    Returns:
+        A dict of the seconds taken by each run of each operation, fastest
+            first.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = write_deck(generate_deck(num_prompts, num_topics, seed), tmp_dir)
+        times = {"get_js": run_times(repeat, JSONHandler.get_js, file_path)}
+        topic_file = JSONTopicHandler(file_path)
+
+    times["extract_topics"] = run_times(repeat, topic_file.extract_topics)
+
+    # Each run picks every topic of a fresh copy with nothing chosen
+    copies = [topic_file.copy() for _ in range(repeat)]
+    times["set_topic"] = sorted(best_time(1, pick_every_topic, copy) for copy in copies)
+    topic_file = copies[0]
+
+    times["prompts_from_chosen_topics"] = run_times(
+        repeat, topic_file.prompts_from_chosen_topics
+    )
+    times["randomise_prompts"] = run_times(repeat, topic_file.randomise_prompts, seed)
+
+    rng = random.Random(seed)
+    indices = [rng.randrange(num_prompts) for _ in range(SUITE_LOOKUPS)]
+    times["get_value"] = run_times(repeat, look_up_values, topic_file, indices)
+
+    return times
+
+
+def case_results(num_prompts, num_topics, seed=0, repeat=SUITE_REPEAT):
+    """Run one case of the hot path suite.
+
+    Returns:
+        A list of a result dict for each operation, holding the seconds of its
+            fastest run and the spread of its runs, the median less the fastest.
+    """
+
+    case = "{} prompts/{} topics".format(num_prompts, num_topics)
+    print("    " + case)
+    results = []
+    for operation, runs in run_suite_case(
+        num_prompts, num_topics, seed, repeat
+    ).items():
+        results.append(
+            {
+                "case": case,
+                "prompts": num_prompts,
+                "topics": num_topics,
+                "operation": operation,
+                "seconds": runs[0],
+                "spread": runs[len(runs) // 2] - runs[0],
+            }
+        )
+
+    return results
+
+
+def run_suite(max_prompts=max(SUITE_PROMPTS), seed=0, repeat=SUITE_REPEAT):
+    """Run every case of the hot path suite.
+
+    Returns:
+        A dict of the results, ready to be written as JSON.
+    """
+
+    cases = suite_cases(max_prompts)
+    # The first case is run once untimed so imports and caches warm up first
+    run_suite_case(*cases[0], seed, 1)
+
+    results = []
+    for num_prompts, num_topics in cases:
+        results.extend(case_results(num_prompts, num_topics, seed, repeat))
+
+    return {
+        "version": SUITE_VERSION,
+        "python": sys.version.split()[0],
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Compare suite results with a baseline from an earlier run.
+
+    An operation has regressed if it is more than tolerance times slower
+    than in the baseline and slower by more than REGRESSION_FLOOR seconds
+    and SPREAD_FACTOR times the spread of the runs of both, so timer noise on
+    fast or noisy operations is ignored. Operations missing from the baseline
+    are skipped.
+
+    Returns:
+        A list of (result, baseline result) pairs of each regression.
+    """
+
+    baseline_results = {
+        (result["case"], result["operation"]): result for result in baseline["results"]
+    }
+    regressions = []
+    for result in results["results"]:
+        before = baseline_results.get((result["case"], result["operation"]))
+        if before is None:
+            continue
+        spread = result.get("spread", 0.0) + before.get("spread", 0.0)
+        floor = max(REGRESSION_FLOOR, SPREAD_FACTOR * spread)
+        slower = result["seconds"] - before["seconds"]
+        if result["seconds"] > before["seconds"] * tolerance and slower > floor:
+            regressions.append((result, before))
+
+    return regressions
+
+
+def rerun_regressions(results, regressions, seed=0, repeat=SUITE_REPEAT):
+    """Run the cases of regressed operations again, keeping the faster result.
+
+    A regression caused by the machine being busy for a moment is then not
+    reported, while a real one is slow on both runs.
+
+    Args:
+        results: The suite results from run_suite, updated in place.
+        regressions: The regressions found in results by find_regressions.
+        seed: Seed for the decks and prompt orders.
+        repeat: The runs of each operation.
+    """
+
+    cases = {(result["prompts"], result["topics"]): None for result, _ in regressions}
+    print("    running {} regressed cases again".format(len(cases)))
+    rerun = {
+        (result["case"], result["operation"]): result
+        for num_prompts, num_topics in cases
+        for result in case_results(num_prompts, num_topics, seed, repeat)
+    }
+    for i, result in enumerate(results["results"]):
+        again = rerun.get((result["case"], result["operation"]))
+        if again is not None and again["seconds"] < result["seconds"]:
+            results["results"][i] = again
+
+
+def bench_suite(
+    max_prompts=max(SUITE_PROMPTS),
+    seed=0,
+    repeat=SUITE_REPEAT,
+    output=SUITE_OUTPUT,
+    baseline=SUITE_BASELINE,
+    save_baseline=False,
+    tolerance=REGRESSION_TOLERANCE,
+):
+    """Run the hot path suite, write its results and check them for regressions.
+
+    Args:
+        max_prompts: The largest deck size to run.
+        seed: Seed for the decks and prompt orders.
+        repeat: The runs of each operation, the fastest is kept.
+        output: The path to write the results to as JSON.
+        baseline: The path of the baseline results to compare with. Nothing is
+            compared if there is no file.
+        save_baseline: True to also write the results as the new baseline.
+        tolerance: How many times slower than the baseline an operation can
+            be before it has regressed.
+
+    Operations that regressed are run once more before the suite fails.
+
+    Raises:
+        SystemExit: An operation regressed from the baseline.
+    """
+
+    print("handle_json hot path suite (seed {})".format(seed))
+    results = run_suite(max_prompts, seed, repeat)
+
+    baseline_results = None
+    if not save_baseline:
+        try:
+            baseline_results = json.loads(Path(baseline).read_text())
+        except FileNotFoundError:
+            print("    no baseline at " + str(baseline))
+        else:
+            if baseline_results.get("version") != SUITE_VERSION:
+                raise SystemExit("Baseline is from another version of the suite")
+
+    regressions = []
+    if baseline_results is not None:
+        regressions = find_regressions(results, baseline_results, tolerance)
+        if regressions:
+            rerun_regressions(results, regressions, seed, repeat)
+            regressions = find_regressions(results, baseline_results, tolerance)
+
+    Path(output).write_text(json.dumps(results, indent=2))
+    print("    results written to " + str(output))
+    if save_baseline:
+        shutil.copyfile(output, baseline)
+        print("    baseline saved to " + str(baseline))
+
+    for result, before in regressions:
+        print(
+            "    regressed {} {}: {:.4f}s -> {:.4f}s".format(
+                result["case"],
+                result["operation"],
+                before["seconds"],
+                result["seconds"],
+            )
+        )
+    if regressions:
+        raise SystemExit("Hot paths regressed from the baseline")
+
+
+def main(argv=None):
+    """Run every benchmark, or only the hot path suite with --suite."""
+
+    parser = argparse.ArgumentParser(description="FlashCards benchmarks")
+    parser.add_argument(
+        "--suite", action="store_true", help="only run the hot path suite"
+    )
+    parser.add_argument(
+        "--max-prompts",
+        type=int,
+        default=max(SUITE_PROMPTS),
+        help="largest deck of the suite",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=SUITE_REPEAT)
+    parser.add_argument("--output", type=Path, default=SUITE_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=SUITE_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the suite results as the new baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=REGRESSION_TOLERANCE,
+        help="times slower than the baseline allowed",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.suite:
+        bench_startup()
+        bench_topic_lookup()
+        bench_prompt_view()
+        bench_toggle()
+        bench_shuffle()
+        check_seeded_order()
+        bench_scheduler()
+        bench_review_log()
+        check_review_snapshot()
+        check_interrupted_compaction()
+        bench_answer_check()
+        check_answer_regressions()
+        bench_search()
+        check_search_update()
+        bench_session()
+        bench_memory()
+        bench_backends()
+        check_backends()
+        bench_json_parsers()
+        bench_streaming()
+        bench_budget()
+        bench_probe()
+        bench_logging()
+        bench_instrumentation()
+        soak_round_trips()
+
+    bench_suite(
+        args.max_prompts,
+        args.seed,
+        args.repeat,
+        args.output,
+        args.baseline,
+        args.save_baseline,
+        args.tolerance,
+    )
+
+
+if __name__ == "__main__":
+    main()
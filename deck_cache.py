@@ -0,0 +1,138 @@
+"""Module for FlashCards App that caches decks that have already been read.
+
+Every screen that needs a deck gets it through load_deck so a file is only read
+again when it has changed on disk. Each caller is given its own copy of the
+cached handler, so topics chosen on one screen are not seen by another. Reading
+a deck also records its topic count for probe_deck.
+
+Classes:
+    DeckCache
+
+Functions:
+    load_deck
+"""
+
+import threading
+
+from collections import OrderedDict
+from pathlib import Path
+
+from deck_probe import record_deck
+from handle_json import open_deck
+from instrumentation import metrics
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DeckCache:
+    """A least recently used cache of opened decks with a memory limit.
+
+    Decks are keyed by their resolved path, backend, size and modification time
+    so a deck is read again when its file changes. The least recently used decks
+    are dropped once the decks in the cache use more than max_bytes, although
+    the most recently used deck is always kept.
+
+    Attributes:
+        max_bytes
+        resident_bytes
+        hits
+        misses
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialise an empty cache.
+
+        Args:
+            max_bytes: The estimated memory the cached decks may use.
+        """
+
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        # Maps a deck key to a (handler, size) pair, oldest first
+        self.entries = OrderedDict()
+        # Maps a (path, backend) pair to the key of its cached deck
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def get(self, filepath, backend=None):
+        """Get a handler for a deck, reading the file only if it is not cached.
+
+        Args:
+            filepath: The path of the deck file to open.
+            backend: The deck backend passed to open_deck.
+
+        Returns:
+            A handler with no topics chosen that is not shared with any other
+                caller.
+        """
+
+        path = Path(filepath).resolve()
+        stat = path.stat()
+        key = (path, backend, stat.st_size, stat.st_mtime_ns)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                metrics.count("deck_cache.hits")
+                return entry[0].copy()
+
+        # Read outside the lock so other decks can be fetched in the meantime
+        handler = open_deck(path, backend)
+        size = handler.resident_bytes()
+        record_deck(path, handler)
+
+        with self.lock:
+            self.misses += 1
+            metrics.count("deck_cache.misses")
+            self.discard(self.keys.get((path, backend)))
+            self.keys[(path, backend)] = key
+            self.entries[key] = (handler, size)
+            self.resident_bytes += size
+            self.evict()
+
+        return handler.copy()
+
+    def discard(self, key):
+        """Drop the deck stored with key, if there is one."""
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.resident_bytes -= entry[1]
+            del self.keys[key[:2]]
+
+    def evict(self):
+        """Drop least recently used decks until the memory limit is met."""
+
+        while self.resident_bytes > self.max_bytes and len(self.entries) > 1:
+            self.discard(next(iter(self.entries)))
+
+    def clear(self):
+        """Drop every cached deck."""
+
+        with self.lock:
+            self.entries.clear()
+            self.keys.clear()
+            self.resident_bytes = 0
+
+
+# The cache shared by every screen of the program
+deck_cache = DeckCache()
+
+
+def load_deck(filepath, backend=None):
+    """Get a handler for a deck from the shared cache.
+
+    Args:
+        filepath: The path of the deck file to open.
+        backend: The deck backend passed to open_deck.
+
+    Returns:
+        A handler with no topics chosen.
+    """
+
+    return deck_cache.get(filepath, backend)
@@ -0,0 +1,189 @@
+"""Module for FlashCards App that checks deck files without reading them.
+
+The file selection screen lists every deck in a directory. Rather than reading
+each file in full, probe_deck only looks at the start of a file to check its
+format. The number of topics comes from the header of a compiled deck, the
+topics table of an SQLite deck, or for a JSON topic file a small index file
+that is kept up to date whenever a deck is read in full.
+
+Classes:
+    DeckInfo
+
+Functions:
+    probe_deck
+    record_deck
+"""
+
+import json
+import os
+
+from collections import namedtuple
+from pathlib import Path
+
+import fcdeck
+
+from handle_json import BACKEND_SUFFIXES
+
+# The hidden file in each deck directory that stores the topic counts of decks
+INDEX_NAME = ".deck_index.json"
+# The number of bytes read from the start of a JSON file to check its format
+HEAD_SIZE = 4096
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# What is known about a deck file without reading it in full. topic_count is
+# None when it is not known yet.
+DeckInfo = namedtuple("DeckInfo", ["path", "backend", "topic_count"])
+
+
+def probe_deck(filepath):
+    """Check if a file looks like a FlashCards deck by reading only its start.
+
+    Hidden files and anything that is not a regular file are never decks.
+
+    Args:
+        filepath: The path of the file to check.
+
+    Returns:
+        A DeckInfo for the file, or None if it is not a FlashCards deck.
+    """
+
+    path = Path(filepath)
+    if path.name.startswith(".") or not path.is_file():
+        return None
+
+    backend = BACKEND_SUFFIXES.get(path.suffix, "json")
+    try:
+        if backend == "fcdeck":
+            return probe_fcdeck(path)
+        elif backend == "sqlite":
+            return probe_sqlite(path)
+        else:
+            return probe_json(path)
+    except (OSError, ValueError):
+        return None
+
+
+def probe_json(path):
+    """Check the opening of a JSON topic file and look up its topic count."""
+
+    with open(path, "rb") as f:
+        head = f.read(HEAD_SIZE)
+
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if not text.startswith(b"["):
+        return None
+
+    first = text[1:].lstrip(b" \t\r\n")[:1]
+    if first == b"]":
+        return DeckInfo(path, "json", 0)
+    if first != b"{":
+        return None
+    if b'"topic_name"' not in head and b'"prompts"' not in head:
+        # A small file was read in full so the keys are missing, not just unread
+        if len(head) < HEAD_SIZE:
+            return None
+
+    return DeckInfo(path, "json", read_index(path).get("topic_count"))
+
+
+def probe_fcdeck(path):
+    """Read the header of a compiled deck."""
+
+    with open(path, "rb") as f:
+        header = f.read(fcdeck.HEADER.size)
+
+    if len(header) < fcdeck.HEADER.size:
+        return None
+
+    magic, version, topic_count = fcdeck.HEADER.unpack(header)[:3]
+    if magic != fcdeck.MAGIC or version != fcdeck.VERSION:
+        return None
+
+    return DeckInfo(path, "fcdeck", topic_count)
+
+
+def probe_sqlite(path):
+    """Check the file is an SQLite database and count its topics."""
+
+    with open(path, "rb") as f:
+        if f.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+            return None
+
+    # Only imported once an SQLite deck is found so startup doesn't wait on it
+    import sqlite3
+
+    connection = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        (topic_count,) = connection.execute("SELECT count(*) FROM topics").fetchone()
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        connection.close()
+
+    return DeckInfo(path, "sqlite", topic_count)
+
+
+def read_index(path):
+    """Get the index entry of a deck if it matches the current file.
+
+    Args:
+        path: The path of the deck.
+
+    Returns:
+        The dict stored for the deck, or an empty dict if there is no entry or
+            the file has changed since it was stored.
+    """
+
+    try:
+        with open(path.with_name(INDEX_NAME)) as f:
+            entry = json.load(f).get(path.name, {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+    stat = path.stat()
+    if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+        return {}
+
+    return entry
+
+
+def record_deck(filepath, topic_file):
+    """Store the topic count of a deck that has been read in full.
+
+    The entry is written to the index file in the deck's directory so later
+    probes of the unchanged file know the topic count. Failing to write the
+    index is not an error, probes will just not know the topic count.
+
+    Args:
+        filepath: The path of the deck.
+        topic_file: The handler the deck was read into.
+    """
+
+    path = Path(filepath)
+    index_path = path.with_name(INDEX_NAME)
+    stat = path.stat()
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "topic_count": len(topic_file.topics),
+    }
+
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if not isinstance(index, dict):
+            index = {}
+    except (OSError, ValueError):
+        index = {}
+
+    if index.get(path.name) == entry:
+        return
+
+    index[path.name] = entry
+    temp_path = index_path.with_name(INDEX_NAME + ".tmp")
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(temp_path, index_path)
+    except OSError:
+        pass
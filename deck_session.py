@@ -0,0 +1,443 @@
+"""Module for FlashCards App that runs through the prompts of a deck.
+
+DeckSession holds where a user is in a run through the prompts of a
+JSONTopicHandler: the prompt being shown, whether its answer is shown and
+whether the prompts have run out. It has no widgets, so the display prompts
+screen wraps one and the same session can be driven from a terminal or a
+script.
+
+A session is also an iterator over its prompts. Each step moves on to the
+next prompt with its answer hidden, recording a review of the prompt before it
+if its answer was shown, unless grading the prompt has already moved on:
+    session = DeckSession(topic_file)
+    for prompt in session:
+        session.reveal()
+
+Classes:
+    Prompt
+    DeckSession
+
+Run this script with a deck file to run through its prompts in the terminal,
+or with --batch to read typed answers from stdin and report how many prompts
+were run through each second. --metrics and --profile write timings of the
+run, see the instrumentation module.
+"""
+
+import sys
+import time
+
+from collections import namedtuple
+from pathlib import Path
+
+from answer_check import AnswerChecker
+from handle_json import ORDER_MODES
+from handle_json import ORDER_RANDOM
+from handle_json import ORDER_SCHEDULED
+from handle_json import open_deck
+from instrumentation import configure
+from instrumentation import metrics
+from review_log import NO_GRADE
+from scheduler import GRADES
+from scheduler import card_key
+
+# The prompt being shown: its position in the session, its card, and the
+# prompt and answer strings
+Prompt = namedtuple("Prompt", ["index", "card", "prompt", "answer"])
+
+
+class DeckSession:
+    """A run through the ordered prompts of a deck.
+
+    The prompts must already be collected and ordered, for example by
+    refresh_prompts or schedule_prompts. Moving past the last prompt sets
+    end_of_prompts rather than raising IndexError, as a spaced repetition
+    session only finds out it has run out when it is indexed.
+
+    Attributes:
+        topic_file
+        review_log
+        answer_checker
+        prompt_index
+        showing_answer
+        end_of_prompts
+    """
+
+    def __init__(self, topic_file, review_log=None, answer_checker=None):
+        """Initialise a session that has not started yet.
+
+        Args:
+            topic_file: A JSONTopicHandler with its prompts ordered.
+            review_log: The review_log.ReviewLog that reviews are recorded in,
+                or None to not record them.
+            answer_checker: The answer_check.AnswerChecker for the deck's
+                answers. One is made the first time an answer is checked if
+                not given.
+        """
+
+        self.topic_file = topic_file
+        self.review_log = review_log
+        self.answer_checker = answer_checker
+        self.reset()
+
+    def reset(self, topic_file=None):
+        """Go back to before the first prompt.
+
+        Args:
+            topic_file: A JSONTopicHandler to run through the prompts of
+                instead, or None to keep the same one.
+        """
+
+        if topic_file is not None:
+            self.topic_file = topic_file
+        self.prompt_index = 0
+        self.showing_answer = False
+        self.end_of_prompts = False
+        self.started = False
+        # The index of the prompt last given by the iterator
+        self.iterated_index = -1
+
+    def __len__(self):
+        return self.topic_file.number_of_prompts()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Move on to the next prompt with its answer hidden.
+
+        Raises:
+            StopIteration: There are no more prompts.
+        """
+
+        if not self.started:
+            self.start()
+        elif self.prompt_index <= self.iterated_index:
+            self.advance()
+        if self.end_of_prompts:
+            raise StopIteration
+
+        self.iterated_index = self.prompt_index
+        return self.current()
+
+    @property
+    def scheduled(self):
+        """True if the prompts are from a spaced repetition session."""
+
+        return self.topic_file.order_mode == ORDER_SCHEDULED
+
+    def current(self):
+        """Get the Prompt being shown.
+
+        Raises:
+            IndexError: The prompts have run out.
+        """
+
+        card = self.topic_file.prompt_order[self.prompt_index]
+        return Prompt(
+            self.prompt_index,
+            card,
+            self.topic_file.prompt_column[card],
+            self.topic_file.answer_column[card],
+        )
+
+    def start(self):
+        """Show the first prompt with its answer hidden.
+
+        Returns:
+            True if there is a first prompt. A spaced repetition session with
+                no prompts due has none.
+        """
+
+        self.reset()
+        self.started = True
+        self.seek(0)
+
+        return not self.end_of_prompts
+
+    def seek(self, index):
+        """Show the prompt at index with its answer hidden, if there is one."""
+
+        self.prompt_index = index
+        self.showing_answer = False
+        try:
+            self.topic_file.get_value(index, "prompt")
+        except IndexError:
+            self.end_of_prompts = True
+
+    def reveal(self):
+        """Show the answer of the prompt being shown.
+
+        Returns:
+            The answer.
+        """
+
+        answer = self.topic_file.get_value(self.prompt_index, "answer")
+        self.showing_answer = True
+
+        return answer
+
+    def advance(self, grade=NO_GRADE):
+        """Move on to the next prompt with its answer hidden.
+
+        Moving on from a shown answer records the review in the review log.
+
+        Args:
+            grade: The grade the prompt being left was given, if any.
+
+        Returns:
+            True if there is a next prompt.
+        """
+
+        if self.showing_answer:
+            self.record_review(grade)
+        self.seek(self.prompt_index + 1)
+
+        return not self.end_of_prompts
+
+    def step(self, grade=NO_GRADE):
+        """Show the answer if it is hidden, otherwise move on to the next prompt.
+
+        Args:
+            grade: The grade the prompt being left was given, if any.
+
+        Returns:
+            True unless the prompts have run out.
+        """
+
+        if self.showing_answer:
+            return self.advance(grade)
+
+        self.reveal()
+        return True
+
+    def previous(self):
+        """Go back to the previous prompt with its answer shown.
+
+        Returns:
+            True if there was a previous prompt to go back to.
+        """
+
+        if self.prompt_index == 0:
+            return False
+
+        self.prompt_index -= 1
+        self.showing_answer = True
+        self.end_of_prompts = False
+
+        return True
+
+    def grade(self, quality, now=None):
+        """Grade the prompt being shown for spaced repetition then move on.
+
+        Only prompts from a spaced repetition session with their answer shown
+        can be graded.
+
+        Args:
+            quality: How well the answer was remembered, one of scheduler.GRADES.
+            now: The time of the review. Defaults to the current time.
+
+        Returns:
+            The time the prompt is next due, or None if it can't be graded.
+        """
+
+        if not self.scheduled or not self.showing_answer:
+            return None
+
+        due = self.topic_file.prompt_order.grade(self.prompt_index, quality, now)
+        self.advance(quality)
+
+        return due
+
+    def check_answer(self, typed):
+        """Check an answer typed for the prompt being shown.
+
+        Args:
+            typed: The answer typed by the user.
+
+        Returns:
+            An answer_check.AnswerResult.
+        """
+
+        if (
+            self.answer_checker is None
+            or self.answer_checker.answer_column is not self.topic_file.answer_column
+        ):
+            self.answer_checker = AnswerChecker(
+                self.topic_file.answer_column, self.topic_file.card_range
+            )
+
+        card = self.topic_file.prompt_order[self.prompt_index]
+        return self.answer_checker.check(card, typed)
+
+    def record_review(self, grade):
+        """Add the prompt being shown to the review log, if there is one.
+
+        Args:
+            grade: The grade the prompt was given, or NO_GRADE.
+        """
+
+        metrics.count("session.reviews")
+        if self.review_log is None:
+            return
+
+        card = self.topic_file.prompt_order[self.prompt_index]
+        key = card_key(
+            self.topic_file.topic_of_card(card), self.topic_file.prompt_column[card]
+        )
+        self.review_log.record(key, grade)
+
+
+def open_session(args):
+    """Open the deck given on the command line and order its prompts.
+
+    Returns:
+        The DeckSession, and the ReviewLog it records to or None.
+    """
+
+    # Only imported when needed, like the app does for spaced repetition
+    from review_log import ReviewLog
+    from scheduler import Scheduler
+
+    topic_file = open_deck(args.deck, args.backend)
+    topics = args.topic or topic_file.topics
+    if topic_file.set_topics(topics, True) != len(set(topics)):
+        print("Unknown topics ignored", file=sys.stderr)
+
+    review_log = None if args.history is None else ReviewLog(args.history)
+    if args.scheduled:
+        if review_log is None:
+            scheduler = Scheduler()
+        else:
+            scheduler = review_log.load_scheduler()
+        topic_file.schedule_prompts(scheduler)
+    else:
+        topic_file.prompts_from_chosen_topics()
+        topic_file.randomise_prompts(seed=args.seed, mode=args.order)
+
+    return DeckSession(topic_file, review_log), review_log
+
+
+def run_terminal(session):
+    """Run through a session in the terminal, reading answers from the user.
+
+    Returns:
+        The number of prompts shown and the number answered correctly.
+    """
+
+    shown = correct = 0
+    for prompt in session:
+        shown += 1
+        print(
+            "[" + str(prompt.index + 1) + "/" + str(len(session)) + "] " + prompt.prompt
+        )
+        typed = input("Your answer (q to quit): ")
+        if typed == "q":
+            break
+
+        print("Answer: " + session.reveal())
+        if typed.strip():
+            result = session.check_answer(typed)
+            correct += result.correct
+            print("Correct!" if result.correct else "Incorrect")
+        if session.scheduled:
+            quality = input("Grade 0-5: ")
+            if quality.isdigit() and int(quality) in GRADES:
+                session.grade(int(quality))
+
+    return shown, correct
+
+
+def run_batch(session, answers, output):
+    """Run through a session answering each prompt with a line of answers.
+
+    Each prompt has its answer revealed, and is checked against the next line
+    of answers if there is one and graded with the suggested grade in a spaced
+    repetition session. A blank line skips the prompt, as in run_terminal. A
+    tab separated line of the prompt index, the result and the match kind is
+    written to output for each checked answer.
+
+    Returns:
+        The number of prompts shown and the number answered correctly.
+    """
+
+    shown = correct = 0
+    for prompt in session:
+        shown += 1
+        session.reveal()
+        typed = answers.readline()
+        if not typed.strip():
+            continue
+
+        result = session.check_answer(typed.rstrip("\n"))
+        correct += result.correct
+        output.write(
+            str(prompt.index)
+            + "\t"
+            + str(result.correct)
+            + "\t"
+            + str(result.match)
+            + "\n"
+        )
+        if session.scheduled:
+            session.grade(result.grade)
+
+    return shown, correct
+
+
+def main(argv=None):
+    """Run a session over the deck given on the command line.
+
+    Returns:
+        The exit status, 0 on success and 1 if the deck could not be opened.
+    """
+
+    # Imported here as the app imports this module at startup
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run FlashCards without a window")
+    parser.add_argument("deck", type=Path, help="deck file")
+    parser.add_argument("--topic", action="append", help="topic to run, default all")
+    parser.add_argument("--backend", help="deck backend, default from the suffix")
+    parser.add_argument("--order", choices=ORDER_MODES, default=ORDER_RANDOM)
+    parser.add_argument("--seed", type=int, help="seed for the prompt order")
+    parser.add_argument(
+        "--scheduled", action="store_true", help="only run prompts due for review"
+    )
+    parser.add_argument("--history", type=Path, help="review history directory")
+    parser.add_argument(
+        "--batch", action="store_true", help="read typed answers from stdin"
+    )
+    parser.add_argument("--metrics", help="write timings as JSON here on exit")
+    parser.add_argument("--profile", help="write a cProfile .pstats file here on exit")
+    args = parser.parse_args(argv)
+    configure(args.metrics, args.profile)
+
+    start = time.perf_counter()
+    try:
+        session, review_log = open_session(args)
+    except (OSError, ValueError) as err:
+        # InvalidDeckError is a ValueError
+        print("Could not open " + str(args.deck) + ": " + str(err), file=sys.stderr)
+        return 1
+    opened = time.perf_counter()
+    try:
+        if args.batch:
+            shown, correct = run_batch(session, sys.stdin, sys.stdout)
+        else:
+            shown, correct = run_terminal(session)
+    finally:
+        if review_log is not None:
+            review_log.close()
+    finished = time.perf_counter()
+
+    print(
+        "{} prompts, {} correct. Opened in {:.3f}s, {:.0f} prompts/s".format(
+            shown, correct, opened - start, shown / max(finished - opened, 1e-9)
+        ),
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
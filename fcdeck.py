@@ -0,0 +1,274 @@
+"""Module for FlashCards App that provides compiled binary deck support.
+
+A FlashCards JSON topic file can be compiled into a .fcdeck file which can be
+opened without parsing the whole file. The deck is memory mapped and a prompt
+or answer is only decoded from the file when it is accessed.
+
+Layout of a .fcdeck file, all integers are little-endian:
+    header: magic, version, topic count, card count, and the byte offsets of
+        the topic table, string offset table and string heap.
+    topic table: a (card_start, card_stop) pair of uint64 for each topic.
+    string offset table: 2 * card count + topic count + 1 uint64 offsets into
+        the string heap. String i runs from offset i to offset i + 1. Card c
+        has its prompt at string 2 * c and its answer at string 2 * c + 1, and
+        the topic names follow the cards.
+    string heap: every string encoded as UTF-8 with no separators.
+
+Classes:
+    HeapColumn
+    FCDeckTopicHandler(JSONTopicHandler)
+
+Run this script with JSON topic files as arguments to compile them, or with no
+arguments to compile every JSON file in the resources directory.
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from pathlib import Path
+
+from handle_json import InvalidDeckError
+from handle_json import JSONTopicHandler
+
+DECK_SUFFIX = ".fcdeck"
+MAGIC = b"FCDECK"
+VERSION = 1
+# magic, version, topic count, card count, topic table, offset table, heap
+HEADER = struct.Struct("<6sHIIQQQ")
+OFFSET_SIZE = 8
+
+
+class HeapColumn:
+    """A read only column of strings stored in the string heap of a deck.
+
+    Behaves like the prompt_column and answer_column lists of JSONTopicHandler
+    but only decodes a string when it is indexed.
+    """
+
+    def __init__(self, heap, offsets, field, length):
+        """Initialise the column over a deck's string heap.
+
+        Args:
+            heap: A memoryview of the string heap.
+            offsets: The string offset table of the deck.
+            field: 0 for the prompt column and 1 for the answer column.
+            length: The number of cards in the deck.
+        """
+
+        self.heap = heap
+        self.offsets = offsets
+        self.field = field
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, card):
+        if card < 0:
+            card += self.length
+        if not 0 <= card < self.length:
+            raise IndexError("card index out of range")
+
+        return decode_string(self.heap, self.offsets, 2 * card + self.field)
+
+
+class FCDeckTopicHandler(JSONTopicHandler):
+    """A compiled FlashCards deck file.
+
+    The deck file is memory mapped and its prompt and answer columns are
+    HeapColumns that decode a string from the mapped heap each time it is
+    indexed. Opening a deck only reads the header and decodes the topic names,
+    so the time taken does not depend on the number of cards.
+
+    Attributes:
+        deck_map
+    """
+
+    @classmethod
+    def get_js(cls, fname):
+        """Overrides JSONHandler to memory map the deck file instead of parsing it."""
+
+        with open(fname, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def build_columns(self):
+        """Overrides JSONTopicHandler to read the topic table of the mapped deck.
+
+        Returns:
+            A dict keyed by topic name with the (start, stop) range of that
+                topic's cards as the value.
+
+        Raises:
+            InvalidDeckError: The file is not a compiled deck or is truncated.
+        """
+
+        self.deck_map = self.raw_string
+        if len(self.deck_map) < HEADER.size:
+            raise InvalidDeckError(self.fpath)
+
+        (
+            magic,
+            version,
+            topic_count,
+            card_count,
+            topic_table,
+            offset_table,
+            heap_start,
+        ) = HEADER.unpack_from(self.deck_map)
+        if magic != MAGIC:
+            raise InvalidDeckError(self.fpath)
+        if version != VERSION:
+            raise InvalidDeckError(self.fpath, "Unsupported deck version")
+
+        ranges = self.read_table(topic_table, 2 * topic_count)
+        offsets = self.read_table(offset_table, 2 * card_count + topic_count + 1)
+        heap = memoryview(self.deck_map)[heap_start:]
+        if offsets[-1] > len(heap):
+            raise InvalidDeckError(self.fpath, "Truncated deck file")
+
+        self.prompt_column = HeapColumn(heap, offsets, 0, card_count)
+        self.answer_column = HeapColumn(heap, offsets, 1, card_count)
+
+        topic_index = {}
+        for t in range(topic_count):
+            name = decode_string(heap, offsets, 2 * card_count + t)
+            topic_index[name] = (ranges[2 * t], ranges[2 * t + 1])
+
+        return topic_index
+
+    def resident_bytes(self):
+        """Overrides JSONTopicHandler as prompts stay in the mapped file."""
+
+        return self.topic_index_bytes()
+
+    def read_table(self, start, count):
+        """Get a table of uint64 values from the mapped deck.
+
+        The table is viewed in place on little-endian machines and copied
+        otherwise.
+
+        Args:
+            start: The byte offset of the table in the deck.
+            count: The number of values in the table.
+
+        Returns:
+            An indexable sequence of ints.
+
+        Raises:
+            InvalidDeckError: The table runs past the end of the file.
+        """
+
+        stop = start + count * OFFSET_SIZE
+        if stop > len(self.deck_map):
+            raise InvalidDeckError(self.fpath, "Truncated deck file")
+
+        if sys.byteorder == "little":
+            return memoryview(self.deck_map)[start:stop].cast("Q")
+
+        table = array("Q", self.deck_map[start:stop])
+        table.byteswap()
+        return table
+
+
+def decode_string(heap, offsets, string):
+    """Decode string number string from a deck's string heap."""
+
+    return str(heap[offsets[string] : offsets[string + 1]], "utf-8")
+
+
+def write_table(f, values):
+    """Write values to f as a table of little-endian uint64."""
+
+    table = array("Q", values)
+    if sys.byteorder != "little":
+        table.byteswap()
+    table.tofile(f)
+
+
+def compile_deck(json_path, deck_path=None):
+    """Compile a FlashCards JSON topic file into a .fcdeck file.
+
+    The deck is written to a temporary file that then replaces deck_path, so
+    a compile stopped part way never leaves a broken deck to be reused.
+
+    Args:
+        json_path: The path of the JSON topic file to compile.
+        deck_path: The path to write the deck to. Defaults to json_path with the
+            .fcdeck suffix.
+
+    Returns:
+        The path of the compiled deck.
+    """
+
+    if deck_path is None:
+        deck_path = Path(json_path).with_suffix(DECK_SUFFIX)
+    deck_path = Path(deck_path)
+    temp_path = deck_path.with_name(deck_path.name + ".tmp")
+
+    topic_file = JSONTopicHandler(json_path)
+    card_count = len(topic_file.prompt_column)
+    topic_count = len(topic_file.topic_index)
+
+    topic_table = HEADER.size
+    offset_table = topic_table + 2 * topic_count * OFFSET_SIZE
+    heap_start = offset_table + (2 * card_count + topic_count + 1) * OFFSET_SIZE
+
+    with open(temp_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                topic_count,
+                card_count,
+                topic_table,
+                offset_table,
+                heap_start,
+            )
+        )
+        ranges = []
+        for start, stop in topic_file.topic_index.values():
+            ranges.extend((start, stop))
+        write_table(f, ranges)
+
+        # The heap is written before the offset table that points into it
+        f.seek(heap_start)
+        offsets = [0]
+        for card in range(card_count):
+            for string in (
+                topic_file.prompt_column[card],
+                topic_file.answer_column[card],
+            ):
+                offsets.append(offsets[-1] + f.write(string.encode("utf-8")))
+        for name in topic_file.topic_index:
+            offsets.append(offsets[-1] + f.write(name.encode("utf-8")))
+
+        f.seek(offset_table)
+        write_table(f, offsets)
+    os.replace(temp_path, deck_path)
+
+    return deck_path
+
+
+def main(argv=None):
+    """Compile the JSON topic files given on the command line."""
+
+    # Imported here as the app imports this module at startup to probe decks
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile FlashCards JSON topic files")
+    parser.add_argument("files", nargs="*", type=Path, help="JSON topic files")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(Path.cwd().joinpath("resources").glob("*.json"))
+    for json_path in files:
+        try:
+            print("Compiled: " + str(compile_deck(json_path)))
+        except ValueError:
+            print("Not a valid FlashCards file: " + str(json_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,96 @@
 """Module for FlashCards App that provides JSON file reading support.
 
-Provides file reading and storage of the topics and prompts that are to be 
+Provides file reading and storage of the topics and prompts that are to be
 displayed by FlashCards. All data from the file is stored as a string but can
 then be accessed using public methods from JSONTopicHandler.
 
 Classes:
     JSONHandler
     JSONTopicHandler(JSONHandler)
+    PromptView
+    ShuffledOrder
+    LazyColumn
+    LazyTopicHandler(JSONTopicHandler)
     InvalidKeyError(Exception)
+    InvalidDeckError(ValueError)
 
-JSONHandler behaves as a base class. JSONTopicHandler inherits from JSONHandler 
-to gain JSON file metadata and file reading capabilities. 
+Functions:
+    json_parser
+    read_json_bytes
+    parse_json_bytes
+    parse_json_file
+    open_deck
+
+JSONHandler behaves as a base class. JSONTopicHandler inherits from JSONHandler
+to gain JSON file metadata and file reading capabilities.
 """
 
+import copy
+import importlib
 import json
-import jsonschema
+import logging
+import mmap
+import os
 import random
+import sys
 
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
 from pathlib import Path
 
+from background import report_progress
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Orderings that randomise_prompts can arrange the prompts in
+ORDER_RANDOM = "random"
+ORDER_SEQUENTIAL = "sequential"
+ORDER_INTERLEAVE = "interleave"
+ORDER_MODES = (ORDER_RANDOM, ORDER_SEQUENTIAL, ORDER_INTERLEAVE)
+# The order of prompts from schedule_prompts, by when they are due for review
+ORDER_SCHEDULED = "scheduled"
+# The order of prompts from match_prompts, the results of a search
+ORDER_SEARCH = "search"
+# Orders that set_topic keeps up to date rather than collecting them again
+INCREMENTAL_ORDERS = (ORDER_RANDOM, ORDER_SEQUENTIAL)
+
+# Bytes read from a JSON file between each progress report
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Maps each JSON parser to its module, its parse function and whether it can
+# parse a memoryview as well as bytes, fastest first. The first one installed
+# is used unless the FLASHCARDS_JSON_PARSER environment variable names another.
+JSON_PARSERS = {
+    "orjson": ("orjson", "loads", True),
+    "json": ("json", "loads", False),
+}
+JSON_PARSER_ENV = "FLASHCARDS_JSON_PARSER"
+# JSON files at least this many bytes are memory mapped instead of read, when
+# the parser can parse a memoryview
+MMAP_MIN_SIZE = 64 * 1024 * 1024
+
+# Maps each deck backend to the module and handler class that read it and the
+# function that converts a JSON topic file to it. Modules are imported when a
+# deck using them is opened.
+DECK_BACKENDS = {
+    "json": ("handle_json", "JSONTopicHandler", None),
+    "fcdeck": ("fcdeck", "FCDeckTopicHandler", "compile_deck"),
+    "sqlite": ("sqlite_deck", "SQLiteTopicHandler", "import_json"),
+    "stream": ("stream_deck", "StreamingTopicHandler", None),
+    "budget": ("stream_deck", "BudgetedTopicHandler", None),
+}
+# File suffixes of decks that are not JSON topic files
+BACKEND_SUFFIXES = {".fcdeck": "fcdeck", ".fcdb": "sqlite"}
+# JSON topic files of at least this many bytes are opened with the stream
+# backend unless another is asked for, as parsing them whole takes several
+# times their size in memory
+STREAM_MIN_SIZE = 256 * 1024 * 1024
+# Set to a number of bytes to open every JSON topic file with the budget
+# backend, keeping at most that many bytes of prompts in memory
+DECK_BUDGET_ENV = "FLASHCARDS_DECK_BUDGET"
+
 
 class InvalidKeyError(Exception):
     """An invalid key has been used to access a JSON object.
@@ -45,6 +117,26 @@ class InvalidKeyError(Exception):
         super().__init__(self.message)
 
 
+class InvalidDeckError(ValueError):
+    """A file could not be read as a FlashCards deck.
+
+    Inherits from ValueError so it is handled the same way as a JSON file that
+    fails to decode.
+    """
+
+    def __init__(self, fpath, message="Not a valid FlashCards deck file"):
+        """Initialise exception object with the file path and a custom message.
+
+        Args:
+            fpath: The path of the file that could not be read.
+            message: The error message describing what is wrong with the file.
+        """
+
+        self.fpath = fpath
+        self.message = message
+        super().__init__(self.message + ": " + str(fpath))
+
+
 class JSONHandler:
     """JSON file to be used by FlashCards."""
 
@@ -60,7 +152,7 @@ class JSONHandler:
 
         self.fpath = in_filepath
         self.fname = Path(in_filepath).name
-        self.raw_string = JSONHandler.get_js(in_filepath)
+        self.raw_string = self.get_js(in_filepath)
 
     def output_string(self):
         print(self.raw_string)
@@ -73,22 +165,239 @@ class JSONHandler:
 
     @classmethod
     def get_js(cls, fname):
-        f = open(fname)
-        data = json.load(f)
+        return parse_json_file(fname)
+
+
+class PromptView:
+    """A read only sequence of the cards from the chosen topics.
+
+    The cards of a topic fill one contiguous range, so the view only stores
+    the card range of each chosen topic and the number of cards before it
+    instead of a copy of every card. Indexing the view finds the topic holding
+    that position with a binary search over the cumulative counts.
+    """
+
+    def __init__(self):
+        """Initialise an empty view."""
+
+        # The first card of each range
+        self.starts = array("l")
+        # The position in the view of the first card of each range, followed by
+        # the length of the view
+        self.offsets = array("l", [0])
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("prompt index out of range")
+
+        # Empty ranges share an offset with the next range, bisect_right skips
+        # past them to the range that holds index
+        range_index = bisect_right(self.offsets, index) - 1
+        return self.starts[range_index] + index - self.offsets[range_index]
+
+    def __iter__(self):
+        for start, stop in self.ranges():
+            yield from range(start, stop)
+
+    def ranges(self):
+        """Yield the (start, stop) card range of each topic in the view."""
+
+        for range_index, start in enumerate(self.starts):
+            length = self.offsets[range_index + 1] - self.offsets[range_index]
+            yield start, start + length
+
+    def cards(self):
+        """Get a copy of every card in the view as an array."""
+
+        cards = array("l")
+        for start, stop in self.ranges():
+            cards.extend(range(start, stop))
+
+        return cards
+
+    def add_range(self, start, stop):
+        """Add the cards from start up to but not including stop to the end.
+
+        Empty ranges are skipped so every range in the view has its own start.
+        """
+
+        if stop > start:
+            self.starts.append(start)
+            self.offsets.append(self.offsets[-1] + stop - start)
+
+    def remove_range(self, start, stop):
+        """Remove a range that was added with add_range.
+
+        Takes time linear to the number of ranges in the view, not the number of
+        cards.
+        """
+
+        if stop <= start:
+            return
+
+        range_index = self.starts.index(start)
+        del self.starts[range_index]
+        del self.offsets[range_index + 1]
+        # Every later range now starts stop - start positions sooner
+        for i in range(range_index + 1, len(self.offsets)):
+            self.offsets[i] -= stop - start
 
-        return data
+
+class ShuffledOrder:
+    """A random order of cards that can be shuffled again in constant time.
+
+    reshuffle only marks every position as unshuffled. Reading a position
+    past the shuffled ones finishes the steps of a Fisher-Yates shuffle up to
+    it, so a session that shows the prompts in turn pays for each prompt as
+    it is shown. Whatever order the cards were in before, the positions read
+    after reshuffle are a uniform shuffle.
+
+    Cards can be added and removed in time independent of the number of
+    cards, using a map from each card to its position.
+    """
+
+    def __init__(self, cards, rng, num_cards):
+        """Initialise an order of already shuffled cards.
+
+        Args:
+            cards: An array of the shuffled cards, used as the order.
+            rng: The random.Random instance used to shuffle.
+            num_cards: The number of cards in the deck, every card is less.
+        """
+
+        self.cards = cards
+        self.rng = rng
+        self.num_cards = num_cards
+        # Positions before this one are shuffled
+        self.shuffled = len(cards)
+        # The position of each card of the deck, built on first use
+        self.positions = None
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.cards)
+        if not 0 <= index < len(self.cards):
+            raise IndexError("prompt index out of range")
+        if index >= self.shuffled:
+            self.shuffle_to(index)
+
+        return self.cards[index]
+
+    def shuffle_to(self, index):
+        """Shuffle every position up to and including index."""
+
+        cards = self.cards
+        positions = self.positions
+        rng = self.rng
+        stop = min(index + 1, len(cards))
+        for i in range(self.shuffled, stop):
+            j = rng.randrange(i, len(cards))
+            cards[i], cards[j] = cards[j], cards[i]
+            if positions is not None:
+                positions[cards[i]] = i
+                positions[cards[j]] = j
+        self.shuffled = max(self.shuffled, stop)
+
+    def reshuffle(self):
+        """Shuffle the order again, as each position is next read."""
+
+        self.shuffled = 0
+
+    def card_positions(self):
+        """Get the array mapping each card to its position, building it once.
+
+        The array is indexed by card so it has an entry for every card in the
+        deck.
+        """
+
+        if self.positions is None:
+            positions = array("l", [0]) * self.num_cards
+            for position, card in enumerate(self.cards):
+                positions[card] = position
+            self.positions = positions
+
+        return self.positions
+
+    def add(self, card):
+        """Add a card to the order.
+
+        In a shuffled order the card is swapped into a uniformly random
+        position, a step of the inside-out Fisher-Yates shuffle, so the order
+        stays a uniform shuffle of its cards. Otherwise it is added to the
+        positions still to be shuffled.
+        """
+
+        cards = self.cards
+        positions = self.card_positions()
+        fully_shuffled = self.shuffled == len(cards)
+        position = len(cards)
+        if fully_shuffled:
+            position = self.rng.randrange(len(cards) + 1)
+        if position == len(cards):
+            cards.append(card)
+        else:
+            moved = cards[position]
+            positions[moved] = len(cards)
+            cards.append(moved)
+            cards[position] = card
+        positions[card] = position
+        if fully_shuffled:
+            self.shuffled = len(cards)
+
+    def remove(self, card):
+        """Remove a card by moving the last card into its position.
+
+        A shuffled order stays a uniform shuffle of its cards. Otherwise the
+        moved card is among the positions still to be shuffled.
+        """
+
+        cards = self.cards
+        positions = self.card_positions()
+        fully_shuffled = self.shuffled == len(cards)
+        position = positions[card]
+        last = cards.pop()
+        if position < len(cards):
+            cards[position] = last
+            positions[last] = position
+        if fully_shuffled:
+            self.shuffled = len(cards)
+        else:
+            self.shuffled = min(self.shuffled, position, len(cards))
 
 
 class JSONTopicHandler(JSONHandler):
     """A JSON file containing FlashCard topics and prompts.
 
     Inherits file metadata and the raw string of the JSON file from JSONHandler
-    which just acts as a base class.
+    which just acts as a base class. Once read, the prompts and answers are
+    stored column-wise and the raw string is released. A card is an index into
+    prompt_column and answer_column, and the cards of each topic sit in one
+    contiguous range.
+
+    Once the prompts have been collected they are kept up to date as single
+    topics are picked. In the random order the prompts of an added topic are
+    shuffled in at random positions and the prompts of a removed topic are
+    taken out, so the cost depends on the size of the topic. The sequential
+    order follows all_prompts, and any other order is rebuilt by
+    refresh_prompts or schedule_prompts.
 
     Attributes:
         topics
+        topic_index
+        prompt_column
+        answer_column
         chosen_topics
         all_prompts
+        prompt_order
+        order_mode
     """
 
     def __init__(self, filepath):
@@ -102,9 +411,69 @@ class JSONTopicHandler(JSONHandler):
 
         super().__init__(filepath)
 
+        self.prompt_column = []
+        self.answer_column = []
+        # Maps each topic name to its (start, stop) range of cards
+        self.topic_index = self.build_columns()
         self.topics = self.extract_topics()
-        self.chosen_topics = []
-        self.all_prompts = []
+        # The first card of each topic, in card order, used to find a card's topic
+        self.topic_starts = array(
+            "l", (start for start, stop in self.topic_index.values())
+        )
+        # The parsed JSON is no longer needed once the columns have been built
+        self.raw_string = None
+
+        self.clear_selection()
+
+    def clear_selection(self):
+        """Reset the chosen topics and the prompts collected from them."""
+
+        # A dict is used as an insertion ordered set of the chosen topic names
+        self.chosen_topics = {}
+        # The cards from the chosen topics
+        self.all_prompts = PromptView()
+        # The cards in the order prompts are to be displayed
+        self.prompt_order = range(0)
+        # The order mode prompt_order is kept up to date in, None until the
+        # prompts are collected or when they need collecting again
+        self.order_mode = None
+
+    def copy(self):
+        """Get a handler for the same deck with no topics chosen.
+
+        The copy shares the stored topics and prompts with this handler so it
+        can be made without reading the file again.
+
+        Returns:
+            A new handler of the same class as this one.
+        """
+
+        new_handler = copy.copy(self)
+        new_handler.clear_selection()
+
+        return new_handler
+
+    def resident_bytes(self):
+        """Estimate the bytes of memory used to store the deck.
+
+        Returns:
+            The size of the topic index and the prompt and answer columns.
+        """
+
+        size = self.topic_index_bytes()
+        for column in (self.prompt_column, self.answer_column):
+            size += sys.getsizeof(column) + sum(map(sys.getsizeof, column))
+
+        return size
+
+    def topic_index_bytes(self):
+        """Estimate the bytes of memory used by the topic names and index."""
+
+        size = sys.getsizeof(self.topic_index) + sys.getsizeof(self.topics)
+        for topic, card_range in self.topic_index.items():
+            size += sys.getsizeof(topic) + sys.getsizeof(card_range)
+
+        return size
 
     def set_topic(self, in_topic):
         """Add or remove a topic from the list of chosen topics to be displayed to the user.
@@ -117,22 +486,111 @@ class JSONTopicHandler(JSONHandler):
             in_topic: The topic to add to chosen_topics.
         """
 
-        modified = False
-        if in_topic not in self.chosen_topics:
-            for element in self.topics:
-                if in_topic == element:
-                    self.chosen_topics.append(in_topic)
-                    print(in_topic + " added to chosen topics.")
-                    modified = True
+        if in_topic in self.chosen_topics:
+            del self.chosen_topics[in_topic]
+            self.remove_topic_prompts(in_topic)
+            logger.debug("%s removed from chosen topics.", in_topic)
+        elif in_topic in self.topic_index:
+            self.chosen_topics[in_topic] = None
+            self.add_topic_prompts(in_topic)
+            logger.debug("%s added to chosen topics.", in_topic)
         else:
-            index = self.chosen_topics.index(in_topic)
-            del self.chosen_topics[index]
-            print(in_topic + " removed from chosen topics.")
-            modified = True
+            # Provides an error message when attemping to choose invalid topic
+            logger.warning("'%s' is an invalid topic string", in_topic)
+
+    def set_topics(self, in_topics, selected=True):
+        """Add or remove many topics from the chosen topics at once.
+
+        Topics already in the requested state and topics that are not from the
+        file are skipped. Topics that are added keep the order of in_topics.
+        Collected prompts are not updated topic by topic, they are collected
+        again by the next refresh_prompts if anything changed.
 
-        # Provides an error message when attemping to choose invalid topic
-        if not modified:
-            print("'" + in_topic + "' is an invalid topic string")
+        Args:
+            in_topics: An iterable of topic names.
+            selected: True to add the topics to chosen_topics and False to remove
+                them.
+
+        Returns:
+            The number of topics that were added or removed.
+        """
+
+        if selected:
+            new_topics = [
+                topic
+                for topic in dict.fromkeys(in_topics)
+                if topic in self.topic_index and topic not in self.chosen_topics
+            ]
+            self.chosen_topics.update(dict.fromkeys(new_topics))
+            if new_topics:
+                self.order_mode = None
+            logger.debug("%d topics added to chosen topics.", len(new_topics))
+            return len(new_topics)
+
+        removed = 0
+        for topic in in_topics:
+            if self.chosen_topics.pop(topic, False) is None:
+                removed += 1
+        if removed:
+            self.order_mode = None
+        logger.debug("%d topics removed from chosen topics.", removed)
+        return removed
+
+    def topic_of_card(self, card):
+        """Get the name of the topic a card belongs to.
+
+        Args:
+            card: An index into prompt_column and answer_column.
+
+        Returns:
+            The topic name.
+        """
+
+        # Empty topics share their start with the next topic, bisect_right skips
+        # past them to the topic holding the card
+        return self.topics[bisect_right(self.topic_starts, card) - 1]
+
+    def card_range(self, card):
+        """Get the (start, stop) range of the cards in the topic of a card.
+
+        Args:
+            card: An index into prompt_column and answer_column.
+        """
+
+        return self.topic_index[self.topic_of_card(card)]
+
+    def topics_of_cards(self, cards):
+        """Get the topics holding any of the given cards.
+
+        Takes time depending on the number of topics found rather than the
+        number of cards, as the cards after each topic found are skipped to
+        with a binary search.
+
+        Args:
+            cards: A sorted sequence of cards, such as the results of a search.
+
+        Returns:
+            A list of topic names in card order.
+        """
+
+        topics = []
+        i = 0
+        while i < len(cards):
+            topic = self.topics[bisect_right(self.topic_starts, cards[i]) - 1]
+            topics.append(topic)
+            i = bisect_left(cards, self.topic_index[topic][1], i)
+
+        return topics
+
+    def topic_prompts(self, topic):
+        """Yield the card, prompt and answer of each card of a topic.
+
+        Args:
+            topic: The name of a topic from the file.
+        """
+
+        for card in range(*self.topic_index[topic]):
+            yield card, self.prompt_column[card], self.answer_column[card]
 
     def topic_is_selected(self, check_topic):
         """Check if a topic is selected by the user.
@@ -144,97 +602,294 @@ class JSONTopicHandler(JSONHandler):
             A boolean value with the result.
         """
 
-        if check_topic in self.chosen_topics:
-            return True
-        else:
-            return False
+        return check_topic in self.chosen_topics
 
     def prompts_from_chosen_topics(self):
         """Returns all the prompts from the chosen_topics.
 
+        No cards are copied, the prompts are returned as a view over the card
+        range of each chosen topic.
+
         Returns:
-            A list containing every prompt from the chosen topics. Each element
-                is a list of prompts from a specific topic.
+            A PromptView of the card of every prompt from the chosen topics,
+                grouped by topic in the order the topics were chosen.
         """
 
-        self.all_prompts = []
-        for topic in self.chosen_topics:
+        self.all_prompts = PromptView()
+        for i, topic in enumerate(self.chosen_topics):
+            report_progress(i, len(self.chosen_topics), "Collecting prompts")
             self.prompts_from_topic(topic)
 
+        self.prompt_order = self.all_prompts
+        self.order_mode = ORDER_SEQUENTIAL
+
         return self.all_prompts
 
+    def refresh_prompts(self, mode=ORDER_RANDOM):
+        """Collect the prompts of the chosen topics and put them in mode order.
+
+        Prompts that have been kept up to date in mode order as topics were
+        picked are not collected again, otherwise they are collected from
+        scratch and ordered. A random order kept up to date is shuffled again
+        as its prompts are shown, so each run of the same topics gets a new
+        shuffle and a run costs nothing up front.
+
+        Args:
+            mode: One of ORDER_MODES, passed to randomise_prompts.
+
+        Returns:
+            True if the prompts were collected from scratch.
+        """
+
+        collected = self.order_mode != mode
+        if collected:
+            self.prompts_from_chosen_topics()
+            report_progress(1, 1, "Shuffling prompts")
+            self.randomise_prompts(mode=mode)
+            if mode == ORDER_RANDOM:
+                # Built now rather than when the first topic is picked, as
+                # this runs on a background thread in the app
+                self.prompt_order.card_positions()
+        elif mode == ORDER_RANDOM:
+            self.prompt_order.reshuffle()
+
+        return collected
+
+    def add_topic_prompts(self, topic):
+        """Add the prompts of a newly chosen topic to the collected prompts.
+
+        In the random order each prompt is added with ShuffledOrder.add, so
+        the order stays a uniform shuffle of the chosen prompts.
+        """
+
+        if self.order_mode not in INCREMENTAL_ORDERS:
+            self.order_mode = None
+            return
+
+        self.prompts_from_topic(topic)
+        if self.order_mode != ORDER_RANDOM:
+            return
+
+        for card in range(*self.topic_index[topic]):
+            self.prompt_order.add(card)
+
+    def remove_topic_prompts(self, topic):
+        """Remove the prompts of a topic that is no longer chosen.
+
+        In the random order each prompt is removed with ShuffledOrder.remove,
+        which leaves the remaining prompts uniformly shuffled.
+        """
+
+        if self.order_mode not in INCREMENTAL_ORDERS:
+            self.order_mode = None
+            return
+
+        self.drop_prompts_from_topic(topic)
+        if self.order_mode != ORDER_RANDOM:
+            return
+
+        for card in range(*self.topic_index[topic]):
+            self.prompt_order.remove(card)
+
     def prompts_from_topic(self, search_topic):
         """Adds the prompts from a specific topic to the all_prompts attribute.
 
-        Modifies the class attribute all_prompts by adding a new element containing
-        each prompt from the searched topic that is stored in the JSON string
-        this object represents.
+        Modifies the class attribute all_prompts by adding the card range of the
+        searched topic.
 
         Args:
             search_topic: A string with the name of the topic you want the prompts
                 from.
         """
-        for topics in self.raw_string:
-            if topics["topic_name"] == search_topic:
-                # found topic
-                for prompt in topics["prompts"]:
-                    self.all_prompts.append(prompt)
+        card_range = self.topic_index.get(search_topic)
+        if card_range is not None:
+            self.all_prompts.add_range(*card_range)
+
+    def drop_prompts_from_topic(self, search_topic):
+        """Removes the prompts of a topic added by prompts_from_topic.
+
+        Args:
+            search_topic: A string with the name of the topic to remove the
+                prompts of.
+        """
+
+        card_range = self.topic_index.get(search_topic)
+        if card_range is not None:
+            self.all_prompts.remove_range(*card_range)
 
     def topic_string(self, modifier=0):
-        """Displays topics for debugging/logging purposes."""
+        """Logs topics for debugging purposes.
 
-        if modifier == 0:
-            print("Topics found in file: ")
-            for topic in self.topics:
-                print("    " + topic)
+        Nothing is formatted unless debug logging is enabled.
+        """
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
 
-        print("Topics chosen: ")
-        for topic in self.chosen_topics:
-            print("    " + topic)
+        if modifier == 0:
+            logger.debug("Topics found in file: %s", ", ".join(self.topics))
+        logger.debug("Topics chosen: %s", ", ".join(self.chosen_topics))
 
     def print_prompts(self):
-        """Displays prompts for debugging/logging purposes."""
+        """Logs prompts for debugging purposes.
+
+        Nothing is formatted unless debug logging is enabled.
+        """
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
 
         for i in range(self.number_of_prompts()):
-            print("Prompt: " + self.get_value(i, "prompt"))
-            print("Answer: " + self.get_value(i, "answer"))
+            logger.debug(
+                "Prompt: %s Answer: %s",
+                self.get_value(i, "prompt"),
+                self.get_value(i, "answer"),
+            )
 
     def number_of_prompts(self):
         """Returns the number of prompts stored for use in this object."""
 
-        return len(self.all_prompts)
+        return len(self.prompt_order)
 
     def get_value(self, index, key):
         """Get the string from a key/value pair which contains a prompt or answer.
 
         Args:
-            index: The index number to use to access the all_prompts list. This
-                number represents which prompt in the list to select the prompt from.
+            index: The position in prompt_order of the prompt to access. This
+                number represents which prompt in the displayed order to select
+                the prompt from.
             key: String value which specifies if looking for the prompt or the
                 answer to a prompt.
         """
         try:
-            if key == "prompt" or key == "answer":
-                return self.all_prompts[index][key]
+            if key == "prompt":
+                column = self.prompt_column
+            elif key == "answer":
+                column = self.answer_column
             else:
                 raise InvalidKeyError(key)
+
+            return column[self.prompt_order[index]]
         except InvalidKeyError:
             return "InvalidKeyError"
 
-    # Generate random numbers within range of length
-    def randomise_prompts(self):
-        """Randomise the list of prompts that are stored in this object."""
+    def randomise_prompts(self, seed=None, mode=ORDER_RANDOM):
+        """Arrange the order the prompts stored in this object are displayed in.
+
+        Only prompt_order is changed, all_prompts is left untouched. The
+        sequential order is all_prompts itself so needs no memory, the other
+        modes run in time linear to the number of prompts.
+
+        Args:
+            seed: Seed for the random number generator. Using the same seed with
+                the same chosen topics reproduces the same order. None seeds
+                from the system.
+            mode: One of ORDER_MODES. ORDER_RANDOM shuffles every prompt,
+                ORDER_SEQUENTIAL keeps the order from the file and
+                ORDER_INTERLEAVE shuffles each topic then takes one prompt from
+                each chosen topic in turn.
+
+        Returns:
+            The new prompt_order.
+
+        Raises:
+            ValueError: mode is not one of ORDER_MODES.
+        """
+
+        logger.debug("Randomising prompt order: %s", mode)
+        rng = random.Random(seed)
+        if mode == ORDER_RANDOM:
+            cards = self.all_prompts.cards()
+            rng.shuffle(cards)
+            order = ShuffledOrder(cards, rng, len(self.prompt_column))
+        elif mode == ORDER_SEQUENTIAL:
+            order = self.all_prompts
+        elif mode == ORDER_INTERLEAVE:
+            order = self.interleave_topics(rng)
+        else:
+            raise ValueError("Invalid order mode: " + str(mode))
+
+        self.prompt_order = order
+        if self.order_mode is not None:
+            # Only kept up to date once the prompts have been collected
+            self.order_mode = mode
+        return order
+
+    def schedule_prompts(self, scheduler, now=None):
+        """Order the prompts by when they are due for spaced repetition review.
+
+        Only the prompts that are due are shown, earliest due first. Grade each
+        prompt with the grade method of prompt_order.
+
+        Args:
+            scheduler: The scheduler.Scheduler holding the review schedule.
+            now: The time the session starts. Defaults to the current time.
+
+        Returns:
+            The new prompt_order, a scheduler.ReviewSession.
+        """
+
+        self.prompts_from_chosen_topics()
+        report_progress(1, 1, "Scheduling prompts")
+        self.prompt_order = scheduler.session(self, now)
+        self.order_mode = ORDER_SCHEDULED
+
+        return self.prompt_order
+
+    def match_prompts(self, cards, seed=None):
+        """Show only the given cards, such as the results of a search.
+
+        The cards are shown in a random order. chosen_topics is left as it is,
+        so the next refresh_prompts collects the prompts of the chosen topics
+        again.
+
+        Args:
+            cards: The cards to show.
+            seed: Seed for the random number generator, None seeds from the
+                system.
+
+        Returns:
+            The new prompt_order.
+        """
+
+        rng = random.Random(seed)
+        order = array("l", cards)
+        rng.shuffle(order)
+
+        self.prompt_order = order
+        self.order_mode = ORDER_SEARCH
+
+        return order
+
+    def interleave_topics(self, rng):
+        """Build an order that takes one prompt from each chosen topic in turn.
+
+        Each topic is shuffled first. Topics with fewer prompts drop out of the
+        rotation once they run out.
+
+        Args:
+            rng: The random.Random instance used to shuffle each topic.
 
-        print("Randomising all_prompts")
-        temp_prompts = self.all_prompts
-        random_prompts = []
-        while len(temp_prompts) > 0:
-            rnum = random.randint(0, len(temp_prompts) - 1)
-            random_prompts.append(temp_prompts[rnum])
-            del temp_prompts[rnum]
+        Returns:
+            An array of cards.
+        """
+
+        queues = []
+        for start, stop in self.all_prompts.ranges():
+            if stop > start:
+                queue = array("l", range(start, stop))
+                rng.shuffle(queue)
+                queues.append(queue)
 
-        self.all_prompts = random_prompts
-        return random_prompts
+        order = array("l")
+        depth = 0
+        while queues:
+            for queue in queues:
+                order.append(queue[depth])
+            depth += 1
+            queues = [queue for queue in queues if len(queue) > depth]
+
+        return order
 
     def extract_topics(self):
         """Get a list of topics from the JSON topic file.
@@ -244,11 +899,406 @@ class JSONTopicHandler(JSONHandler):
                 file this object represents.
         """
 
-        topics = []
+        return list(self.topic_index)
+
+    def build_columns(self):
+        """Fill the prompt and answer columns from the JSON topic file.
+
+        Strings are interned so answers repeated across the file are only
+        stored once. If a topic name appears more than once the prompts from
+        each topic with that name are joined into one range, in the order they
+        are listed in the file.
+
+        Returns:
+            A dict keyed by topic name with the (start, stop) range of that
+                topic's cards as the value.
+        """
+
+        groups = {}
         for topic in self.raw_string:
-            topics.append(topic["topic_name"])
+            groups.setdefault(topic["topic_name"], []).append(topic["prompts"])
 
-        return topics
+        topic_index = {}
+        for i, (name, prompt_lists) in enumerate(groups.items()):
+            report_progress(i, len(groups), "Loading topics")
+            start = len(self.prompt_column)
+            for prompts in prompt_lists:
+                for prompt in prompts:
+                    self.prompt_column.append(sys.intern(str(prompt.get("prompt", ""))))
+                    self.answer_column.append(sys.intern(str(prompt.get("answer", ""))))
+            topic_index[name] = (start, len(self.prompt_column))
+
+        return topic_index
+
+    def output_string(self):
+        """Overrides JSONHandler to display the stored columns by topic."""
+
+        for topic, (start, stop) in self.topic_index.items():
+            print(topic + ":")
+            for card in range(start, stop):
+                print(
+                    "    " + self.prompt_column[card] + " - " + self.answer_column[card]
+                )
+        print("Topics loaded from JSON file: " + self.fname)
+
+
+class LazyColumn:
+    """A read only column of strings that only holds the cards loaded into it.
+
+    Behaves like the prompt_column and answer_column lists of JSONTopicHandler.
+    Indexing a card that was not loaded fetches it from the deck file, which
+    subclasses do in fetch.
+    """
+
+    def __init__(self, length):
+        """Initialise an empty column.
+
+        Args:
+            length: The number of cards in the deck.
+        """
+
+        self.length = length
+        # Maps each loaded card to its string
+        self.cards = {}
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, card):
+        try:
+            return self.cards[card]
+        except KeyError:
+            if not 0 <= card < self.length:
+                raise IndexError("card index out of range") from None
+            return self.fetch(card)
+
+    def fetch(self, card):
+        """Get the string of a card that is not loaded from the deck file."""
+
+        raise NotImplementedError
+
+    def clear(self):
+        """Release every loaded string."""
+
+        self.cards = {}
+
+
+class LazyTopicHandler(JSONTopicHandler):
+    """A deck that only holds the prompts of its chosen topics in memory.
+
+    The prompt and answer columns are LazyColumns. The prompts of a topic are
+    loaded into them when it is chosen and released when it is unchosen, so
+    the memory used follows the chosen topics rather than the size of the
+    deck. Subclasses make the columns in new_columns and load a topic in
+    load_cards.
+    """
+
+    def new_columns(self, card_count):
+        """Give the handler its own empty prompt and answer columns."""
+
+        raise NotImplementedError
+
+    def load_cards(self, topic, cards=None):
+        """Load the prompts of a topic into the columns.
+
+        Args:
+            topic: The name of a topic from the file.
+            cards: The cards of the topic to load, or None to load every card.
+        """
+
+        raise NotImplementedError
+
+    def copy(self):
+        """Extends JSONTopicHandler so the copy loads prompts into its own columns."""
+
+        new_handler = super().copy()
+        new_handler.new_columns(len(self.prompt_column))
+
+        return new_handler
+
+    def resident_bytes(self):
+        """Overrides JSONTopicHandler to count only the loaded prompts."""
+
+        size = self.topic_index_bytes()
+        for column in (self.prompt_column, self.answer_column):
+            size += sys.getsizeof(column.cards)
+            size += sum(map(sys.getsizeof, column.cards.values()))
+
+        return size
+
+    def prompts_from_chosen_topics(self):
+        """Extends JSONTopicHandler to release the prompts of unchosen topics."""
+
+        self.prompt_column.clear()
+        self.answer_column.clear()
+
+        return super().prompts_from_chosen_topics()
+
+    def prompts_from_topic(self, search_topic):
+        """Extends JSONTopicHandler to load the prompts of the topic.
+
+        Args:
+            search_topic: A string with the name of the topic you want the prompts
+                from.
+        """
+
+        super().prompts_from_topic(search_topic)
+
+        if search_topic in self.topic_index:
+            self.load_cards(search_topic)
+
+    def drop_prompts_from_topic(self, search_topic):
+        """Extends JSONTopicHandler to release the loaded prompts of the topic.
+
+        Args:
+            search_topic: A string with the name of the topic to remove the
+                prompts of.
+        """
+
+        super().drop_prompts_from_topic(search_topic)
+
+        card_range = self.topic_index.get(search_topic)
+        if card_range is not None:
+            for card in range(*card_range):
+                self.prompt_column.cards.pop(card, None)
+                self.answer_column.cards.pop(card, None)
+
+    def match_prompts(self, cards, seed=None):
+        """Extends JSONTopicHandler to load only the given cards into the columns.
+
+        Args:
+            cards: The cards to show.
+            seed: Seed for the random number generator, None seeds from the
+                system.
+        """
+
+        self.prompt_column.clear()
+        self.answer_column.clear()
+        cards = sorted(cards)
+        for topic in self.topics_of_cards(cards):
+            start, stop = self.topic_index[topic]
+            low = bisect_left(cards, start)
+            high = bisect_left(cards, stop, low)
+            self.load_cards(topic, cards[low:high])
+
+        return super().match_prompts(cards, seed)
+
+
+# Maps each parser name, or None for the default, to the result of json_parser
+parser_cache = {}
+
+
+def json_parser(name=None):
+    """Get the parser to read JSON topic files with.
+
+    Parsers are imported the first time they are asked for.
+
+    Args:
+        name: One of the keys of JSON_PARSERS, or None for the parser named by
+            FLASHCARDS_JSON_PARSER, or else the fastest one installed.
+
+    Returns:
+        The name of the parser, its parse function and whether it can parse a
+            memoryview.
+
+    Raises:
+        ValueError: The parser is unknown.
+        ImportError: The parser is not installed.
+    """
+
+    parser = parser_cache.get(name)
+    if parser is not None:
+        return parser
+
+    if name is None:
+        names = list(JSON_PARSERS)
+        env_name = os.environ.get(JSON_PARSER_ENV)
+        if env_name in JSON_PARSERS:
+            names.insert(0, env_name)
+        elif env_name:
+            logger.warning("Unknown JSON parser in %s: %s", JSON_PARSER_ENV, env_name)
+    elif name in JSON_PARSERS:
+        names = [name]
+    else:
+        raise ValueError("Invalid JSON parser: " + str(name))
+
+    for parser_name in names:
+        module_name, function_name, parses_buffers = JSON_PARSERS[parser_name]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            if name is not None:
+                raise
+            logger.debug("JSON parser %s is not installed", parser_name)
+            continue
+
+        parser = (parser_name, getattr(module, function_name), parses_buffers)
+        break
+
+    parser_cache[name] = parser
+    logger.debug("Parsing JSON with %s", parser[0])
+    return parser
+
+
+def read_json_bytes(f, size, label):
+    """Read the rest of an open binary file into a single buffer.
+
+    The buffer is allocated once at the expected size and read into a chunk at
+    a time, reporting progress after each chunk.
+
+    Args:
+        f: The file, opened in binary mode.
+        size: The expected number of bytes left in the file.
+        label: The name of the file to show with the progress.
+
+    Returns:
+        A bytearray of the file contents.
+    """
+
+    data = bytearray(size)
+    read = 0
+    with memoryview(data) as view:
+        while read < size:
+            count = f.readinto(view[read : read + READ_CHUNK_SIZE])
+            if not count:
+                break
+            read += count
+            report_progress(read, size, "Reading " + label)
+
+    # The file may have changed size since it was measured
+    del data[read:]
+    data += f.read()
+
+    return data
+
+
+def parse_json_bytes(data, loads):
+    """Parse JSON from a buffer, falling back to the json module on failure.
+
+    Faster parsers are stricter than json, for example about byte order marks
+    and integers too big for 64 bits. Parsing again with json means every file
+    json can read still opens, and a bad file fails with the same error
+    whichever parser is used.
+
+    Args:
+        data: The JSON document as bytes, a bytearray or a memoryview.
+        loads: The parse function of a parser from json_parser.
+
+    Returns:
+        The parsed JSON document.
+
+    Raises:
+        ValueError: The data is not valid JSON.
+    """
+
+    try:
+        return loads(data)
+    except ValueError:
+        if loads is json.loads:
+            raise
+        logger.debug("Parsing again with json after the fast parser failed")
+
+    # json can't parse a memoryview
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def parse_json_file(fname, parser=None, use_mmap=None):
+    """Read and parse a JSON file.
+
+    The file is read with one bulk read into a single buffer, or memory mapped
+    so the parser reads it straight from the page cache, and is always closed
+    before returning.
+
+    Args:
+        fname: The path of the JSON file.
+        parser: One of the keys of JSON_PARSERS, or None for the default from
+            json_parser.
+        use_mmap: True to memory map the file, False to read it, or None to
+            memory map files of at least MMAP_MIN_SIZE bytes when the parser
+            can parse a memoryview.
+
+    Returns:
+        The parsed JSON document.
+
+    Raises:
+        ValueError: The file is not valid JSON, or use_mmap is True and the
+            parser can't parse a memoryview.
+    """
+
+    name, loads, parses_buffers = json_parser(parser)
+    label = Path(fname).name
+    with open(fname, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap is None:
+            use_mmap = parses_buffers and size >= MMAP_MIN_SIZE
+        elif use_mmap and not parses_buffers:
+            raise ValueError("JSON parser can't parse a memory map: " + name)
+
+        # An empty file can't be mapped, it is read and fails to parse instead
+        if use_mmap and size:
+            report_progress(0, 1, "Parsing " + label)
+            with metrics.timer("deck.parse"), mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped, memoryview(mapped) as view:
+                return parse_json_bytes(view, loads)
+
+        with metrics.timer("deck.read"):
+            data = read_json_bytes(f, size, label)
+
+    report_progress(0, 1, "Parsing " + label)
+    with metrics.timer("deck.parse"):
+        return parse_json_bytes(data, loads)
+
+
+def open_deck(filepath, backend=None):
+    """Open a FlashCards deck file with the handler for a deck backend.
+
+    Without a backend the file suffix decides, .fcdeck files are compiled decks,
+    .fcdb files are SQLite decks and every other file is read as a JSON topic
+    file, streamed a topic at a time once it is STREAM_MIN_SIZE bytes or more,
+    or kept under a memory budget if FLASHCARDS_DECK_BUDGET is set.
+    A JSON topic file opened with a backend that has a converter is first
+    converted to a deck next to it, which is reused until the JSON file is
+    modified.
+
+    Args:
+        filepath: The path of the deck file to open.
+        backend: One of the keys of DECK_BACKENDS, or None to use the suffix.
+
+    Returns:
+        A JSONTopicHandler or a subclass of it.
+
+    Raises:
+        ValueError: The backend is unknown or the file can't be converted to it.
+    """
+
+    file_backend = BACKEND_SUFFIXES.get(Path(filepath).suffix, "json")
+    if backend is None:
+        backend = file_backend
+        if backend == "json" and os.environ.get(DECK_BUDGET_ENV):
+            backend = "budget"
+        elif backend == "json" and os.path.getsize(filepath) >= STREAM_MIN_SIZE:
+            backend = "stream"
+    if backend not in DECK_BACKENDS:
+        raise ValueError("Invalid deck backend: " + str(backend))
+
+    module_name, class_name, converter = DECK_BACKENDS[backend]
+    module = importlib.import_module(module_name)
+    if backend != file_backend:
+        if file_backend != "json":
+            raise ValueError("Only JSON topic files can be opened with " + backend)
+
+        if converter is not None:
+            deck_path = Path(filepath).with_suffix(module.DECK_SUFFIX)
+            if (
+                not deck_path.exists()
+                or deck_path.stat().st_mtime_ns < Path(filepath).stat().st_mtime_ns
+            ):
+                getattr(module, converter)(filepath, deck_path)
+            filepath = deck_path
+
+    with metrics.timer("deck.open." + backend):
+        return getattr(module, class_name)(filepath)
 
 
 # TODO: Move these to a separate module
@@ -273,9 +1323,9 @@ def run_module_tests():
 
     print(prompts)
     print("Cycling through all prompts and answers from chosen topic/s!")
-    for prompt in prompts:
-        print("Prompt: " + prompt["prompt"])
-        print("Answer: " + prompt["answer"])
+    for card in prompts:
+        print("Prompt: " + json_data.prompt_column[card])
+        print("Answer: " + json_data.answer_column[card])
         print("")
 
     print("get_value test")
@@ -292,6 +1342,9 @@ def run_module_tests():
 
 
 def schema_tests():
+    # Only needed here, importing it at startup slows down opening the app
+    import jsonschema
+
     print("****************")
     print("Testing file validation with jsonschema")
     schema = [{"type": "string", "type": [{"type": "string", "type": "string"}]}]
@@ -302,5 +1355,6 @@ def schema_tests():
 
 # If ran as a python script begin running tests that output to console
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     run_module_tests()
     # schema_tests()
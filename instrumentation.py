@@ -0,0 +1,311 @@
+"""Module for FlashCards App that measures where time goes while it runs.
+
+Instrumentation is off unless it is asked for, with a command line flag or an
+environment variable:
+    FLASHCARDS_METRICS: a path to write timing histograms and counters to as
+        JSON when the program exits.
+    FLASHCARDS_PROFILE: a path to write a cProfile .pstats file of the whole
+        run to when the program exits.
+
+Code is timed by wrapping it in metrics.timer(name). While metrics are off the
+timer is a shared no-op context manager, so leaving timers in hot code costs
+next to nothing.
+
+Classes:
+    Histogram
+    Timer
+    Metrics
+
+Functions:
+    nearest_rank
+    enable
+    start_profile
+    configure
+"""
+
+import atexit
+import contextlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from array import array
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENV = "FLASHCARDS_METRICS"
+PROFILE_ENV = "FLASHCARDS_PROFILE"
+# Samples kept by each histogram, later samples replace kept ones at random
+MAX_SAMPLES = 100_000
+PERCENTILES = (50, 95, 99)
+
+# Returned by timers while metrics are off
+NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    """The distribution of the times taken by one piece of code.
+
+    The count, total and maximum cover every sample. Percentiles are worked
+    out from up to MAX_SAMPLES samples kept by reservoir sampling, so a long
+    run takes a fixed amount of memory. Timers finish on background task
+    threads as well as the main thread, so samples are added and read under a
+    lock.
+
+    Attributes:
+        count
+        total
+        maximum
+        samples
+    """
+
+    def __init__(self, seed=None, lock=None):
+        """Initialise an empty histogram.
+
+        Args:
+            seed: Seed for choosing which samples are kept once it is full.
+            lock: The lock held while samples are added or read, a new lock if
+                None.
+        """
+
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = array("d")
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock() if lock is None else lock
+
+    def add(self, seconds):
+        """Record one sample of the time taken."""
+
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+            if len(self.samples) < MAX_SAMPLES:
+                self.samples.append(seconds)
+            else:
+                slot = self.rng.randrange(self.count)
+                if slot < MAX_SAMPLES:
+                    self.samples[slot] = seconds
+
+    def percentile(self, percent):
+        """Get the time below which percent of the samples fall, by nearest rank."""
+
+        with self.lock:
+            samples = array("d", self.samples)
+
+        return nearest_rank(sorted(samples), percent)
+
+    def summary(self):
+        """Get the count and the times in milliseconds as a dict."""
+
+        # Copied under the lock and summarised outside it so timers finishing
+        # meanwhile don't wait for the sort
+        with self.lock:
+            count, total, maximum = self.count, self.total, self.maximum
+            samples = array("d", self.samples)
+
+        ordered = sorted(samples)
+        summary = {
+            "count": count,
+            "total_ms": total * 1000,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "max_ms": maximum * 1000,
+        }
+        for percent in PERCENTILES:
+            summary["p" + str(percent) + "_ms"] = nearest_rank(ordered, percent) * 1000
+
+        return summary
+
+
+class Timer:
+    """Times the code in a with block into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.add(time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Named timing histograms, counters and gauges.
+
+    May be used from any thread.
+
+    Attributes:
+        enabled
+        histograms
+        counters
+        gauges
+    """
+
+    def __init__(self):
+        """Initialise with metrics off and nothing recorded."""
+
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def timer(self, name):
+        """Get a context manager that times its with block as name."""
+
+        if not self.enabled:
+            return NULL_TIMER
+
+        return Timer(self.histogram(name))
+
+    def histogram(self, name):
+        """Get the histogram for name, adding it the first time."""
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(lock=self.lock))
+
+        return histogram
+
+    def count(self, name, amount=1):
+        """Add amount to the counter for name, if metrics are on."""
+
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        """Set the gauge for name to its latest value, if metrics are on."""
+
+        if self.enabled:
+            with self.lock:
+                self.gauges[name] = value
+
+    def snapshot(self):
+        """Get every histogram summary, counter and gauge as a dict."""
+
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        return {
+            "timers": {
+                name: histogram.summary()
+                for name, histogram in sorted(histograms.items())
+            },
+            "counters": dict(sorted(counters.items())),
+            "gauges": dict(sorted(gauges.items())),
+        }
+
+    def dump(self, path):
+        """Write the snapshot to path as JSON."""
+
+        try:
+            with open(path, "w") as f:
+                json.dump(self.snapshot(), f, indent=2)
+        except OSError:
+            logger.warning("Could not write metrics to %s", path)
+            return
+
+        logger.info("Metrics written to %s", path)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+
+# The metrics shared by the whole program
+metrics = Metrics()
+
+
+def nearest_rank(ordered, percent):
+    """Get the value below which percent of the sorted values fall, by nearest rank.
+
+    Args:
+        ordered: The values in ascending order.
+        percent: The percentile to get, from 0 to 100.
+
+    Returns:
+        The value at the nearest rank, or 0.0 if there are no values.
+    """
+
+    if not ordered:
+        return 0.0
+
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def enable(path=None):
+    """Turn metrics on.
+
+    Args:
+        path: Where to write the metrics as JSON when the program exits, or
+            None to not write them.
+    """
+
+    metrics.enabled = True
+    if path is not None:
+        atexit.register(metrics.dump, path)
+
+
+def start_profile(path):
+    """Profile the rest of the run with cProfile.
+
+    Only the thread that calls this is profiled, work done by background tasks
+    shows up in their own metrics timers instead.
+
+    Args:
+        path: Where to write the .pstats file when the program exits.
+
+    Returns:
+        The running cProfile.Profile.
+    """
+
+    # Only needed when profiling, so not imported at startup
+    import cProfile
+
+    profile = cProfile.Profile()
+
+    def stop():
+        profile.disable()
+        profile.dump_stats(path)
+        logger.info("Profile written to %s", path)
+
+    atexit.register(stop)
+    profile.enable()
+
+    return profile
+
+
+def configure(metrics_path=None, profile_path=None):
+    """Turn on the instrumentation asked for by flags or the environment.
+
+    Args:
+        metrics_path: The metrics JSON path from the command line. Defaults to
+            the FLASHCARDS_METRICS environment variable.
+        profile_path: The .pstats path from the command line. Defaults to the
+            FLASHCARDS_PROFILE environment variable.
+    """
+
+    metrics_path = metrics_path or os.environ.get(METRICS_ENV)
+    profile_path = profile_path or os.environ.get(PROFILE_ENV)
+    if metrics_path:
+        enable(metrics_path)
+    if profile_path:
+        start_profile(profile_path)
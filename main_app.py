@@ -2,8 +2,8 @@
 
 This is the main program file. Run FlashCards by executing this script.
 
-Each section of the program to be displayed in the main window is created as a 
-separate frame which has its own class. Each frame class derives from the 
+Each section of the program to be displayed in the main window is created as a
+separate frame which has its own class. Each frame class derives from the
 BasicFrame which provides the show() and remove() methods to hide and show the
 frame as required when moving between sections of the program.
 
@@ -13,25 +13,44 @@ should belong to that frame.
 
 Classes:
     BasicFrame
+    ProgressDisplay
+    TopicList
     IntroFrame
     ChooseFileFrame
     TopicSelectFrame
     DisplayPrompts
-    
+
     MainApp
 
 """
+
+import logging
+import os
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font
 
-import json
-
-from handle_json import JSONHandler
-from handle_json import JSONTopicHandler
+from answer_check import MATCH_EXACT
+from background import BackgroundTask
+from deck_cache import load_deck
+from deck_probe import probe_deck
+from deck_session import DeckSession
+from instrumentation import metrics
+from review_log import NO_GRADE
+from review_log import ReviewLog
+from search_index import load_index
+from scheduler import GRADES
 
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# The number keys used to grade a prompt in a spaced repetition session
+GRADE_KEYS = [str(grade) for grade in GRADES]
+# Milliseconds after the last key typed into the search box before searching
+SEARCH_DELAY_MS = 150
+
 
 class BasicFrame:
     """A generic tkinter frame that can be further extended.
@@ -51,6 +70,245 @@ class BasicFrame:
         self.base_frame.grid_remove()
 
 
+class ProgressDisplay:
+    """A progress bar with a description and a cancel button.
+
+    Shown by a frame while a BackgroundTask is running and hidden again once it
+    has finished.
+    """
+
+    def __init__(self, parent):
+        """Create the hidden progress widgets inside their own frame.
+
+        Args:
+            parent: The container the progress display sits in.
+        """
+
+        self.frame = ttk.Frame(master=parent)
+        self.cancel_command = None
+
+        self.progress_bar = ttk.Progressbar(
+            master=self.frame, maximum=1.0, length=200, mode="determinate"
+        )
+        self.progress_bar.grid(column=0, row=0)
+
+        self.stage_label = ttk.Label(master=self.frame, text="")
+        self.stage_label.grid(column=0, row=1)
+
+        self.cancel_button = ttk.Button(
+            master=self.frame, text="Cancel", command=self.cancel
+        )
+        self.cancel_button.grid(column=1, row=0)
+
+    def grid(self, **kwargs):
+        """Place the progress display in its parent, then hide it until shown."""
+
+        self.frame.grid(**kwargs)
+        self.frame.grid_remove()
+
+    def show(self, cancel_command):
+        """Display the progress display at zero progress.
+
+        Args:
+            cancel_command: Called when the cancel button is pressed.
+        """
+
+        self.cancel_command = cancel_command
+        self.cancel_button.config(state=tk.NORMAL)
+        self.update(0.0, "")
+        self.frame.grid()
+
+    def update(self, fraction, stage):
+        """Update the progress bar and its description.
+
+        Args:
+            fraction: How much of the work is done, from 0 to 1.
+            stage: A description of the work being done.
+        """
+
+        self.progress_bar.config(value=fraction)
+        self.stage_label.config(text=stage)
+
+    def cancel(self):
+        """Cancel the work and stop the cancel button being pressed again."""
+
+        self.cancel_button.config(state=tk.DISABLED)
+        self.stage_label.config(text="Cancelling...")
+        if self.cancel_command is not None:
+            self.cancel_command()
+
+    def hide(self):
+        """Remove the progress display from view."""
+
+        self.cancel_command = None
+        self.frame.grid_remove()
+
+
+class TopicList:
+    """A scrollable list of topic buttons with a label showing if each is picked.
+
+    Only enough rows of widgets to fill the visible part of the list are
+    created. Scrolling moves the list along by giving each row the topic now in
+    its place, so the number of widgets does not depend on the number of topics.
+    """
+
+    VISIBLE_ROWS = 15
+    # Rows moved by each step of the mouse wheel
+    WHEEL_ROWS = 3
+
+    def __init__(self, parent, on_pick):
+        """Create the rows of the list and its scrollbar.
+
+        Args:
+            parent: The container the list sits in.
+            on_pick: Called with the topic name when a topic button is pressed.
+        """
+
+        self.frame = ttk.Frame(master=parent)
+        self.on_pick = on_pick
+
+        self.topics = []
+        self.topic_rows = {}
+        self.is_selected = None
+        self.first_row = 0
+
+        self.buttons = []
+        self.labels = []
+        for row in range(TopicList.VISIBLE_ROWS):
+            button = ttk.Button(
+                master=self.frame,
+                width=20,
+                command=lambda row=row: self.pick_row(row),
+            )
+            button.grid(column=0, row=row, sticky=tk.W)
+            label = ttk.Label(master=self.frame, text="", width=8)
+            label.grid(column=1, row=row)
+
+            for widget in (button, label):
+                self.bind_mouse_wheel(widget)
+            self.buttons.append(button)
+            self.labels.append(label)
+
+        self.scrollbar = ttk.Scrollbar(
+            master=self.frame, orient=tk.VERTICAL, command=self.yview
+        )
+        self.scrollbar.grid(
+            column=2, row=0, rowspan=TopicList.VISIBLE_ROWS, sticky=(tk.N, tk.S)
+        )
+        self.bind_mouse_wheel(self.frame)
+
+    def grid(self, **kwargs):
+        """Place the list in its parent."""
+
+        self.frame.grid(**kwargs)
+
+    def bind_mouse_wheel(self, widget):
+        """Scroll the list when the mouse wheel is used over widget."""
+
+        widget.bind("<MouseWheel>", self.mouse_wheel)
+        widget.bind("<Button-4>", self.mouse_wheel)
+        widget.bind("<Button-5>", self.mouse_wheel)
+
+    def set_topics(self, topics, is_selected):
+        """Show a new list of topics from the top of the list.
+
+        Args:
+            topics: The list of topic names to show.
+            is_selected: Called with a topic name to check if it is picked.
+        """
+
+        self.topics = topics
+        self.topic_rows = {topic: row for row, topic in enumerate(topics)}
+        self.is_selected = is_selected
+        self.first_row = 0
+        self.refresh()
+
+    def refresh(self):
+        """Give every row the topic in its place and update the scrollbar."""
+
+        for row in range(TopicList.VISIBLE_ROWS):
+            index = self.first_row + row
+            if index < len(self.topics):
+                topic = self.topics[index]
+                self.buttons[row].config(text=topic)
+                self.labels[row].config(text=self.picked_text(topic))
+                self.buttons[row].grid()
+                self.labels[row].grid()
+            else:
+                self.buttons[row].grid_remove()
+                self.labels[row].grid_remove()
+
+        if len(self.topics) > TopicList.VISIBLE_ROWS:
+            self.scrollbar.set(
+                self.first_row / len(self.topics),
+                (self.first_row + TopicList.VISIBLE_ROWS) / len(self.topics),
+            )
+            self.scrollbar.grid()
+        else:
+            self.scrollbar.grid_remove()
+
+    def refresh_topic(self, topic):
+        """Update the picked label of a topic if it is in view."""
+
+        row = self.topic_rows.get(topic, -1) - self.first_row
+        if 0 <= row < TopicList.VISIBLE_ROWS:
+            self.labels[row].config(text=self.picked_text(topic))
+
+    def picked_text(self, topic):
+        """Get the label text showing if topic is picked."""
+
+        return "Picked" if self.is_selected(topic) else ""
+
+    def set_state(self, state):
+        """Enable or disable every topic button.
+
+        Args:
+            state: The Tk state to give the buttons.
+        """
+
+        for button in self.buttons:
+            button.config(state=state)
+
+    def pick_row(self, row):
+        """Pick the topic shown in a row of the list."""
+
+        index = self.first_row + row
+        if index < len(self.topics):
+            self.on_pick(self.topics[index])
+
+    def scroll_to(self, first_row):
+        """Show the list from first_row, kept within the bounds of the list."""
+
+        last_first_row = max(0, len(self.topics) - TopicList.VISIBLE_ROWS)
+        first_row = min(max(0, first_row), last_first_row)
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.refresh()
+
+    def yview(self, *args):
+        """Scroll the list in response to the scrollbar.
+
+        Args:
+            args: ("moveto", fraction) or ("scroll", number, "units" or "pages")
+                as given by the scrollbar.
+        """
+
+        if args[0] == "moveto":
+            self.scroll_to(round(float(args[1]) * len(self.topics)))
+        elif args[0] == "scroll":
+            step = TopicList.VISIBLE_ROWS if args[2] == "pages" else 1
+            self.scroll_to(self.first_row + int(args[1]) * step)
+
+    def mouse_wheel(self, event):
+        """Scroll the list in response to the mouse wheel."""
+
+        if event.num == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.first_row - TopicList.WHEEL_ROWS)
+        else:
+            self.scroll_to(self.first_row + TopicList.WHEEL_ROWS)
+        return "break"
+
+
 class IntroFrame(BasicFrame):
     """The intro screen to be displayed to the user on program start.
 
@@ -102,13 +360,16 @@ class ChooseFileFrame(BasicFrame):
         super().__init__(main_app.main_window)
 
         self.chosen_file = main_app.topic_file
+        self.load_task = None
 
         self.found_files = []
         self.files_display = []
+        self.listed_mtime_ns = None
 
         self.main_label = None
         self.previous_frame_button = None
         self.next_frame_button = None
+        self.progress_display = None
 
         self.build_choose_file_frame(main_app)
 
@@ -134,60 +395,177 @@ class ChooseFileFrame(BasicFrame):
         self.previous_frame_button.grid(column=0, row=0)
         self.next_frame_button = ttk.Button(
             master=self.base_frame,
-            text="Choose: '" + main_app.topic_file.get_name() + "'",
+            text="No file chosen",
             command=lambda: self.to_topic_select(main_app),
             width=25,
+            state=tk.DISABLED,
         )
         self.next_frame_button.grid(column=1, row=0)
 
+        self.progress_display = ProgressDisplay(self.base_frame)
+        self.progress_display.grid(column=1, row=2, rowspan=3, sticky=tk.N)
+
         self.show_files()
+        self.update_next_frame_button()
+        self.pick_file(main_app.default_file_path)
 
     def to_topic_select(self, main_app):
-        """Change display from choose file screen to topic select screen."""
+        """Change display from choose file screen to topic select screen.
+
+        The topic select frame is built the first time and reset with the
+        chosen file after that.
+        """
 
         main_app.topic_file = self.chosen_file
-        main_app.topic_select_frame = TopicSelectFrame(main_app)
+        if main_app.topic_select_frame is None:
+            main_app.topic_select_frame = TopicSelectFrame(main_app)
+        else:
+            main_app.topic_select_frame.reset(main_app.topic_file)
         main_app.update_current_screen(
             main_app.topic_select_frame.S_INDEX, main_app.current_screen
         )
 
+    def reset(self, default_file_path):
+        """Return the frame to how it was when first built, reusing its widgets.
+
+        The list of files is only rebuilt if the resources directory has changed
+        since it was last listed.
+
+        Args:
+            default_file_path: The file to start reading as the chosen file.
+        """
+
+        self.chosen_file = None
+        self.update_next_frame_button()
+
+        rsrc_dir = Path(MainApp.CWD, MainApp.RESOURCES_DIR)
+        if rsrc_dir.stat().st_mtime_ns != self.listed_mtime_ns:
+            self.show_files()
+
+        self.pick_file(default_file_path)
+
     def show_files(self):
-        """Display a list of files that can be used."""
+        """Display a list of files that can be used.
+
+        Replaces any file buttons from a previous listing.
+        """
 
         rsrc_dir = Path(MainApp.CWD, MainApp.RESOURCES_DIR)
+        self.listed_mtime_ns = rsrc_dir.stat().st_mtime_ns
+
+        for button in self.files_display:
+            button.destroy()
+        self.found_files = []
+        self.files_display = []
 
         file_index = 0
         for file in rsrc_dir.iterdir():
-            # Check each file supports FlashCards format
-            try:
-                self.found_files.append(JSONTopicHandler(file))
-                self.found_files.append(file)
-                file_name = Path(file).name
-                self.files_display.append(
-                    ttk.Button(
-                        master=self.base_frame,
-                        text=file_name,
-                        command=lambda file=file: self.pick_file(file),
-                        width=25,
-                    )
+            # Check each file supports FlashCards format without reading it all
+            deck_info = probe_deck(file)
+            if deck_info is None:
+                logger.info("Not a valid FlashCards file: %s", file.name)
+                continue
+
+            self.found_files.append(deck_info)
+            button_text = file.name
+            if deck_info.topic_count is not None:
+                button_text += " (" + str(deck_info.topic_count) + " topics)"
+            self.files_display.append(
+                ttk.Button(
+                    master=self.base_frame,
+                    text=button_text,
+                    command=lambda file=file: self.pick_file(file),
+                    width=25,
                 )
-                self.files_display[file_index].grid(column=0, row=file_index + 2)
+            )
+            self.files_display[file_index].grid(column=0, row=file_index + 2)
 
-                file_index += 1
-            except json.decoder.JSONDecodeError:
-                print("Not a valid FlashCards file")
+            file_index += 1
 
     def pick_file(self, f_path):
-        """Select the file after button press and update widgets on the frame.
+        """Select the file after button press and start reading it.
+
+        The file is read on a background thread while a progress bar is shown,
+        and the widgets on the frame are updated once it has been read.
 
         Args:
             f_path: The file path that points to the file that has been selected."""
 
-        new_file = JSONTopicHandler(f_path)
+        logger.info("Reading file: %s", f_path)
+        if self.load_task is not None:
+            self.load_task.abandon()
+        self.set_loading(True)
+        self.load_task = BackgroundTask(
+            self.base_frame,
+            lambda: load_deck(f_path),
+            on_done=self.file_loaded,
+            on_error=lambda error: self.file_load_failed(f_path, error),
+            on_progress=self.progress_display.update,
+            on_cancel=lambda: self.set_loading(False),
+        )
+
+    def file_loaded(self, new_file):
+        """Make a file that has finished being read the chosen file.
+
+        Args:
+            new_file: The handler for the file that has been read.
+        """
+
         self.chosen_file = new_file
-        print("Picking file: " + new_file.get_name())
+        logger.info("Picking file: %s", new_file.get_name())
+        self.set_loading(False)
+
+    def file_load_failed(self, f_path, error):
+        """Keep the previously chosen file when the picked file can't be read.
+
+        Args:
+            f_path: The file path of the file that failed to be read.
+            error: The exception raised while reading the file.
+        """
 
-        self.next_frame_button.config(text="Choose: '" + new_file.get_name() + "'")
+        self.set_loading(False)
+        if not isinstance(error, ValueError):
+            raise error
+
+        logger.warning("Not a valid FlashCards file: %s", f_path)
+
+    def set_loading(self, loading):
+        """Switch the frame between reading a file and waiting for a choice.
+
+        While a file is being read the progress display is shown and no file
+        can be picked or continued with.
+
+        Args:
+            loading: True when a file has started being read.
+        """
+
+        button_state = tk.DISABLED if loading else tk.NORMAL
+        for button in self.files_display:
+            button.config(state=button_state)
+
+        if loading:
+            self.progress_display.show(self.load_task_cancel)
+            self.next_frame_button.config(state=tk.DISABLED)
+        else:
+            self.load_task = None
+            self.progress_display.hide()
+            self.update_next_frame_button()
+
+    def load_task_cancel(self):
+        """Cancel the file being read."""
+
+        if self.load_task is not None:
+            self.load_task.cancel()
+
+    def update_next_frame_button(self):
+        """Show the chosen file on the button to continue to topic selection."""
+
+        if self.chosen_file is None:
+            self.next_frame_button.config(text="No file chosen", state=tk.DISABLED)
+        else:
+            self.next_frame_button.config(
+                text="Choose: '" + self.chosen_file.get_name() + "'", state=tk.NORMAL
+            )
 
 
 class TopicSelectFrame(BasicFrame):
@@ -197,7 +575,9 @@ class TopicSelectFrame(BasicFrame):
         Return to file selection
         A list of topics from the file displayed as buttons
         Labels displaying if a topic has been chosen
+        A search box that filters the topics to those with matching cards
         A button to run the prompts from the selected topics
+        A button to run only the prompts matching the search
     """
 
     S_INDEX = "topic_select_frame"
@@ -208,12 +588,28 @@ class TopicSelectFrame(BasicFrame):
         super().__init__(main_app.main_window)
 
         self.top_label = None
-        self.topic_buttons = []
-        self.chosen_topic_labels = []
+        self.topic_list = None
         self.next_screen_button = None
         self.previous_frame_button = None
+        self.progress_display = None
+        self.prepare_task = None
+        self.scheduling = False
+
+        self.search_entry = None
+        self.study_matches_button = None
+        self.index_task = None
+        # The search index of the deck, loaded the first time it is searched
+        self.search_index = None
+        # The cards matching the search, None when nothing is searched for
+        self.matches = None
+        # The cards to show instead of the chosen topics, read before the
+        # prompts are prepared on a background thread
+        self.session_cards = None
+        self.search_after = None
 
         self.topic_file = main_app.topic_file
+        self.load_scheduler = main_app.load_scheduler
+        self.use_scheduler = tk.BooleanVar(master=self.base_frame, value=False)
 
         self.chosen_topics = []
 
@@ -246,6 +642,19 @@ class TopicSelectFrame(BasicFrame):
         )
         self.previous_frame_button.grid(column=0, row=0)
 
+        self.search_entry = ttk.Entry(master=self.base_frame, width=30)
+        self.search_entry.grid(column=1, row=0, sticky=tk.W)
+        self.search_entry.bind("<KeyRelease>", self.search_changed)
+
+        self.study_matches_button = ttk.Button(
+            master=self.base_frame,
+            text="Study matches",
+            width=20,
+            command=lambda: self.to_display_prompts_frame(main_app, True),
+            state=tk.DISABLED,
+        )
+        self.study_matches_button.grid(column=2, row=0)
+
         topic_row = self.make_topic_buttons()
         self.next_screen_button.grid(column=1, row=topic_row + 3)
 
@@ -262,65 +671,282 @@ class TopicSelectFrame(BasicFrame):
         )
         self.deselect_all_button.grid(column=1, row=topic_row + 2)
 
-    def to_display_prompts_frame(self, main_app):
+        self.use_scheduler_button = ttk.Checkbutton(
+            self.base_frame, text="Spaced repetition", variable=self.use_scheduler
+        )
+        self.use_scheduler_button.grid(column=2, row=topic_row + 3, sticky=tk.W)
+
+        self.progress_display = ProgressDisplay(self.base_frame)
+        self.progress_display.grid(column=1, row=topic_row + 4)
+
+    def reset(self, topic_file):
+        """Show the topics of a newly chosen file, reusing the frame's widgets.
+
+        Args:
+            topic_file: The handler of the chosen file.
+        """
+
+        if self.prepare_task is not None:
+            self.prepare_task.abandon()
+            self.set_preparing(False)
+
+        self.topic_file = topic_file
+        # Shows every topic of the new file
+        self.clear_search()
+        self.update_next_screen_button()
+
+    def to_display_prompts_frame(self, main_app, study_matches=False):
         """Update the main_app window frame to the display prompts screen.
 
+        The prompts from the chosen topics are collected and shuffled on a
+        background thread while a progress bar is shown, then the display
+        prompts screen is shown.
+
         Args:
             main_app: The tk main window object which the program is displayed
                 from.
+            study_matches: True to show only the cards matching the search
+                instead of the chosen topics.
         """
 
-        main_app.display_propmts_frame = DisplayPrompts(main_app)
-        main_app.update_current_screen(
-            main_app.display_prompts_frame.S_INDEX, main_app.current_screen
+        self.stop_indexing()
+        self.scheduling = self.use_scheduler.get()
+        self.session_cards = self.matches if study_matches else None
+        self.set_preparing(True)
+        self.prepare_task = BackgroundTask(
+            self.base_frame,
+            self.prepare_prompts,
+            on_done=lambda prompts: self.prompts_prepared(main_app),
+            on_error=self.prepare_failed,
+            on_progress=self.progress_display.update,
+            on_cancel=lambda: self.set_preparing(False),
         )
 
-    def make_topic_buttons(self):
-        """Creates a list of button widgets, one for each topic in the file.
+    def prepare_prompts(self):
+        """Collect and order the prompts from the chosen topics.
 
-        Returns:
-            topic_row: The number of buttons that have been created so there is
-                a reference that the TopicSelectFrame can organise other
-                widgets for this frame on the grid correctly."""
+        When studying the matches of a search only the matching cards are
+        shown. With spaced repetition on, only the prompts that are due are
+        shown. Otherwise the prompts are shuffled, and prompts kept up to date
+        as topics were picked are not collected again. Runs on a background
+        thread so must not use any widgets, the settings are read before the
+        thread starts.
+        """
 
-        topic_row = 1
-        for topic in self.topic_file.topics:
-            self.topic_buttons.append(
-                ttk.Button(
-                    master=self.base_frame,
-                    text=topic,
-                    width=20,
-                    command=lambda topic=topic: self.pick_topics(topic),
-                )
+        if self.session_cards is not None:
+            self.topic_file.match_prompts(self.session_cards)
+        elif self.scheduling:
+            self.topic_file.schedule_prompts(self.load_scheduler())
+        else:
+            self.topic_file.refresh_prompts()
+
+    def prompts_prepared(self, main_app):
+        """Show the display prompts screen once the prompts are ready."""
+
+        self.set_preparing(False)
+        main_app.update_current_screen(DisplayPrompts.S_INDEX, main_app.current_screen)
+
+    def prepare_failed(self, error):
+        """Go back to choosing topics when the prompts can't be prepared.
+
+        Args:
+            error: The exception raised while preparing the prompts, such as
+                an OSError or ValueError from a deck changed on disk.
+        """
+
+        self.set_preparing(False)
+        # The prompts may be part way through being collected
+        self.topic_file.order_mode = None
+        if not isinstance(error, (OSError, ValueError)):
+            raise error
+
+        logger.warning("Could not prepare the prompts: %s", error)
+
+    def set_preparing(self, preparing):
+        """Switch the frame between preparing prompts and choosing topics.
+
+        While the prompts are being prepared the progress display is shown and
+        the chosen topics can't be changed.
+
+        Args:
+            preparing: True when the prompts have started being prepared.
+        """
+
+        button_state = tk.DISABLED if preparing else tk.NORMAL
+        self.topic_list.set_state(button_state)
+        for button in (
+            self.select_all_button,
+            self.deselect_all_button,
+            self.previous_frame_button,
+            self.use_scheduler_button,
+            self.search_entry,
+        ):
+            button.config(state=button_state)
+
+        if preparing:
+            self.progress_display.show(self.prepare_task_cancel)
+            self.next_screen_button.config(state=tk.DISABLED)
+            self.study_matches_button.config(state=tk.DISABLED)
+        else:
+            self.prepare_task = None
+            self.progress_display.hide()
+            if len(self.topic_file.chosen_topics) != 0:
+                self.next_screen_button.config(state=tk.NORMAL)
+            self.update_study_matches_button()
+
+    def prepare_task_cancel(self):
+        """Cancel the prompts being prepared."""
+
+        if self.prepare_task is not None:
+            self.prepare_task.cancel()
+
+    def search_changed(self, event=None):
+        """Search again once no key has been typed for SEARCH_DELAY_MS."""
+
+        if self.search_after is not None:
+            self.base_frame.after_cancel(self.search_after)
+        self.search_after = self.base_frame.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        """Filter the topic list to the topics with cards matching the search.
+
+        The last word typed matches as a prefix. The deck's search index is
+        loaded on a background thread the first time the deck is searched,
+        and the search runs once it has loaded.
+        """
+
+        self.search_after = None
+        query = self.search_entry.get()
+        if query.strip() == "":
+            self.show_matches(None)
+        elif self.search_index is not None:
+            with metrics.timer("search.query"):
+                self.show_matches(self.search_index.search(query, prefix=True))
+        elif self.index_task is None:
+            self.progress_display.show(self.stop_indexing)
+            self.index_task = BackgroundTask(
+                self.base_frame,
+                lambda topic_file=self.topic_file: load_index(topic_file),
+                on_done=self.index_loaded,
+                on_error=self.index_failed,
+                on_progress=self.progress_display.update,
             )
 
-            self.chosen_topic_labels.append(ttk.Label(master=self.base_frame, text=""))
-            self.update_picked_topics_label(topic)
+    def index_loaded(self, search_index):
+        """Search with the index of the deck once it has loaded."""
+
+        self.index_task = None
+        self.progress_display.hide()
+        self.search_index = search_index
+        self.run_search()
+
+    def index_failed(self, error):
+        """Tell the user the search index could not be loaded.
+
+        The next search tries to load it again.
 
-            self.topic_buttons[topic_row - 1].grid(column=1, row=topic_row, sticky=tk.W)
-            self.chosen_topic_labels[topic_row - 1].grid(column=2, row=topic_row)
-            topic_row += 1
+        Args:
+            error: The exception raised while loading the index.
+        """
+
+        self.index_task = None
+        self.progress_display.hide()
+        if not isinstance(error, (OSError, ValueError)):
+            raise error
+
+        logger.warning("Could not load the search index: %s", error)
+        self.top_label.config(text="Search failed: " + str(error))
+
+    def stop_indexing(self):
+        """Stop loading the search index, if it is being loaded."""
 
-        return topic_row
+        if self.index_task is not None:
+            self.index_task.abandon()
+            self.index_task = None
+            self.progress_display.hide()
+
+    def show_matches(self, cards):
+        """Show only the topics holding the cards that match the search.
+
+        Args:
+            cards: The sorted matching cards, or None to show every topic.
+        """
+
+        self.matches = cards
+        if cards is None:
+            topics = self.topic_file.topics
+            self.top_label.config(text="Topics from file: ")
+            self.select_all_button.config(text="Select all")
+            self.deselect_all_button.config(text="Deselect all")
+        else:
+            topics = self.topic_file.topics_of_cards(cards)
+            self.top_label.config(
+                text="Matches: "
+                + str(len(cards))
+                + " cards in "
+                + str(len(topics))
+                + " topics"
+            )
+            self.select_all_button.config(text="Select matching")
+            self.deselect_all_button.config(text="Deselect matching")
+        self.topic_list.set_topics(topics, self.topic_file.topic_is_selected)
+        self.update_study_matches_button()
+
+    def clear_search(self):
+        """Empty the search box and show every topic of the deck."""
+
+        if self.search_after is not None:
+            self.base_frame.after_cancel(self.search_after)
+            self.search_after = None
+        self.stop_indexing()
+        self.search_index = None
+        self.search_entry.delete(0, tk.END)
+        self.show_matches(None)
+
+    def update_study_matches_button(self):
+        """Only allow studying the matches when the search matched any cards."""
+
+        if self.matches:
+            self.study_matches_button.config(state=tk.NORMAL)
+        else:
+            self.study_matches_button.config(state=tk.DISABLED)
+
+    def make_topic_buttons(self):
+        """Creates the scrollable list of topic buttons for the topics in the file.
+
+        Returns:
+            topic_row: The next free row of the grid so that the TopicSelectFrame
+                can organise other widgets for this frame on the grid correctly."""
+
+        self.topic_list = TopicList(self.base_frame, self.pick_topics)
+        self.topic_list.grid(column=1, row=1, columnspan=2, sticky=tk.W)
+        self.topic_list.set_topics(
+            self.topic_file.topics, self.topic_file.topic_is_selected
+        )
+
+        return 2
 
     def select_all_topics(self):
-        """Select all topics from the topic file."""
+        """Select all topics in the list, only those matching any search."""
 
-        for topic in self.topic_file.topics:
-            if not (topic in self.topic_file.chosen_topics):
-                self.pick_topics(topic)
+        self.topic_file.set_topics(self.topic_list.topics, True)
+        self.refresh_topic_labels()
 
     def deselect_all_topics(self):
-        """Deselect all topics from the topic file."""
+        """Deselect all topics in the list, only those matching any search."""
 
-        for topic in self.topic_file.topics:
-            if topic in self.topic_file.chosen_topics:
-                self.pick_topics(topic)
+        if self.matches is None:
+            # Only the chosen topics need removing, not every topic of the deck
+            topics = list(self.topic_file.chosen_topics)
+        else:
+            topics = self.topic_list.topics
+        self.topic_file.set_topics(topics, False)
+        self.refresh_topic_labels()
 
     def pick_topics(self, selected_topic):
         """Update the list of selected topics with the selected_topic argument."""
 
-        print("You have selected: " + selected_topic)
+        logger.debug("You have selected: %s", selected_topic)
         self.topic_file.set_topic(selected_topic)
 
         self.update_picked_topics_label(selected_topic)
@@ -328,22 +954,30 @@ class TopicSelectFrame(BasicFrame):
     def update_picked_topics_label(self, selected_topic):
         """Update the corresponding selected_topic label when a topic is selected."""
 
-        topic_label_index = self.topic_file.topics.index(selected_topic)
-        is_selected = self.topic_file.topic_is_selected(selected_topic)
-        if is_selected:
-            self.chosen_topic_labels[topic_label_index].config(text="Picked")
-        else:
-            self.chosen_topic_labels[topic_label_index].config(text="")
+        self.topic_list.refresh_topic(selected_topic)
+        self.update_next_screen_button()
+
+        self.topic_file.topic_string(1)
+
+    def refresh_topic_labels(self):
+        """Update every picked label and the run prompts button in one pass.
+
+        Used after many topics are selected or deselected at once.
+        """
+
+        self.topic_list.refresh()
+        self.update_next_screen_button()
+
+    def update_next_screen_button(self):
+        """Only allow running prompts when at least one topic is chosen."""
 
         if len(self.topic_file.chosen_topics) == 0:
-            print("Next screen button disabled")
+            logger.debug("Next screen button disabled")
             self.next_screen_button.config(state=tk.DISABLED)
         else:
-            print("Next screen button activated")
+            logger.debug("Next screen button activated")
             self.next_screen_button.config(state=tk.ACTIVE)
 
-        self.topic_file.topic_string(1)
-
 
 class DisplayPrompts(BasicFrame):
     """The screen that displays prompts and their answers to the user.
@@ -352,7 +986,10 @@ class DisplayPrompts(BasicFrame):
         Return to start screen or topic select buttons
         The ability to navigate through all the prompts from chosen topics
         Displays a prompt and an answer
-        Navigation using arrow keys or buttons"""
+        Navigation using arrow keys or buttons
+
+    Where the user is in the prompts is kept by a DeckSession, this class only
+    shows it."""
 
     S_INDEX = "display_prompts_frame"
 
@@ -366,9 +1003,9 @@ class DisplayPrompts(BasicFrame):
         super().__init__(main_app.main_window)
 
         self.topic_file = main_app.topic_file
-        self.prompt_index = 0
-        self.showing_answer = False
-        self.end_of_prompts = False
+        # Kept between runs through the prompts so the cache of normalised
+        # answers used to check typed answers is reused for the same deck
+        self.session = DeckSession(self.topic_file, main_app.review_log)
 
         self.top_label = None
         self.return_to_start_button = None
@@ -379,6 +1016,9 @@ class DisplayPrompts(BasicFrame):
         self.prompt_label = None
         self.answer_label = None
         self.user_answer = None
+        self.check_label = None
+        # True once an answer has been typed, so the entry keeps the focus
+        self.typing_answers = False
 
         self.build_run_prompts_screen(main_app)
 
@@ -453,6 +1093,19 @@ class DisplayPrompts(BasicFrame):
         )
         self.answer_label.grid(column=1, row=2, sticky=(tk.E, tk.W))
 
+        self.grade_label = ttk.Label(master=self.main_frame, text="")
+        self.grade_label.grid(column=1, row=3, sticky=tk.W)
+
+        # Typed answers are checked when Enter shows the answer
+        self.user_answer_label = ttk.Label(master=self.main_frame, text="Your answer: ")
+        self.user_answer_label.grid(column=0, row=4, sticky=(tk.N, tk.W, tk.E))
+
+        self.user_answer = ttk.Entry(master=self.main_frame, width=80)
+        self.user_answer.grid(column=1, row=4, sticky=tk.W)
+
+        self.check_label = ttk.Label(master=self.main_frame, text="")
+        self.check_label.grid(column=1, row=5, sticky=tk.W)
+
         self.start_prompts_button = ttk.Button(
             master=self.header_frame,
             text="Begin running through prompts",
@@ -463,50 +1116,102 @@ class DisplayPrompts(BasicFrame):
     def show_first_prompt(self):
         """Display the initial prompt from the randomised list."""
 
-        self.prompt_labels_update(self.topic_file.get_value(0, "prompt"))
+        if self.session.start():
+            self.prompt_labels_update(self.session.current().prompt)
+        else:
+            # Only possible when no prompts are due for spaced repetition
+            self.prompt_labels_update(
+                prompt="No prompts are due! Press Enter to return to start...",
+                answer="",
+            )
         self.start_prompts_button.grid_remove()
         self.start_prompts_button.config(state=tk.DISABLED)
 
+    def grade_prompt(self, quality):
+        """Grade the prompt being shown for spaced repetition then move on.
+
+        Only prompts from a spaced repetition session with their answer shown
+        can be graded.
+
+        Args:
+            quality: How well the answer was remembered, one of scheduler.GRADES.
+        """
+
+        due = self.session.grade(quality)
+        if due is None:
+            return
+
+        logger.debug("Prompt graded %d, due at %f", quality, due)
+        self.show_next_prompt()
+
     def previous_prompt(self):
         """Display the prompt at the index from current prompt - 1."""
 
-        if self.prompt_index > 0:
-            self.prompt_index = self.prompt_index - 1
-            self.prompt_labels_update(
-                self.topic_file.get_value(self.prompt_index, "prompt"),
-                self.topic_file.get_value(self.prompt_index, "answer"),
-            )
-            self.end_of_prompts = False
+        if self.session.previous():
+            prompt = self.session.current()
+            self.prompt_labels_update(prompt.prompt, prompt.answer)
 
-            print("Going back to last prompt")
-            print("Current index number: " + str(self.prompt_index))
+            logger.debug("Going back to prompt index %d", prompt.index)
 
-    def goto_next_prompt(self):
-        """Update the next prompt or answer depending on current display."""
+    def goto_next_prompt(self, grade=NO_GRADE):
+        """Update the next prompt or answer depending on current display.
 
-        print("Current index: " + str(self.prompt_index))
-        try:
-            if self.showing_answer:
-                print("Updating prompt label")
-                self.next_prompt()
-            else:
-                print("Updating answer label ")
-                self.prompt_labels_update(
-                    answer=self.topic_file.get_value(self.prompt_index, "answer")
-                )
-        except IndexError:
+        Moving on from a shown answer records the review in the review history.
+
+        Args:
+            grade: The grade the prompt being left was given, if any.
+        """
+
+        logger.debug("Current index: %d", self.session.prompt_index)
+        if self.session.showing_answer:
+            logger.debug("Updating prompt label")
+            self.session.advance(grade)
+            self.show_next_prompt()
+        else:
+            logger.debug("Updating answer label")
+            self.prompt_labels_update(answer=self.session.reveal())
+            self.check_typed_answer()
+
+    def show_next_prompt(self):
+        """Show the prompt the session has moved on to with no answer."""
+
+        if self.session.end_of_prompts:
             self.prompt_labels_update(
                 prompt="Out of prompts! Press Enter to return to start...", answer=""
             )
-            self.end_of_prompts = True
+        else:
+            self.prompt_labels_update(prompt=self.session.current().prompt, answer="")
+        self.clear_typed_answer()
 
-    def next_prompt(self):
-        """Send the value of the next prompt with no answer to the prompt label."""
+    def check_typed_answer(self):
+        """Check the answer typed for the prompt being shown, if there is one."""
 
-        self.prompt_index = self.prompt_index + 1
-        self.prompt_labels_update(
-            prompt=self.topic_file.get_value(self.prompt_index, "prompt"), answer=""
-        )
+        typed = self.user_answer.get()
+        if typed.strip() == "":
+            return
+
+        # Move the focus off the entry so the grade and arrow keys work
+        self.typing_answers = True
+        self.base_frame.focus_set()
+
+        result = self.session.check_answer(typed)
+        if not result.correct:
+            text = "Incorrect"
+        elif result.match == MATCH_EXACT:
+            text = "Correct!"
+        else:
+            text = "Correct (" + result.match + " match)"
+        if self.session.scheduled:
+            text += " - suggested grade " + str(result.grade)
+        self.check_label.config(text=text)
+
+    def clear_typed_answer(self):
+        """Empty the answer entry and the result of the last check."""
+
+        self.user_answer.delete(0, tk.END)
+        self.check_label.config(text="")
+        if self.typing_answers:
+            self.user_answer.focus_set()
 
     def prompt_labels_update(self, prompt=None, answer=None):
         """Update the prompt and answer labels.
@@ -526,12 +1231,6 @@ class DisplayPrompts(BasicFrame):
             self.prompt_label.config(text=prompt)
         if answer is not None:
             self.answer_label.config(text=answer)
-            if answer == "":
-                self.showing_answer = False
-                print("Not showing answer")
-            else:
-                self.showing_answer = True
-                print("Showing answer")
         self.update_counter()
 
     def update_counter(self):
@@ -541,8 +1240,9 @@ class DisplayPrompts(BasicFrame):
         """
 
         num_prompts = self.topic_file.number_of_prompts()
-        if self.prompt_index < num_prompts:
-            count_val = str(self.prompt_index + 1) + " / " + str(num_prompts)
+        prompt_index = self.session.prompt_index
+        if prompt_index < num_prompts:
+            count_val = str(prompt_index + 1) + " / " + str(num_prompts)
             self.counter_label.config(text=count_val)
         else:
             self.counter_label.config(text="")
@@ -551,8 +1251,11 @@ class DisplayPrompts(BasicFrame):
         """Extends BasicFrame show functionality to properly set topic file."""
 
         self.topic_file = chosen_file
-        self.topic_file.prompts_from_chosen_topics()
-        self.topic_file.randomise_prompts()
+        self.session.reset(chosen_file)
+        if self.session.scheduled:
+            self.grade_label.config(
+                text="Grade your answer from 0 (forgotten) to 5 (perfect)"
+            )
 
         self.topic_file.print_prompts()
         self.show_first_prompt()
@@ -562,12 +1265,22 @@ class DisplayPrompts(BasicFrame):
     def remove(self):
         """Extends BasicFrame remove to properly reset class attributes."""
 
-        self.prompt_index = 0
-        self.showing_prompt = False
-        self.prompt_labels_update("", "")
+        self.reset()
 
         super().remove()
 
+    def reset(self):
+        """Return to the first prompt and clear the labels, reusing the widgets."""
+
+        self.session.reset()
+        self.typing_answers = False
+
+        self.prompt_label.config(text="")
+        self.answer_label.config(text="")
+        self.counter_label.config(text="")
+        self.grade_label.config(text="")
+        self.clear_typed_answer()
+
 
 class MainApp:
     """The main app window and its functionality.
@@ -578,6 +1291,7 @@ class MainApp:
 
     CWD = Path.cwd()
     RESOURCES_DIR = "resources"
+    HISTORY_DIR = "history"
     default_file_path = Path.joinpath(CWD, RESOURCES_DIR, "topic.json")
 
     def __init__(self, parent, name=None):
@@ -586,12 +1300,19 @@ class MainApp:
         self.main_window = parent
         self.current_screen = "intro_frame"
 
-        self.topic_file = JSONTopicHandler(MainApp.default_file_path)
+        self.topic_file = None
+        self.review_log = ReviewLog(Path(MainApp.CWD, MainApp.HISTORY_DIR))
+        # Review schedule shared by every spaced repetition session, loaded from
+        # the review history the first time it is needed
+        self.scheduler = None
+        self.scheduler_lock = threading.Lock()
 
+        # Only the intro screen is built here, every other screen is built the
+        # first time it is shown so the intro screen appears sooner
         self.intro_frame = IntroFrame(self.main_window)
-        self.choose_file_frame = ChooseFileFrame(self)
-        self.topic_select_frame = TopicSelectFrame(self)
-        self.display_prompts_frame = DisplayPrompts(self)
+        self.choose_file_frame = None
+        self.topic_select_frame = None
+        self.display_prompts_frame = None
 
         self.update_current_screen(self.intro_frame.S_INDEX)
 
@@ -609,58 +1330,92 @@ class MainApp:
                 class attributes S_INDEX.
             current_screen: The current_screen which should be removed.
         """
-        # Unpack/destroy current frame in prep for building next frame
-        print("Current screen is: " + self.current_screen)
-
-        if current_screen == "intro_frame":
-            self.intro_frame.remove()
-        elif current_screen == "topic_select_frame":
-            self.topic_select_frame.remove()
-        elif current_screen == "display_prompts_frame":
-            self.display_prompts_frame.remove()
-        elif current_screen == "choose_file_frame":
-            self.choose_file_frame.remove()
-
-        # Builds the next frame
-        if new_screen == "intro_frame":
-            self.intro_frame.show()
-            self.current_screen = new_screen
-            self.clear_instance()
-        elif new_screen == "topic_select_frame":
-            self.topic_select_frame.show()
-            self.current_screen = new_screen
-        elif new_screen == "display_prompts_frame":
-            self.display_prompts_frame.show(self.topic_file)
-            self.current_screen = new_screen
-        elif new_screen == "choose_file_frame":
-            self.choose_file_frame.show()
-            self.current_screen = new_screen
+        # Time the whole switch, including building a frame the first time
+        with metrics.timer("frame." + str(new_screen)):
+            # Unpack/destroy current frame in prep for building next frame
+            logger.debug("Current screen is: %s", self.current_screen)
+
+            if current_screen == "intro_frame":
+                self.intro_frame.remove()
+            elif current_screen == "topic_select_frame":
+                self.topic_select_frame.remove()
+            elif current_screen == "display_prompts_frame":
+                self.display_prompts_frame.remove()
+            elif current_screen == "choose_file_frame":
+                self.choose_file_frame.remove()
+
+            # Builds the next frame
+            if new_screen == "intro_frame":
+                self.intro_frame.show()
+                self.current_screen = new_screen
+                self.clear_instance()
+            elif new_screen == "topic_select_frame":
+                self.topic_select_frame.show()
+                self.current_screen = new_screen
+            elif new_screen == "display_prompts_frame":
+                if self.display_prompts_frame is None:
+                    self.display_prompts_frame = DisplayPrompts(self)
+                self.display_prompts_frame.show(self.topic_file)
+                self.current_screen = new_screen
+            elif new_screen == "choose_file_frame":
+                if self.choose_file_frame is None:
+                    # Lists the deck files and starts reading the default file
+                    self.choose_file_frame = ChooseFileFrame(self)
+                self.choose_file_frame.show()
+                self.current_screen = new_screen
 
         if current_screen == None:
-            print("No previous screen, no screen unpacked.")
+            logger.debug("No previous screen, no screen unpacked.")
 
     def clear_instance(self):
-        """Delete each frame object and create a new one."""
+        """Reset each frame that has been built so a new session can start.
+
+        The frames keep their widgets, so returning to the intro screen does
+        not build any new ones. The default topic file is read in the background
+        by the choose file frame, which is a cache hit unless the file changed.
+        """
+
+        self.topic_file = None
+        if self.choose_file_frame is not None:
+            self.choose_file_frame.reset(MainApp.default_file_path)
+        if self.display_prompts_frame is not None:
+            self.display_prompts_frame.reset()
+
+    def load_scheduler(self):
+        """Get the review schedule, loading it from the review history the first time.
+
+        May be called from a background thread.
+
+        Returns:
+            The Scheduler shared by every spaced repetition session.
+        """
 
-        del self.choose_file_frame
-        del self.topic_select_frame
-        del self.display_prompts_frame
-        del self.topic_file
+        with self.scheduler_lock:
+            if self.scheduler is None:
+                self.scheduler = self.review_log.load_scheduler()
 
-        self.topic_file = JSONTopicHandler(MainApp.default_file_path)
-        self.choose_file_frame = ChooseFileFrame(self)
-        self.topic_select_frame = TopicSelectFrame(self)
-        self.display_prompts_frame = DisplayPrompts(self)
+        return self.scheduler
 
     def set_callbacks(self):
         """Define all the callback functions and wrappers to use for bindings."""
 
         def handle_callbacks(event, self=self):
+            # Timed by the screen the key or button was pressed on
+            with metrics.timer("keypress." + self.current_screen):
+                dispatch_callback(event, self)
+
+        def dispatch_callback(event, self=self):
+            if (
+                self.display_prompts_frame is not None
+                and getattr(event, "widget", None)
+                is self.display_prompts_frame.user_answer
+                and event.keysym != "Return"
+            ):
+                # Keys typed into the answer entry are not shortcuts
+                return
             if self.current_screen == "intro_frame":
-                self.update_current_screen(
-                    self.choose_file_frame.S_INDEX, self.current_screen
-                )
-                print("Any key pressed")
+                self.update_current_screen(ChooseFileFrame.S_INDEX, self.current_screen)
+                logger.debug("Any key pressed")
             elif self.current_screen == "display_prompts_frame" and (
                 event.keysym == "Return" or event.keysym == "Right"
             ):
@@ -670,12 +1425,17 @@ class MainApp:
                 and event.keysym == "Left"
             ):
                 self.display_prompts_frame.previous_prompt()
+            elif (
+                self.current_screen == "display_prompts_frame"
+                and event.keysym in GRADE_KEYS
+            ):
+                self.display_prompts_frame.grade_prompt(int(event.keysym))
 
         def next_display_prompt_callback(event, self=self):
-            if self.display_prompts_frame.end_of_prompts is False:
+            if self.display_prompts_frame.session.end_of_prompts is False:
                 self.display_prompts_frame.goto_next_prompt()
             elif (
-                self.display_prompts_frame.end_of_prompts is True
+                self.display_prompts_frame.session.end_of_prompts is True
                 and event.keysym == "Return"
             ):
                 self.update_current_screen(
@@ -689,6 +1449,28 @@ class MainApp:
 
 
 if __name__ == "__main__":
+    # Logging is off unless a level such as DEBUG is set in FLASHCARDS_LOG_LEVEL
+    log_level = os.environ.get("FLASHCARDS_LOG_LEVEL", "WARNING").upper()
+    # getLevelName gives the number of a known level name, and a string otherwise
+    level_known = isinstance(logging.getLevelName(log_level), int)
+    logging.basicConfig(
+        level=log_level if level_known else logging.WARNING,
+        format="%(relativeCreated)d %(name)s %(levelname)s: %(message)s",
+    )
+    if not level_known:
+        logger.warning("Unknown FLASHCARDS_LOG_LEVEL %r, using WARNING", log_level)
+
+    # Only needed at startup, so not imported with the rest of the app
+    import argparse
+
+    import instrumentation
+
+    parser = argparse.ArgumentParser(description="Run FlashCards")
+    parser.add_argument("--metrics", help="write timings as JSON here on exit")
+    parser.add_argument("--profile", help="write a cProfile .pstats file here on exit")
+    args = parser.parse_args()
+    instrumentation.configure(args.metrics, args.profile)
+
     main_window = tk.Tk()
     main_window.title("FlashCards! - The best way to study-")
     main_window.geometry("800x600")
@@ -697,3 +1479,4 @@ if __name__ == "__main__":
     app = MainApp(main_window)
 
     main_window.mainloop()
+    app.review_log.close()
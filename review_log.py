@@ -0,0 +1,435 @@
+"""Module for FlashCards App that keeps a history of every prompt reviewed.
+
+Each review is stored as a card key, the time of the review and the grade it
+was given. Reviews are buffered in memory and appended to a log file in
+batches by a writer thread, so the window never waits on the disk. Once the
+log holds enough reviews it is compacted into a snapshot file holding the
+review schedule of every card, so loading the schedule takes time depending
+on the number of cards rather than every review ever made.
+
+Layout of the log file, all integers are little-endian:
+    header: magic, version and generation.
+    blocks: each block is a uint32 review count followed by that many card
+        keys as int64, review times as float64 seconds since the epoch and
+        grades as int8.
+Layout of the snapshot file:
+    header: snapshot magic, version and generation.
+    schedule: a uint64 card count followed by that many card keys as int64,
+        due times, intervals and eases as float64 and repetitions as int64.
+The snapshot holds the schedule made by every review from the logs up to and
+including its generation, so a log with a generation no newer than the
+snapshot has already been compacted. Storing each block column-wise lets a
+file be loaded with a few array.frombytes calls.
+
+Snapshots from before the schedule was stored hold reviews in the log layout,
+they are replayed when read and replaced by the next compaction.
+
+Classes:
+    ReviewLog
+
+Functions:
+    empty_history
+    read_generation
+    read_history_file
+    read_snapshot_file
+    write_block
+"""
+
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = "reviews.log"
+SNAPSHOT_NAME = "reviews.snapshot"
+MAGIC = b"FCREVIEW"
+VERSION = 1
+SNAPSHOT_MAGIC = b"FCSCHED\x00"
+SNAPSHOT_VERSION = 1
+# magic, version, generation
+HEADER = struct.Struct("<8sHQ")
+# card count of a snapshot
+COUNT = struct.Struct("<Q")
+# Type codes of the key, due, interval, ease and repetitions columns
+SCHEDULE_TYPECODES = ("q", "d", "d", "d", "q")
+# review count
+BLOCK_HEADER = struct.Struct("<I")
+# Bytes taken by one review in a block, a card key, time and grade
+REVIEW_SIZE = 8 + 8 + 1
+
+# The grade stored for a prompt that was reviewed without being graded
+NO_GRADE = -1
+# Reviews buffered before they are written to the log
+FLUSH_REVIEWS = 64
+# Reviews in the log before it is compacted into the snapshot
+COMPACT_REVIEWS = 100_000
+
+
+def empty_history():
+    """Get empty card key, time and grade arrays."""
+
+    return array("q"), array("d"), array("b")
+
+
+def read_generation(path):
+    """Read only the generation from the header of a log or snapshot file.
+
+    Returns:
+        The generation, or None if there is no valid file.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+
+    if len(header) < HEADER.size:
+        return None
+    magic, version, generation = HEADER.unpack(header)
+    if (magic, version) not in ((MAGIC, VERSION), (SNAPSHOT_MAGIC, SNAPSHOT_VERSION)):
+        return None
+
+    return generation
+
+
+def read_snapshot_file(path, clock=time.time):
+    """Read the schedule saved in a snapshot file.
+
+    A snapshot from before the schedule was stored is read as reviews and
+    replayed.
+
+    Args:
+        path: The path of the snapshot file.
+        clock: Passed to the Scheduler.
+
+    Returns:
+        The generation of the file, or None if there is no valid file, and a
+            Scheduler holding its schedule.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, Scheduler(clock)
+
+    if len(data) >= HEADER.size and data.startswith(MAGIC):
+        generation, history = read_history_file(path)[:2]
+        scheduler = Scheduler(clock)
+        scheduler.replay(*history)
+        return generation, scheduler
+
+    if len(data) < HEADER.size + COUNT.size:
+        return None, Scheduler(clock)
+    magic, version, generation = HEADER.unpack_from(data)
+    (count,) = COUNT.unpack_from(data, HEADER.size)
+    size = sum(array(typecode).itemsize for typecode in SCHEDULE_TYPECODES)
+    if (
+        magic != SNAPSHOT_MAGIC
+        or version != SNAPSHOT_VERSION
+        or len(data) < HEADER.size + COUNT.size + count * size
+    ):
+        logger.warning("Ignoring review snapshot file: %s", path)
+        return None, Scheduler(clock)
+
+    view = memoryview(data)
+    start = HEADER.size + COUNT.size
+    columns = []
+    for typecode in SCHEDULE_TYPECODES:
+        column = array(typecode)
+        stop = start + count * column.itemsize
+        column.frombytes(view[start:stop])
+        if sys.byteorder != "little":
+            column.byteswap()
+        columns.append(column)
+        start = stop
+
+    return generation, Scheduler.from_columns(columns, clock)
+
+
+def read_history_file(path):
+    """Read every complete block of a log or snapshot file.
+
+    A block cut short by the program stopping part way through a write is
+    ignored.
+
+    Args:
+        path: The path of the file to read.
+
+    Returns:
+        The generation of the file, or None if there is no valid file, the
+            card key, time and grade arrays of its reviews, and the length in
+            bytes of the complete blocks.
+    """
+
+    history = empty_history()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, history, 0
+
+    if len(data) < HEADER.size:
+        return None, history, 0
+    magic, version, generation = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        logger.warning("Ignoring review history file: %s", path)
+        return None, history, 0
+
+    view = memoryview(data)
+    offset = HEADER.size
+    while offset + BLOCK_HEADER.size <= len(data):
+        (count,) = BLOCK_HEADER.unpack_from(data, offset)
+        start = offset + BLOCK_HEADER.size
+        if start + count * REVIEW_SIZE > len(data):
+            break
+        for column in history:
+            stop = start + count * column.itemsize
+            column.frombytes(view[start:stop])
+            start = stop
+        offset = start
+
+    if sys.byteorder != "little":
+        for column in history:
+            column.byteswap()
+
+    return generation, history, offset
+
+
+def write_block(f, keys, times, grades):
+    """Write the reviews in the given arrays to f as one block."""
+
+    f.write(BLOCK_HEADER.pack(len(keys)))
+    for column in (keys, times, grades):
+        if sys.byteorder != "little":
+            column = array(column.typecode, column)
+            column.byteswap()
+        column.tofile(f)
+
+
+class ReviewLog:
+    """The review history stored in a directory.
+
+    record is called from the Tk main thread and only appends to a buffer. Full
+    buffers are written by a single writer thread, one batch at a time in the
+    order they were recorded, and the same thread compacts the log.
+
+    Attributes:
+        directory
+        flush_reviews
+        compact_reviews
+    """
+
+    def __init__(
+        self, directory, flush_reviews=FLUSH_REVIEWS, compact_reviews=COMPACT_REVIEWS
+    ):
+        """Initialise the history, nothing is read until it is needed.
+
+        Args:
+            directory: The directory holding the log and snapshot files. It is
+                created when the first review is written.
+            flush_reviews: The reviews buffered before they are written.
+            compact_reviews: The reviews in the log before it is compacted.
+        """
+
+        self.directory = Path(directory)
+        self.log_path = self.directory / LOG_NAME
+        self.snapshot_path = self.directory / SNAPSHOT_NAME
+        self.flush_reviews = flush_reviews
+        self.compact_reviews = compact_reviews
+
+        self.buffer = empty_history()
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="review_log")
+        # Reviews in the log file, counted by the writer before its first write
+        self.log_reviews = None
+
+    def record(self, key, grade=NO_GRADE, timestamp=None):
+        """Add a review to the history.
+
+        Args:
+            key: The key of the reviewed card from scheduler.card_key.
+            grade: The grade the card was given, or NO_GRADE.
+            timestamp: The time of the review. Defaults to the current time.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.lock:
+            keys, times, grades = self.buffer
+            keys.append(key)
+            times.append(timestamp)
+            grades.append(grade)
+            full = len(keys) >= self.flush_reviews
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Start writing the buffered reviews on the writer thread.
+
+        Returns:
+            A Future that is done once the reviews are written.
+        """
+
+        with self.lock:
+            batch = self.buffer
+            self.buffer = empty_history()
+
+        return self.writer.submit(self.append_batch, *batch)
+
+    def load_scheduler(self, clock=time.time):
+        """Load the review schedule, including reviews that are still buffered.
+
+        Must not be called from the writer thread.
+
+        Args:
+            clock: Passed to the Scheduler.
+
+        Returns:
+            A Scheduler with the schedule from the snapshot and every review in
+                the log since it replayed.
+        """
+
+        self.flush()
+        return self.writer.submit(self.read_scheduler, clock).result()
+
+    def compact(self):
+        """Start compacting the log into the snapshot on the writer thread.
+
+        Returns:
+            A Future that is done once the log has been compacted.
+        """
+
+        self.flush()
+        return self.writer.submit(self.compact_files)
+
+    def close(self):
+        """Write any buffered reviews and wait for the writer to finish."""
+
+        self.flush()
+        self.writer.shutdown(wait=True)
+
+    def append_batch(self, keys, times, grades):
+        """Append a batch of reviews to the log, run on the writer thread."""
+
+        if len(keys) == 0:
+            return
+
+        try:
+            if self.log_reviews is None:
+                generation, history, size = read_history_file(self.log_path)
+                snapshot_generation = self.snapshot_generation()
+                if generation is None or generation <= snapshot_generation:
+                    # A log no newer than the snapshot is left when compaction
+                    # stops before starting the new log. Its reviews are
+                    # already in the snapshot and new ones would be ignored.
+                    self.start_log(snapshot_generation + 1)
+                    history = empty_history()
+                elif size < self.log_path.stat().st_size:
+                    # Drop a block cut short so new blocks can be read after it
+                    os.truncate(self.log_path, size)
+                self.log_reviews = len(history[0])
+
+            with open(self.log_path, "ab") as f:
+                write_block(f, keys, times, grades)
+            self.log_reviews += len(keys)
+        except OSError:
+            logger.warning("Could not write %d reviews to %s", len(keys), self.log_path)
+            return
+
+        if self.log_reviews >= self.compact_reviews:
+            self.compact_files()
+
+    def read_scheduler(self, clock=time.time):
+        """Read the snapshot and replay the log, run on the writer thread.
+
+        Returns:
+            A Scheduler of every review written so far.
+        """
+
+        snapshot_generation, scheduler = read_snapshot_file(self.snapshot_path, clock)
+        log_generation, history = read_history_file(self.log_path)[:2]
+        if log_generation is not None and (
+            snapshot_generation is None or log_generation > snapshot_generation
+        ):
+            scheduler.replay(*history)
+
+        return scheduler
+
+    def compact_files(self):
+        """Merge the log into the snapshot and start a new log.
+
+        Run on the writer thread. The new snapshot replaces the old one before
+        the log is replaced, so stopping part way through never loses or
+        repeats a review. Reviews without a grade don't change the schedule,
+        so they are not kept.
+        """
+
+        log_generation = read_generation(self.log_path)
+        if log_generation is None:
+            return
+
+        scheduler = self.read_scheduler()
+        try:
+            self.replace_snapshot(log_generation, scheduler)
+            self.start_log(log_generation + 1)
+        except OSError:
+            logger.warning("Could not compact %s", self.log_path)
+            return
+
+        self.log_reviews = 0
+        logger.debug(
+            "Compacted the schedule of %d cards into %s",
+            len(scheduler),
+            self.snapshot_path,
+        )
+
+    def snapshot_generation(self):
+        """Get the generation of the snapshot, 0 if there is none."""
+
+        generation = read_generation(self.snapshot_path)
+        return 0 if generation is None else generation
+
+    def start_log(self, generation):
+        """Replace the log with an empty one of the given generation."""
+
+        self.replace_file(self.log_path, generation, empty_history())
+
+    def replace_file(self, path, generation, history):
+        """Atomically replace path with a log holding history as one block."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, generation))
+            if len(history[0]):
+                write_block(f, *history)
+        os.replace(temp_path, path)
+
+    def replace_snapshot(self, generation, scheduler):
+        """Atomically replace the snapshot with the schedule of scheduler."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation))
+            f.write(COUNT.pack(len(scheduler)))
+            for column in scheduler.columns():
+                if sys.byteorder != "little":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(f)
+        os.replace(temp_path, self.snapshot_path)
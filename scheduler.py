@@ -0,0 +1,294 @@
+"""Module for FlashCards App that schedules prompts for spaced repetition.
+
+The Scheduler tracks each card with the SM-2 algorithm: a card answered well
+is shown again after a growing number of days, and a card answered badly
+starts again from a one day interval. A ReviewSession shows the due cards of
+the chosen topics, earliest due first, by popping them from a heap.
+
+Cards are identified by a key hashed from their topic name and prompt, so the
+schedule of a card is kept when a deck is reordered or converted to another
+backend.
+
+Classes:
+    Scheduler
+    ReviewSession
+
+Functions:
+    card_key
+"""
+
+import hashlib
+import heapq
+import time
+
+from array import array
+
+from background import report_progress
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# The grades a prompt can be given, from 0 (no memory of it) to 5 (perfect)
+GRADES = range(6)
+# Reviews replayed between each progress report
+REPLAY_CHUNK = 65536
+# Prompts graded below this are shown again before the session ends
+REPEAT_BELOW = 4
+INITIAL_EASE = 2.5
+MINIMUM_EASE = 1.3
+
+
+def card_key(topic, prompt):
+    """Get the key identifying a card by its topic name and prompt.
+
+    Returns:
+        A signed 64 bit int.
+    """
+
+    digest = hashlib.blake2b(
+        topic.encode("utf-8") + b"\x00" + prompt.encode("utf-8"), digest_size=8
+    ).digest()
+
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class Scheduler:
+    """The SM-2 review schedule of every card that has been seen.
+
+    The schedule is stored column-wise, with a slot in each column for every
+    card, so millions of cards take little memory. A card that has never been
+    graded is due straight away.
+
+    Attributes:
+        slots
+        due
+        interval
+        ease
+        repetitions
+    """
+
+    def __init__(self, clock=time.time):
+        """Initialise an empty schedule.
+
+        Args:
+            clock: Returns the current time in seconds, used when no time is
+                given.
+        """
+
+        self.clock = clock
+        # Maps each card key to its slot in the columns
+        self.slots = {}
+        # The time each card is next due, in seconds since the epoch
+        self.due = array("d")
+        # The days between the last review of each card and the next
+        self.interval = array("d")
+        self.ease = array("d")
+        # The number of reviews in a row each card has passed
+        self.repetitions = array("q")
+
+    def __len__(self):
+        return len(self.slots)
+
+    def columns(self):
+        """Get the schedule of every card as columns, such as to save it.
+
+        Returns:
+            The key, due time, interval, ease and repetitions arrays, with an
+                entry for each card in the same order.
+        """
+
+        return (
+            array("q", self.slots),
+            self.due,
+            self.interval,
+            self.ease,
+            self.repetitions,
+        )
+
+    @classmethod
+    def from_columns(cls, columns, clock=time.time):
+        """Make a schedule from the columns of another, as given by columns.
+
+        Takes time depending on the number of cards rather than the number of
+        reviews that made the schedule.
+
+        Args:
+            columns: The key, due time, interval, ease and repetitions arrays.
+            clock: Returns the current time in seconds.
+
+        Returns:
+            A new Scheduler holding the columns.
+        """
+
+        keys, due, interval, ease, repetitions = columns
+        scheduler = cls(clock)
+        scheduler.slots = dict(zip(keys, range(len(keys))))
+        scheduler.due = due
+        scheduler.interval = interval
+        scheduler.ease = ease
+        scheduler.repetitions = repetitions
+
+        return scheduler
+
+    def due_time(self, key):
+        """Get the time a card is next due, 0 for a card that was never graded."""
+
+        slot = self.slots.get(key)
+        return 0.0 if slot is None else self.due[slot]
+
+    def grade(self, key, quality, now=None):
+        """Record a review of a card and schedule its next review.
+
+        Args:
+            key: The key of the card from card_key.
+            quality: How well the card was remembered, one of GRADES.
+            now: The time of the review. Defaults to the current time.
+
+        Returns:
+            The time the card is next due.
+
+        Raises:
+            ValueError: quality is not one of GRADES.
+        """
+
+        if quality not in GRADES:
+            raise ValueError("Invalid grade: " + str(quality))
+        if now is None:
+            now = self.clock()
+
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.due)
+            self.due.append(0.0)
+            self.interval.append(0.0)
+            self.ease.append(INITIAL_EASE)
+            self.repetitions.append(0)
+
+        if quality >= 3:
+            if self.repetitions[slot] == 0:
+                self.interval[slot] = 1
+            elif self.repetitions[slot] == 1:
+                self.interval[slot] = 6
+            else:
+                self.interval[slot] = round(self.interval[slot] * self.ease[slot])
+            self.repetitions[slot] += 1
+        else:
+            self.repetitions[slot] = 0
+            self.interval[slot] = 1
+
+        miss = 5 - quality
+        self.ease[slot] = max(
+            MINIMUM_EASE, self.ease[slot] + 0.1 - miss * (0.08 + miss * 0.02)
+        )
+        self.due[slot] = now + self.interval[slot] * SECONDS_PER_DAY
+
+        return self.due[slot]
+
+    def replay(self, keys, times, grades):
+        """Grade cards from a review history, in the order they were reviewed.
+
+        Reviews without a valid grade are skipped.
+
+        Args:
+            keys: The key of the card of each review.
+            times: The time of each review.
+            grades: The grade of each review.
+        """
+
+        for start in range(0, len(keys), REPLAY_CHUNK):
+            report_progress(start, len(keys), "Loading review history")
+            stop = min(start + REPLAY_CHUNK, len(keys))
+            for i in range(start, stop):
+                if grades[i] in GRADES:
+                    self.grade(keys[i], grades[i], times[i])
+
+    def session(self, topic_file, now=None):
+        """Start a review session over the chosen topics of a deck.
+
+        Args:
+            topic_file: A JSONTopicHandler with its topics chosen.
+            now: The time the session starts. Defaults to the current time.
+
+        Returns:
+            A ReviewSession of the cards that are due.
+        """
+
+        if now is None:
+            now = self.clock()
+
+        return ReviewSession(self, topic_file, now)
+
+
+class ReviewSession:
+    """The due cards of the chosen topics in the order they are reviewed.
+
+    Behaves as the prompt_order sequence of a JSONTopicHandler. Each time the
+    position after the last card shown is indexed, the earliest due card is
+    popped from a heap, so choosing the next card takes O(log n) time. Cards
+    graded below REPEAT_BELOW go back on the heap to be shown again, as SM-2
+    repeats them until they are remembered.
+    """
+
+    def __init__(self, scheduler, topic_file, now):
+        """Collect the due cards of the chosen topics.
+
+        Args:
+            scheduler: The Scheduler the cards are graded in.
+            topic_file: A JSONTopicHandler with its topics chosen.
+            now: The time the session starts.
+        """
+
+        self.scheduler = scheduler
+        # The cards in the order they were shown
+        self.shown = array("l")
+        # Maps each card in the session to its key
+        self.keys = {}
+
+        self.heap = []
+        for topic in topic_file.chosen_topics:
+            for card in range(*topic_file.topic_index[topic]):
+                key = card_key(topic, topic_file.prompt_column[card])
+                due = scheduler.due_time(key)
+                if due <= now:
+                    self.keys[card] = key
+                    self.heap.append((due, card))
+        heapq.heapify(self.heap)
+        self.queued = {card for due, card in self.heap}
+
+    def __len__(self):
+        return len(self.shown) + len(self.heap)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        while index >= len(self.shown) and self.heap:
+            due, card = heapq.heappop(self.heap)
+            self.queued.discard(card)
+            self.shown.append(card)
+        if not 0 <= index < len(self.shown):
+            raise IndexError("prompt index out of range")
+
+        return self.shown[index]
+
+    def grade(self, index, quality, now=None):
+        """Grade the card shown at index.
+
+        Args:
+            index: The position of the card in the session.
+            quality: How well the card was remembered, one of GRADES.
+            now: The time of the review. Defaults to the current time.
+
+        Returns:
+            The time the card is next due.
+        """
+
+        if now is None:
+            now = self.scheduler.clock()
+
+        card = self.shown[index]
+        due = self.scheduler.grade(self.keys[card], quality, now)
+        if quality < REPEAT_BELOW and card not in self.queued:
+            # Due now, which is after every card that was due when the session
+            # started
+            heapq.heappush(self.heap, (now, card))
+            self.queued.add(card)
+
+        return due
@@ -0,0 +1,461 @@
+"""Module for FlashCards App that finds cards by the words in them.
+
+SearchIndex is an inverted index mapping each word in the prompts and answers
+of a deck to the cards it appears in. Words are split the same way as typed
+answers are checked, so searches ignore case and punctuation. A query matches
+the cards holding every one of its words, and the last word can match as a
+prefix so results show while it is still being typed.
+
+The index is saved to a hidden file next to the deck and read back while the
+deck file is unchanged. When the deck changes the index is updated topic by
+topic: only topics whose name, prompts or answers have changed are split into
+words again, the cards of every other topic are moved to their new positions.
+
+Layout of an index file, all integers are little-endian:
+    header: magic, version, the size and modification time of the deck file it
+        was built from, and the topic, token and posting counts.
+    topic table: the card start, card stop and digest of each topic as int64.
+    token offsets: token count + 1 int64 offsets into the postings. The cards
+        holding token i run from offset i to offset i + 1.
+    postings: the cards holding each token as sorted int64.
+    topic name lengths: the length in bytes of each topic name as uint32.
+    strings: the UTF-8 topic names with no separators, then the sorted tokens
+        separated by newlines, which a token never contains.
+
+Classes:
+    SearchIndex
+
+Functions:
+    topic_digest
+    index_path
+    read_index_file
+    load_index
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import sys
+import threading
+
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from answer_check import tokenise
+from background import report_progress
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".fcindex"
+MAGIC = b"FCINDEX\x00"
+VERSION = 1
+# magic, version, deck size, deck modification time, topic, token and posting
+# counts
+HEADER = struct.Struct("<8sHQqQQQ")
+# Sorts after every token that starts with a given prefix
+PREFIX_END = chr(sys.maxunicode)
+# Postings per match above which each match is looked up with a binary search
+# rather than collecting the postings into a set
+PROBE_RATIO = 16
+# The shortest word matched as a prefix, shorter words start too many tokens to
+# narrow a search down
+MIN_PREFIX = 2
+
+# The index of the most recently searched deck, keyed by its path, size and
+# modification time so it is only read from disk again when the deck changes
+index_cache = {}
+index_cache_lock = threading.Lock()
+
+
+def topic_digest(topic, rows):
+    """Get a digest of a topic's name, prompts and answers.
+
+    Args:
+        topic: The topic name.
+        rows: The (card, prompt, answer) of each card of the topic. Only the
+            prompts and answers are digested, so moving a topic keeps its
+            digest.
+
+    Returns:
+        A signed 64 bit int.
+    """
+
+    digest = hashlib.blake2b(topic.encode("utf-8"), digest_size=8)
+    for card, prompt, answer in rows:
+        digest.update(
+            b"\x00" + prompt.encode("utf-8") + b"\x00" + answer.encode("utf-8")
+        )
+
+    return int.from_bytes(digest.digest(), "little", signed=True)
+
+
+def index_path(deck_path):
+    """Get the path of the search index file of a deck.
+
+    The file is hidden so it is not listed as a deck.
+    """
+
+    deck_path = Path(deck_path)
+    return deck_path.with_name("." + deck_path.name + INDEX_SUFFIX)
+
+
+def write_array(f, column):
+    """Write an array to f in little-endian byte order."""
+
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    column.tofile(f)
+
+
+def read_array(typecode, data, start, count):
+    """Read count little-endian items from data at start.
+
+    Returns:
+        The array and the offset just after it.
+    """
+
+    column = array(typecode)
+    stop = start + count * column.itemsize
+    if stop > len(data):
+        raise ValueError("Truncated search index")
+    column.frombytes(data[start:stop])
+    if sys.byteorder != "little":
+        column.byteswap()
+
+    return column, stop
+
+
+class SearchIndex:
+    """An inverted index from words to the cards of a deck that hold them.
+
+    The tokens are kept in a sorted list so the tokens starting with a prefix
+    are found with a binary search. The cards holding each token are stored in
+    one postings array in token order, so the index takes little memory and
+    the tokens starting with a prefix have their cards next to each other.
+
+    Attributes:
+        tokens
+        offsets
+        postings
+        topics
+    """
+
+    def __init__(self, tokens=None, offsets=None, postings=None, topics=None):
+        """Initialise an index, empty unless its contents are given.
+
+        Args:
+            tokens: The sorted list of tokens.
+            offsets: The start of the cards of each token in postings, followed
+                by the length of postings.
+            postings: The sorted cards of each token, in token order.
+            topics: Maps each topic name to the (start, stop, digest) of the
+                topic when it was indexed.
+        """
+
+        self.tokens = [] if tokens is None else tokens
+        self.offsets = array("q", [0]) if offsets is None else offsets
+        self.postings = array("q") if postings is None else postings
+        self.topics = {} if topics is None else topics
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def token_range(self, word, prefix=False):
+        """Get the (start, stop) range of tokens matching a word.
+
+        Args:
+            word: A token from answer_check.tokenise.
+            prefix: True to match every token starting with word, if word is at
+                least MIN_PREFIX characters long.
+        """
+
+        start = bisect_left(self.tokens, word)
+        if prefix and len(word) >= MIN_PREFIX:
+            stop = bisect_left(self.tokens, word + PREFIX_END, start)
+        elif start < len(self.tokens) and self.tokens[start] == word:
+            stop = start + 1
+        else:
+            stop = start
+
+        return start, stop
+
+    def range_size(self, token_range):
+        """Get the number of postings of a range of tokens."""
+
+        return self.offsets[token_range[1]] - self.offsets[token_range[0]]
+
+    def range_cards(self, start, stop):
+        """Get the sorted cards holding any token in a range of tokens."""
+
+        cards = self.postings[self.offsets[start] : self.offsets[stop]]
+        if stop - start > 1:
+            # A card can hold more than one of the tokens
+            cards = array("q", sorted(set(cards)))
+
+        return cards
+
+    def filter_cards(self, cards, start, stop):
+        """Keep the cards that hold any token in a range of tokens.
+
+        Args:
+            cards: Sorted cards.
+            start: The first token of the range.
+            stop: The token after the last token of the range.
+
+        Returns:
+            The sorted cards that are kept.
+        """
+
+        first, last = self.offsets[start], self.offsets[stop]
+        if stop - start == 1 and len(cards) * PROBE_RATIO < last - first:
+            # A common token, cheaper to look up each card in its postings
+            postings = self.postings
+            return array(
+                "q",
+                (
+                    card
+                    for card in cards
+                    if (i := bisect_left(postings, card, first, last)) < last
+                    and postings[i] == card
+                ),
+            )
+
+        kept = set(self.postings[first:last])
+        return array("q", (card for card in cards if card in kept))
+
+    def search(self, query, prefix=False):
+        """Find the cards holding every word of a query.
+
+        The word with the fewest cards is looked up first and the other words
+        only filter its cards, so a query takes time depending on the number
+        of cards holding its rarest word rather than the size of the deck.
+
+        Args:
+            query: The words to search for.
+            prefix: True to match the last word of the query as a prefix.
+
+        Returns:
+            An array of the matching cards in card order.
+        """
+
+        words = tokenise(query)
+        if not words:
+            return array("q")
+
+        token_ranges = [self.token_range(word) for word in words[:-1]]
+        token_ranges.append(self.token_range(words[-1], prefix))
+        token_ranges.sort(key=self.range_size)
+
+        cards = self.range_cards(*token_ranges[0])
+        for token_range in token_ranges[1:]:
+            if not cards:
+                break
+            cards = self.filter_cards(cards, *token_range)
+
+        return cards
+
+    def update(self, topic_file):
+        """Bring the index up to date with a deck, splitting only changed topics.
+
+        Args:
+            topic_file: A JSONTopicHandler for the deck.
+
+        Returns:
+            The number of topics that were split into words again.
+        """
+
+        # Maps each card of an unchanged topic to its card in the new deck, -1
+        # for the cards of topics that changed or were removed
+        old_cards = max(
+            (stop for start, stop, digest in self.topics.values()), default=0
+        )
+        moves = array("q", [-1]) * old_cards
+        postings = {}
+        topics = {}
+        changed = 0
+
+        for i, topic in enumerate(topic_file.topics):
+            report_progress(i, len(topic_file.topics), "Indexing topics")
+            rows = list(topic_file.topic_prompts(topic))
+            start, stop = topic_file.topic_index[topic]
+            digest = topic_digest(topic, rows)
+            topics[topic] = (start, stop, digest)
+
+            old = self.topics.get(topic)
+            if old is not None and old[2] == digest:
+                moves[old[0] : old[1]] = array("q", range(start, stop))
+                continue
+
+            changed += 1
+            for card, prompt, answer in rows:
+                for token in set(tokenise(prompt + "\n" + answer)):
+                    cards = postings.get(token)
+                    if cards is None:
+                        cards = postings[token] = array("q")
+                    cards.append(card)
+
+        # Tokens given moved cards, which can be out of order
+        merged = set()
+        for i, token in enumerate(self.tokens):
+            start, stop = self.offsets[i], self.offsets[i + 1]
+            moved = array(
+                "q",
+                (moves[card] for card in self.postings[start:stop] if moves[card] >= 0),
+            )
+            if moved:
+                merged.add(token)
+                cards = postings.get(token)
+                if cards is None:
+                    postings[token] = moved
+                else:
+                    cards.extend(moved)
+
+        report_progress(1, 1, "Sorting search index")
+        self.tokens = sorted(postings)
+        self.offsets = array("q", [0])
+        self.postings = array("q")
+        for token in self.tokens:
+            cards = postings[token]
+            if token in merged:
+                cards = sorted(cards)
+            self.postings.extend(cards)
+            self.offsets.append(len(self.postings))
+        self.topics = topics
+
+        logger.debug("Indexed %d changed topics, %d tokens", changed, len(self.tokens))
+        return changed
+
+    def save(self, path, deck_size, deck_mtime_ns):
+        """Atomically write the index to a file.
+
+        Args:
+            path: The path of the index file.
+            deck_size: The size of the deck file the index was built from.
+            deck_mtime_ns: The modification time of the deck file.
+        """
+
+        table = array("q")
+        for start, stop, digest in self.topics.values():
+            table.extend((start, stop, digest))
+        names = [topic.encode("utf-8") for topic in self.topics]
+        lengths = array("I", map(len, names))
+
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    deck_size,
+                    deck_mtime_ns,
+                    len(self.topics),
+                    len(self.tokens),
+                    len(self.postings),
+                )
+            )
+            for column in (table, self.offsets, self.postings, lengths):
+                write_array(f, column)
+            f.write(b"".join(names))
+            f.write("\n".join(self.tokens).encode("utf-8"))
+        os.replace(temp_path, path)
+
+
+def read_index_file(path):
+    """Read a search index file.
+
+    Args:
+        path: The path of the index file.
+
+    Returns:
+        The size and modification time of the deck file the index was built
+            from and the SearchIndex, or None if there is no valid index file.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        if len(data) < HEADER.size:
+            raise ValueError("Truncated search index")
+        (
+            magic,
+            version,
+            deck_size,
+            deck_mtime_ns,
+            topic_count,
+            token_count,
+            posting_count,
+        ) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a search index")
+
+        view = memoryview(data)
+        table, offset = read_array("q", view, HEADER.size, 3 * topic_count)
+        offsets, offset = read_array("q", view, offset, token_count + 1)
+        postings, offset = read_array("q", view, offset, posting_count)
+        lengths, offset = read_array("I", view, offset, topic_count)
+
+        topics = {}
+        for t, length in enumerate(lengths):
+            name = str(view[offset : offset + length], "utf-8")
+            topics[name] = (table[3 * t], table[3 * t + 1], table[3 * t + 2])
+            offset += length
+        tokens = str(view[offset:], "utf-8").split("\n") if token_count else []
+        if len(tokens) != token_count or offsets[-1] != posting_count:
+            raise ValueError("Truncated search index")
+    except ValueError:
+        logger.warning("Ignoring search index file: %s", path)
+        return None
+
+    return deck_size, deck_mtime_ns, SearchIndex(tokens, offsets, postings, topics)
+
+
+def load_index(topic_file):
+    """Get the search index of a deck, updating its index file if needed.
+
+    The index is read from the file next to the deck while the deck is
+    unchanged. Otherwise it is updated from the deck and saved, which takes a
+    while for a large deck so should be run as a background task.
+
+    Args:
+        topic_file: A JSONTopicHandler for the deck.
+
+    Returns:
+        A SearchIndex.
+    """
+
+    path = Path(topic_file.fpath).resolve()
+    stat = path.stat()
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    with index_cache_lock:
+        index = index_cache.get(key)
+    if index is not None:
+        return index
+
+    file_path = index_path(path)
+    stored = read_index_file(file_path)
+    if stored is not None and stored[:2] == key[1:]:
+        index = stored[2]
+    else:
+        index = SearchIndex() if stored is None else stored[2]
+        with metrics.timer("search.update"):
+            index.update(topic_file)
+        try:
+            index.save(file_path, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            logger.warning("Could not save search index: %s", file_path)
+
+    with index_cache_lock:
+        # Only the index of one deck is kept in memory
+        index_cache.clear()
+        index_cache[key] = index
+
+    return index
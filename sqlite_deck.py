@@ -0,0 +1,239 @@
+"""Module for FlashCards App that provides SQLite deck support.
+
+A FlashCards JSON topic file can be imported into a .fcdb SQLite database with
+indexed topic and prompt tables. Opening the database only reads the topic
+table, the prompts are queried for the chosen topics when they are collected.
+
+Schema:
+    topics: id, name, card_start, card_stop
+    prompts: id, topic_id, prompt, answer
+The id of a prompt is its card index, so the cards of each topic fill the
+(card_start, card_stop) range of the topic.
+
+Classes:
+    LoadedColumn(LazyColumn)
+    SQLiteTopicHandler(LazyTopicHandler)
+
+Run this script with JSON topic files as arguments to import them, or with no
+arguments to import every JSON file in the resources directory.
+"""
+
+import argparse
+import os
+import sqlite3
+
+from pathlib import Path
+
+from handle_json import InvalidDeckError
+from handle_json import JSONTopicHandler
+from handle_json import LazyColumn
+from handle_json import LazyTopicHandler
+
+DECK_SUFFIX = ".fcdb"
+# Run one at a time, as executescript would commit part way through an import
+SCHEMA = (
+    """CREATE TABLE topics (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    card_start INTEGER NOT NULL,
+    card_stop INTEGER NOT NULL
+)""",
+    """CREATE TABLE prompts (
+    id INTEGER PRIMARY KEY,
+    topic_id INTEGER NOT NULL REFERENCES topics (id),
+    prompt TEXT NOT NULL,
+    answer TEXT NOT NULL
+)""",
+    "CREATE INDEX prompts_topic_id ON prompts (topic_id)",
+)
+
+
+class LoadedColumn(LazyColumn):
+    """A column of the prompts table, fetching unloaded cards with a query."""
+
+    def __init__(self, connection, field, length):
+        """Initialise an empty column over the prompts table.
+
+        Args:
+            connection: The sqlite3 connection to the deck.
+            field: The column of the prompts table, "prompt" or "answer".
+            length: The number of cards in the deck.
+        """
+
+        super().__init__(length)
+        self.connection = connection
+        self.query = "SELECT " + field + " FROM prompts WHERE id = ?"
+
+    def fetch(self, card):
+        """Overrides LazyColumn to query the card from the prompts table."""
+
+        row = self.connection.execute(self.query, (card,)).fetchone()
+        if row is None:
+            raise IndexError("card index out of range")
+        return row[0]
+
+
+class SQLiteTopicHandler(LazyTopicHandler):
+    """A FlashCards deck stored in an SQLite database.
+
+    Opening the deck only reads the topics table. The prompts of a chosen
+    topic are loaded with one indexed query, and a card of any other topic is
+    queried by its id when it is indexed.
+
+    Attributes:
+        connection
+    """
+
+    @classmethod
+    def get_js(cls, fname):
+        """Overrides JSONHandler to open a read only connection to the database."""
+
+        if not Path(fname).is_file():
+            raise FileNotFoundError("No such deck file: " + str(fname))
+
+        # The deck may be opened on a background thread and used on the main one
+        return sqlite3.connect(
+            Path(fname).resolve().as_uri() + "?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+
+    def build_columns(self):
+        """Overrides JSONTopicHandler to read the topics table of the database.
+
+        Returns:
+            A dict keyed by topic name with the (start, stop) range of that
+                topic's cards as the value.
+
+        Raises:
+            InvalidDeckError: The file is not a FlashCards SQLite deck.
+        """
+
+        self.connection = self.raw_string
+        try:
+            rows = self.connection.execute(
+                "SELECT name, card_start, card_stop FROM topics ORDER BY id"
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            self.connection.close()
+            raise InvalidDeckError(self.fpath)
+
+        # Topics are stored in card order so the last topic ends the deck
+        self.new_columns(rows[-1][2] if rows else 0)
+
+        return {name: (start, stop) for name, start, stop in rows}
+
+    def new_columns(self, card_count):
+        """Overrides LazyTopicHandler to make columns over the prompts table."""
+
+        self.prompt_column = LoadedColumn(self.connection, "prompt", card_count)
+        self.answer_column = LoadedColumn(self.connection, "answer", card_count)
+
+    def load_cards(self, topic, cards=None):
+        """Overrides LazyTopicHandler to query the prompts of the topic at once.
+
+        Args:
+            topic: The name of a topic from the file.
+            cards: The cards of the topic to load, or None to load every card.
+        """
+
+        wanted = None if cards is None else set(cards)
+        for card, prompt, answer in self.topic_prompts(topic):
+            if wanted is None or card in wanted:
+                self.prompt_column.cards[card] = prompt
+                self.answer_column.cards[card] = answer
+
+    def topic_prompts(self, topic):
+        """Overrides JSONTopicHandler to read the cards of a topic in one query.
+
+        Args:
+            topic: The name of a topic from the file.
+        """
+
+        yield from self.connection.execute(
+            "SELECT prompts.id, prompt, answer FROM prompts"
+            " JOIN topics ON topics.id = prompts.topic_id WHERE topics.name = ?"
+            " ORDER BY prompts.id",
+            (topic,),
+        )
+
+
+def import_json(json_path, db_path=None):
+    """Import a FlashCards JSON topic file into a .fcdb SQLite deck.
+
+    Any existing deck at db_path is replaced. The deck is built in a single
+    transaction in a temporary file that then replaces db_path, so an import
+    stopped part way never leaves a broken deck to be reused.
+
+    Args:
+        json_path: The path of the JSON topic file to import.
+        db_path: The path to write the deck to. Defaults to json_path with the
+            .fcdb suffix.
+
+    Returns:
+        The path of the SQLite deck.
+    """
+
+    if db_path is None:
+        db_path = Path(json_path).with_suffix(DECK_SUFFIX)
+    db_path = Path(db_path)
+    temp_path = db_path.with_name(db_path.name + ".tmp")
+
+    topic_file = JSONTopicHandler(json_path)
+    temp_path.unlink(missing_ok=True)
+
+    # Begun explicitly so the schema is created in the same transaction as
+    # the inserts, sqlite3 only begins one itself before an insert
+    connection = sqlite3.connect(temp_path, isolation_level=None)
+    try:
+        connection.execute("BEGIN")
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            for topic_id, (name, (start, stop)) in enumerate(
+                topic_file.topic_index.items()
+            ):
+                connection.execute(
+                    "INSERT INTO topics VALUES (?, ?, ?, ?)",
+                    (topic_id, name, start, stop),
+                )
+                connection.executemany(
+                    "INSERT INTO prompts VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            card,
+                            topic_id,
+                            topic_file.prompt_column[card],
+                            topic_file.answer_column[card],
+                        )
+                        for card in range(start, stop)
+                    ),
+                )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+
+    return db_path
+
+
+def main(argv=None):
+    """Import the JSON topic files given on the command line."""
+
+    parser = argparse.ArgumentParser(description="Import FlashCards JSON topic files")
+    parser.add_argument("files", nargs="*", type=Path, help="JSON topic files")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(Path.cwd().joinpath("resources").glob("*.json"))
+    for json_path in files:
+        try:
+            print("Imported: " + str(import_json(json_path)))
+        except ValueError:
+            print("Not a valid FlashCards file: " + str(json_path))
+
+
+if __name__ == "__main__":
+    main()
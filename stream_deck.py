@@ -0,0 +1,736 @@
+"""Module for FlashCards App that reads JSON topic files too big to parse at once.
+
+Opening a deck with the stream backend walks the top-level topic array one
+topic at a time and keeps only the name, byte range and prompt count of each
+topic. The prompts of a topic are read from its byte range when it is chosen
+and released when it is unchosen, so the memory used follows the chosen topics
+rather than the size of the file.
+
+Only UTF-8 files can be streamed, as the byte range of a topic is found from
+the length of its UTF-8 encoding. The topics found by the scan are saved to a
+hidden offsets file next to the deck, so the file is only scanned again once
+it changes.
+
+The budget backend goes further and keeps no prompts in memory for the chosen
+topics. Prompts are read a topic at a time when they are indexed and kept in a
+least recently used cache that holds at most a budget of bytes, dropping
+unchosen topics before chosen ones. The budget is DEFAULT_BUDGET_BYTES unless
+the FLASHCARDS_DECK_BUDGET environment variable gives another number of
+bytes, which also opens every JSON topic file with the budget backend.
+
+Layout of an offsets file, all integers are little-endian:
+    header: magic, version, the size and modification time of the deck file it
+        was scanned from, and the topic count.
+    topic table: the byte start, byte stop and prompt count of each topic
+        object in the file as int64, in file order.
+    topic name lengths: the length in bytes of each topic name as uint32.
+    topic names: the UTF-8 topic names with no separators.
+
+Classes:
+    TopicSpan
+    TopicScanner
+    TopicReader
+    TopicCache
+    StreamedColumn(LazyColumn)
+    StreamingTopicHandler(LazyTopicHandler)
+    BudgetedTopicHandler(StreamingTopicHandler)
+
+Functions:
+    scan_topics
+    offsets_path
+    save_offsets
+    read_offsets_file
+    load_spans
+    budget_bytes
+"""
+
+import codecs
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from collections import namedtuple
+from pathlib import Path
+
+from background import report_progress
+from handle_json import DECK_BUDGET_ENV
+from handle_json import InvalidDeckError
+from handle_json import LazyColumn
+from handle_json import LazyTopicHandler
+from handle_json import json_parser
+from handle_json import parse_json_bytes
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the file at a time while scanning
+SCAN_CHUNK_SIZE = 1024 * 1024
+UTF8_BOM = codecs.BOM_UTF8
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+OFFSETS_SUFFIX = ".fcoffsets"
+OFFSETS_MAGIC = b"FCOFFSET"
+OFFSETS_VERSION = 1
+# magic, version, deck size, deck modification time, topic count
+OFFSETS_HEADER = struct.Struct("<8sHQqQ")
+
+# Bytes of prompts a budgeted deck keeps in memory by default
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+# A topic found by scan_topics: its name, the byte offsets of the start and
+# end of its JSON object in the file, and its number of prompts
+TopicSpan = namedtuple("TopicSpan", ["name", "start", "stop", "count"])
+
+
+class TopicScanner:
+    """Walks the top-level topic array of an open JSON topic file.
+
+    The file is decoded a chunk at a time and each topic object is parsed on
+    its own, so only one topic and one chunk of text are held at once. A topic
+    bigger than a chunk is read in more chunks until it is complete.
+    """
+
+    def __init__(self, f, chunk_size=SCAN_CHUNK_SIZE):
+        """Initialise a scanner at the start of f.
+
+        Args:
+            f: The JSON topic file, opened in binary mode.
+            chunk_size: The bytes read from f at a time.
+        """
+
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.size = os.fstat(f.fileno()).st_size
+        # Decoded text not yet scanned starts at text[pos], which is at byte
+        # offset in the file
+        self.text = ""
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+
+    def __iter__(self):
+        """Yield the TopicSpan of each topic in the file.
+
+        Raises:
+            InvalidDeckError: The file is not a UTF-8 list of topics.
+        """
+
+        head = self.f.read(len(UTF8_BOM))
+        if head == UTF8_BOM:
+            self.offset = len(UTF8_BOM)
+        else:
+            self.f.seek(0)
+
+        if self.next_char() != "[":
+            raise InvalidDeckError(self.f.name, "Not a list of topics")
+        self.consume(self.pos + 1)
+        if self.next_char() == "]":
+            self.finish()
+            return
+
+        while True:
+            # raw_decode doesn't skip whitespace before the value
+            self.next_char()
+            topic, end = self.decode_topic()
+            if (
+                not isinstance(topic, dict)
+                or not isinstance(topic.get("topic_name"), str)
+                or not isinstance(topic.get("prompts"), list)
+            ):
+                raise InvalidDeckError(self.f.name, "Not a FlashCards topic")
+
+            start = self.offset
+            self.consume(end)
+            yield TopicSpan(
+                topic["topic_name"], start, self.offset, len(topic["prompts"])
+            )
+            report_progress(self.offset, self.size, "Scanning topics")
+
+            separator = self.next_char()
+            if separator == "]":
+                self.finish()
+                return
+            if separator != ",":
+                raise InvalidDeckError(self.f.name, "Expected , between topics")
+            self.consume(self.pos + 1)
+
+    def finish(self):
+        """Check nothing but whitespace follows the closing bracket at pos."""
+
+        self.consume(self.pos + 1)
+        if self.next_char():
+            raise InvalidDeckError(self.f.name, "Extra data after the topics")
+
+    def fill(self, size=None):
+        """Decode another chunk of the file onto the text.
+
+        Args:
+            size: The bytes to read, defaults to chunk_size.
+
+        Returns:
+            False if the end of the file has been reached.
+        """
+
+        if self.eof:
+            return False
+
+        data = self.f.read(size or self.chunk_size)
+        self.eof = not data
+        try:
+            self.text = self.text[self.pos :] + self.utf8.decode(data, final=self.eof)
+        except UnicodeDecodeError:
+            raise InvalidDeckError(
+                self.f.name, "Only UTF-8 decks can be streamed"
+            ) from None
+        self.pos = 0
+
+        return not self.eof
+
+    def next_char(self):
+        """Skip whitespace and get the next character, or "" at the end of file."""
+
+        while True:
+            end = WHITESPACE.match(self.text, self.pos).end()
+            # Whitespace is ASCII so takes one byte per character
+            self.offset += end - self.pos
+            self.pos = end
+            if self.pos < len(self.text) or not self.fill():
+                return self.text[self.pos : self.pos + 1]
+
+    def decode_topic(self):
+        """Parse the JSON value at pos, reading more until it is complete.
+
+        Each time the value is still cut short the text held is doubled, so a
+        topic is parsed a number of times that grows only with the log of its
+        size.
+
+        Returns:
+            The value and the index into text just past it.
+
+        Raises:
+            InvalidDeckError: The value is not valid JSON.
+        """
+
+        while True:
+            try:
+                return self.decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill(max(self.chunk_size, len(self.text) - self.pos)):
+                    raise InvalidDeckError(
+                        self.f.name, "Invalid or truncated topic"
+                    ) from None
+
+    def consume(self, end):
+        """Move past the text up to end, keeping offset in bytes."""
+
+        self.offset += len(self.text[self.pos : end].encode("utf-8"))
+        self.pos = end
+
+
+def scan_topics(f, chunk_size=SCAN_CHUNK_SIZE):
+    """Yield the TopicSpan of each topic in an open JSON topic file.
+
+    Args:
+        f: The JSON topic file, opened in binary mode.
+        chunk_size: The bytes read from f at a time.
+
+    Raises:
+        InvalidDeckError: The file is not a UTF-8 list of topics.
+    """
+
+    return iter(TopicScanner(f, chunk_size))
+
+
+def offsets_path(deck_path):
+    """Get the path of the offsets file of a deck.
+
+    The file is hidden so it is not listed as a deck.
+    """
+
+    deck_path = Path(deck_path)
+    return deck_path.with_name("." + deck_path.name + OFFSETS_SUFFIX)
+
+
+def save_offsets(path, spans, deck_size, deck_mtime_ns):
+    """Atomically write the topics scanned from a deck to an offsets file.
+
+    Args:
+        path: The path of the offsets file.
+        spans: The TopicSpan of each topic, in file order.
+        deck_size: The size of the deck file the topics were scanned from.
+        deck_mtime_ns: The modification time of the deck file.
+    """
+
+    table = array("q")
+    for span in spans:
+        table.extend((span.start, span.stop, span.count))
+    names = [span.name.encode("utf-8") for span in spans]
+    lengths = array("I", map(len, names))
+
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(
+            OFFSETS_HEADER.pack(
+                OFFSETS_MAGIC, OFFSETS_VERSION, deck_size, deck_mtime_ns, len(spans)
+            )
+        )
+        for column in (table, lengths):
+            if sys.byteorder != "little":
+                column.byteswap()
+            column.tofile(f)
+        f.write(b"".join(names))
+    os.replace(temp_path, path)
+
+
+def read_offsets_file(path):
+    """Read an offsets file.
+
+    Args:
+        path: The path of the offsets file.
+
+    Returns:
+        The size and modification time of the deck file the topics were
+            scanned from and a list of their TopicSpan, or None if there is no
+            valid offsets file.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < OFFSETS_HEADER.size:
+        logger.warning("Ignoring offsets file: %s", path)
+        return None
+    magic, version, deck_size, deck_mtime_ns, topic_count = OFFSETS_HEADER.unpack_from(
+        data
+    )
+    table_stop = OFFSETS_HEADER.size + 3 * 8 * topic_count
+    lengths_stop = table_stop + 4 * topic_count
+    if magic != OFFSETS_MAGIC or version != OFFSETS_VERSION or lengths_stop > len(data):
+        logger.warning("Ignoring offsets file: %s", path)
+        return None
+
+    table = array("q", data[OFFSETS_HEADER.size : table_stop])
+    lengths = array("I", data[table_stop:lengths_stop])
+    if sys.byteorder != "little":
+        table.byteswap()
+        lengths.byteswap()
+    if lengths_stop + sum(lengths) != len(data):
+        logger.warning("Ignoring offsets file: %s", path)
+        return None
+
+    spans = []
+    offset = lengths_stop
+    for t, length in enumerate(lengths):
+        name = str(data[offset : offset + length], "utf-8")
+        spans.append(TopicSpan(name, table[3 * t], table[3 * t + 1], table[3 * t + 2]))
+        offset += length
+
+    return deck_size, deck_mtime_ns, spans
+
+
+def load_spans(fname):
+    """Get the topics of a JSON topic file, scanning it only if it has changed.
+
+    The topics are read from the offsets file next to the deck while the deck
+    is unchanged. Otherwise the deck is scanned and the offsets file saved.
+
+    Args:
+        fname: The path of the JSON topic file.
+
+    Returns:
+        A list of the TopicSpan of each topic, in file order.
+
+    Raises:
+        InvalidDeckError: The file is not a UTF-8 list of topics.
+    """
+
+    file_path = offsets_path(fname)
+    stored = read_offsets_file(file_path)
+    with open(fname, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stored is not None and stored[:2] == (stat.st_size, stat.st_mtime_ns):
+            return stored[2]
+
+        spans = list(scan_topics(f))
+
+    try:
+        save_offsets(file_path, spans, stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        logger.warning("Could not save offsets file: %s", file_path)
+
+    return spans
+
+
+def budget_bytes():
+    """Get the bytes of prompts a budgeted deck may keep in memory.
+
+    Returns:
+        The number from FLASHCARDS_DECK_BUDGET, or DEFAULT_BUDGET_BYTES if it is
+            not set or not a number.
+    """
+
+    value = os.environ.get(DECK_BUDGET_ENV)
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning("Ignoring %s, not a number of bytes", DECK_BUDGET_ENV)
+
+    return DEFAULT_BUDGET_BYTES
+
+
+class TopicReader:
+    """Reads the prompts of single topics from their byte ranges in a file.
+
+    Attributes:
+        fpath
+        topic_spans
+        topic_index
+    """
+
+    def __init__(self, fpath, topic_spans, topic_index):
+        """Initialise a reader for the topics of a scanned file.
+
+        Args:
+            fpath: The path of the JSON topic file.
+            topic_spans: A dict keyed by topic name with a list of the
+                (start, stop) byte range of each topic object with that name.
+            topic_index: The (start, stop) card range of each topic.
+        """
+
+        self.fpath = fpath
+        self.topic_spans = topic_spans
+        self.topic_index = topic_index
+        self.names = list(topic_index)
+        self.card_starts = array("l", (start for start, stop in topic_index.values()))
+
+    def read_topic(self, topic):
+        """Get the (prompt, answer) pair of each card of a topic, in card order."""
+
+        loads = json_parser()[1]
+        pairs = []
+        with open(self.fpath, "rb") as f:
+            for start, stop in self.topic_spans[topic]:
+                f.seek(start)
+                data = f.read(stop - start)
+                for prompt in parse_json_bytes(data, loads)["prompts"]:
+                    # Not interned like a fully read deck, so the strings are
+                    # freed when the topic is released
+                    pairs.append(
+                        (str(prompt.get("prompt", "")), str(prompt.get("answer", "")))
+                    )
+
+        return pairs
+
+    def topic_of_card(self, card):
+        """Get the name of the topic a card belongs to."""
+
+        # Empty topics share their start with the next topic, bisect_right skips
+        # past them to the topic holding the card
+        return self.names[bisect_right(self.card_starts, card) - 1]
+
+
+def topic_bytes(pairs):
+    """Estimate the bytes of memory used by the prompts of a topic."""
+
+    size = sys.getsizeof(pairs)
+    for pair in pairs:
+        size += sys.getsizeof(pair) + sum(map(sys.getsizeof, pair))
+
+    return size
+
+
+class TopicCache:
+    """A least recently used cache of the prompts of topics with a memory limit.
+
+    Topics are dropped once the cache holds more than max_bytes. Unchosen
+    topics are dropped first, least recently used first, then chosen topics
+    the same way. The most recently used topic is always kept, so a topic
+    bigger than the whole budget can still be read.
+
+    May be used from any thread.
+
+    Attributes:
+        max_bytes
+        resident_bytes
+        peak_bytes
+        hits
+        misses
+        evictions
+    """
+
+    def __init__(self, reader, max_bytes=0, is_chosen=None):
+        """Initialise an empty cache.
+
+        Args:
+            reader: The TopicReader of the deck.
+            max_bytes: The estimated memory the cached prompts may use. 0 keeps
+                only the most recently used topic.
+            is_chosen: A function taking a topic name that returns True if the
+                topic is chosen, or None to treat every topic the same.
+        """
+
+        self.reader = reader
+        self.max_bytes = max_bytes
+        self.is_chosen = is_chosen
+        self.resident_bytes = 0
+        self.peak_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Maps a topic name to its (pairs, size), oldest first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def topic(self, topic, store=True):
+        """Get the (prompt, answer) pair of each card of a topic.
+
+        Args:
+            topic: The name of a topic from the deck.
+            store: False to not add the topic to the cache if it is read, such
+                as when every topic is read in turn.
+        """
+
+        with self.lock:
+            entry = self.entries.get(topic)
+            if entry is not None:
+                self.entries.move_to_end(topic)
+                self.hits += 1
+                metrics.count("deck_budget.hits")
+                return entry[0]
+
+        # Read outside the lock so cached topics can be used in the meantime
+        pairs = self.reader.read_topic(topic)
+        if not store:
+            return pairs
+
+        size = topic_bytes(pairs)
+        with self.lock:
+            self.misses += 1
+            metrics.count("deck_budget.misses")
+            self.discard(topic)
+            self.entries[topic] = (pairs, size)
+            self.resident_bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.resident_bytes)
+            self.evict()
+            metrics.gauge("deck_budget.resident_bytes", self.resident_bytes)
+
+        return pairs
+
+    def card(self, card):
+        """Get the (prompt, answer) pair of a card."""
+
+        topic = self.reader.topic_of_card(card)
+        return self.topic(topic)[card - self.reader.topic_index[topic][0]]
+
+    def hit_rate(self):
+        """Get the share of topic lookups found in the cache, 0.0 before any."""
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def discard(self, topic):
+        """Drop a topic from the cache, if it is there."""
+
+        entry = self.entries.pop(topic, None)
+        if entry is not None:
+            self.resident_bytes -= entry[1]
+
+    def evict(self):
+        """Drop topics until the memory limit is met, unchosen topics first."""
+
+        if self.resident_bytes <= self.max_bytes:
+            return
+
+        newest = next(reversed(self.entries))
+        for drop_chosen in (False, True):
+            for topic in list(self.entries):
+                if self.resident_bytes <= self.max_bytes:
+                    return
+                if topic == newest:
+                    continue
+                if not drop_chosen and self.is_chosen and self.is_chosen(topic):
+                    continue
+                self.discard(topic)
+                self.evictions += 1
+                metrics.count("deck_budget.evictions")
+
+    def clear(self):
+        """Drop every cached topic."""
+
+        with self.lock:
+            self.entries.clear()
+            self.resident_bytes = 0
+
+
+class StreamedColumn(LazyColumn):
+    """A column of a JSON file, reading unloaded cards through a TopicCache."""
+
+    def __init__(self, cache, field, length):
+        """Initialise an empty column over a scanned file.
+
+        Args:
+            cache: The TopicCache of the deck.
+            field: 0 for the prompt column and 1 for the answer column.
+            length: The number of cards in the deck.
+        """
+
+        super().__init__(length)
+        self.cache = cache
+        self.field = field
+
+    def fetch(self, card):
+        """Overrides LazyColumn to read the card's topic through the cache."""
+
+        return self.cache.card(card)[self.field]
+
+
+class StreamingTopicHandler(LazyTopicHandler):
+    """A JSON topic file read one topic at a time.
+
+    Opening the deck scans the file once for the byte range of each topic,
+    without parsing the prompts. A chosen topic is parsed from its byte range,
+    and a card of any other topic is read through the cache when it is
+    indexed.
+
+    Attributes:
+        topic_spans
+        reader
+        cache
+    """
+
+    @classmethod
+    def get_js(cls, fname):
+        """Overrides JSONHandler to find the topics instead of parsing the file."""
+
+        return load_spans(fname)
+
+    def build_columns(self):
+        """Overrides JSONTopicHandler to number the cards of the scanned topics.
+
+        Topics with the same name are joined into one range of cards, as a
+        fully read deck does.
+
+        Returns:
+            A dict keyed by topic name with the (start, stop) range of that
+                topic's cards as the value.
+        """
+
+        self.topic_spans = {}
+        counts = {}
+        for span in self.raw_string:
+            self.topic_spans.setdefault(span.name, []).append((span.start, span.stop))
+            counts[span.name] = counts.get(span.name, 0) + span.count
+
+        topic_index = {}
+        card_count = 0
+        for name, count in counts.items():
+            topic_index[name] = (card_count, card_count + count)
+            card_count += count
+
+        self.reader = TopicReader(self.fpath, self.topic_spans, topic_index)
+        self.new_columns(card_count)
+
+        return topic_index
+
+    def new_columns(self, card_count):
+        """Overrides LazyTopicHandler to also give the handler its own cache."""
+
+        self.cache = self.new_cache()
+        self.prompt_column = StreamedColumn(self.cache, 0, card_count)
+        self.answer_column = StreamedColumn(self.cache, 1, card_count)
+
+    def new_cache(self):
+        """Get a cache for the cards of unchosen topics.
+
+        Only the most recent topic is kept, so reading the cards of one topic
+        in turn only reads the file once.
+        """
+
+        return TopicCache(self.reader)
+
+    def resident_bytes(self):
+        """Extends LazyTopicHandler to count the topic byte ranges and the cache."""
+
+        size = super().resident_bytes() + sys.getsizeof(self.topic_spans)
+        for spans in self.topic_spans.values():
+            size += sys.getsizeof(spans) + sum(map(sys.getsizeof, spans))
+
+        return size + self.cache.resident_bytes
+
+    def load_cards(self, topic, cards=None):
+        """Overrides LazyTopicHandler to parse the topic from its byte range.
+
+        Args:
+            topic: The name of a topic from the file.
+            cards: The cards of the topic to load, or None to load every card.
+        """
+
+        start, stop = self.topic_index[topic]
+        pairs = self.cache.topic(topic)
+        for card in range(start, stop) if cards is None else cards:
+            prompt, answer = pairs[card - start]
+            self.prompt_column.cards[card] = prompt
+            self.answer_column.cards[card] = answer
+
+    def topic_prompts(self, topic):
+        """Overrides JSONTopicHandler to read the topic from the file once.
+
+        Topics that are not cached are read without being cached, so reading
+        every topic in turn doesn't push out the cached ones.
+
+        Args:
+            topic: The name of a topic from the file.
+        """
+
+        start = self.topic_index[topic][0]
+        pairs = self.cache.topic(topic, store=False)
+        for card, (prompt, answer) in enumerate(pairs, start):
+            yield card, prompt, answer
+
+
+class BudgetedTopicHandler(StreamingTopicHandler):
+    """A JSON topic file with the prompts it holds kept under a memory budget.
+
+    Only the topic names and byte ranges are kept for the whole deck. No
+    prompts are loaded when topics are chosen, every card is read through a
+    TopicCache of max_bytes when it is indexed, so a deck many times bigger
+    than the budget can be run through.
+
+    Attributes:
+        max_bytes
+    """
+
+    # None reads the budget from the environment when the deck is opened
+    max_bytes = None
+
+    def new_cache(self):
+        """Overrides StreamingTopicHandler to cache topics up to the budget."""
+
+        if self.max_bytes is None:
+            self.max_bytes = budget_bytes()
+
+        return TopicCache(self.reader, self.max_bytes, self.topic_is_selected)
+
+    def load_cards(self, topic, cards=None):
+        """Overrides StreamingTopicHandler as cards are read when they are indexed.
+
+        Args:
+            topic: The name of a topic from the file.
+            cards: Unused, every card of the topic is left to the cache.
+        """
+
+        logger.debug("Prompts of %s are read when shown", topic)